@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Heatmap Benchmarks - Reproducible timings for the orchestrator and API hot paths.
+
+Run ``python benchmark_heatmap.py --output results.json`` to time every
+benchmark across the default point counts, and add
+``--baseline previous.json`` to exit non-zero when a median regresses by
+more than ``--max-regression``. Redis is replaced by an in-process
+stand-in so numbers do not depend on the network.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from heatmap_orchestrator import HeatmapConfig, HeatmapOrchestrator, LocationColumns, RateLimiter, ScoreItemsStep
+
+DEFAULT_SIZES = (10, 1_000, 100_000, 1_000_000)
+
+# JSON request bodies beyond this many points measure pydantic, not the API
+API_MAX_POINTS = 100_000
+
+CATEGORIES = ("urban", "commercial", "residential", None)
+
+SEED = 42
+
+
+class InMemoryRedis:
+    """The subset of the redis-py client PersistStep uses, backed by a dict (TTLs are ignored)."""
+
+    def __init__(self):
+        self.data: Dict[str, bytes] = {}
+        self.lock = threading.Lock()
+
+    def ping(self) -> bool:
+        return True
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.data.get(key)
+
+    def set(self, key: str, value: Any, keepttl: bool = False, nx: bool = False,
+            px: Optional[int] = None) -> Optional[bool]:
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value.encode() if isinstance(value, str) else value
+            return True
+
+    def setex(self, key: str, ttl: int, value: bytes) -> bool:
+        self.data[key] = value
+        return True
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction: bool = True) -> "InMemoryRedis":
+        # Commands apply immediately, so the client doubles as its own pipeline
+        return self
+
+    def execute(self) -> List[Any]:
+        return []
+
+    def delete(self, key: str) -> int:
+        return int(self.data.pop(key, None) is not None)
+
+    def eval(self, script: str, numkeys: int, *keys_and_args: str) -> int:
+        # Only the lease release script is ever evaluated
+        key, token = keys_and_args
+        with self.lock:
+            if self.data.get(key) != token.encode():
+                return 0
+            del self.data[key]
+            return 1
+
+    def incr(self, key: str) -> int:
+        with self.lock:
+            value = int(self.data.get(key, 0)) + 1
+            self.data[key] = str(value).encode()
+            return value
+
+
+def make_points(n: int, seed: int = SEED) -> LocationColumns:
+    """Deterministic point set around New York with a mix of categories."""
+    rng = np.random.default_rng(seed)
+    return LocationColumns.from_columns(
+        rng.normal(40.73, 0.05, n),
+        rng.normal(-73.98, 0.05, n),
+        rng.uniform(0.0, 100.0, n),
+        [CATEGORIES[i] for i in rng.integers(0, len(CATEGORIES), n)]
+    )
+
+
+def make_orchestrator() -> HeatmapOrchestrator:
+    """Orchestrator on the in-memory Redis stand-in."""
+    orchestrator = HeatmapOrchestrator(HeatmapConfig(), grid_workers=0)
+    orchestrator.persister.redis_client = InMemoryRedis()
+    orchestrator.persister.breaker.run_probe()
+    return orchestrator
+
+
+def measure(fn: Callable[[], Any], setup: Optional[Callable[[], None]] = None,
+            min_time: float = 0.5, min_runs: int = 3, max_runs: int = 1000) -> Dict[str, float]:
+    """Time fn repeatedly until min_time has elapsed; setup runs untimed before each call."""
+    samples: List[float] = []
+    started = time.perf_counter()
+    while len(samples) < min_runs or (time.perf_counter() - started < min_time and len(samples) < max_runs):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    ordered = sorted(samples)
+    return {
+        "runs": len(samples),
+        "min_s": ordered[0],
+        "median_s": statistics.median(ordered),
+        "mean_s": statistics.fmean(ordered),
+        "p95_s": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "stdev_s": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+    }
+
+
+# Each benchmark takes a point count (None for size-independent ones) and
+# returns (fn, setup, work_units) where work_units feeds the throughput column.
+Benchmark = Callable[[Optional[int]], Tuple[Callable[[], Any], Optional[Callable[[], None]], int]]
+
+
+def bench_generate_cold(n: int):
+    orchestrator = make_orchestrator()
+    points = make_points(n)
+    config = replace(orchestrator.config, cache_enabled=False)
+    return lambda: orchestrator.generate_heatmap(points, "bench", config), None, n
+
+
+def bench_generate_cached(n: int):
+    orchestrator = make_orchestrator()
+    points = make_points(n)
+    orchestrator.generate_heatmap(points, "bench")
+    return lambda: orchestrator.generate_heatmap(points, "bench"), None, n
+
+
+def bench_score_batch(n: int):
+    scorer = ScoreItemsStep()
+    points = make_points(n)
+    return lambda: scorer.score_batch(points), None, n
+
+
+def bench_persist_round_trip(n: int):
+    """Write and read back a stored point set through the codec and the Redis stand-in, bypassing L1."""
+    orchestrator = make_orchestrator()
+    persister = orchestrator.persister
+    points = make_points(n)
+    payload = {"latitude": points.latitude, "longitude": points.longitude, "value": points.value,
+               "weight": ScoreItemsStep().score_batch(points)}
+
+    def round_trip():
+        persister.cache_result("bench_points", payload)
+        persister.memory_cache.clear()
+        persister.get_cached("bench_points")
+
+    return round_trip, None, n
+
+
+def bench_rate_limiter_contention(_: Optional[int], threads: int = 8, calls: int = 5_000):
+    """Many threads checking a handful of shared keys at once."""
+    def run():
+        limiter = RateLimiter(max_calls=sys.maxsize)
+
+        def worker(index: int):
+            key = f"customer_{index % 4}"
+            for _ in range(calls):
+                limiter.check_limit(key)
+
+        pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+
+    return run, None, threads * calls
+
+
+def bench_api_generate(n: int):
+    """POST /api/v1/generate-heatmap end to end through the in-process ASGI client, cache cold."""
+    if n > API_MAX_POINTS:
+        return None
+    import main
+    from fastapi.testclient import TestClient
+
+    if main.orchestrator is None:
+        main.start_services()
+    main.orchestrator.persister.redis_client = InMemoryRedis()
+    main.orchestrator.persister.breaker.run_probe()
+    main.app.dependency_overrides[main.enforce_rate_limit] = lambda: None
+    client = TestClient(main.app)
+    points = make_points(n)
+    codes = points.category_codes
+    body = json.dumps({
+        "location_id": "bench_api",
+        "locations": [
+            {"latitude": la, "longitude": lo, "value": v, "category": points.categories[c] if c >= 0 else None}
+            for la, lo, v, c in zip(points.latitude.tolist(), points.longitude.tolist(),
+                                    points.value.tolist(), codes.tolist())
+        ]
+    })
+    headers = {"Content-Type": "application/json", "Accept-Encoding": "identity"}
+
+    def request():
+        response = client.post("/api/v1/generate-heatmap", content=body, headers=headers)
+        response.raise_for_status()
+
+    return request, lambda: main.orchestrator.invalidate_location("bench_api"), n
+
+
+BENCHMARKS: Dict[str, Tuple[Benchmark, bool]] = {
+    # name: (factory, takes a point count)
+    "generate_heatmap_cold": (bench_generate_cold, True),
+    "generate_heatmap_cached": (bench_generate_cached, True),
+    "score_batch": (bench_score_batch, True),
+    "persist_round_trip": (bench_persist_round_trip, True),
+    "rate_limiter_contention": (bench_rate_limiter_contention, False),
+    "api_generate_heatmap": (bench_api_generate, True),
+}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes: Iterable[int] = DEFAULT_SIZES, names: Optional[Iterable[str]] = None,
+                   min_time: float = 0.5) -> Dict[str, Any]:
+    """Run the selected benchmarks and return a JSON-serializable report."""
+    results = []
+    for name in names or BENCHMARKS:
+        factory, sized = BENCHMARKS[name]
+        for size in (sizes if sized else [None]):
+            prepared = factory(size)
+            if prepared is None:
+                continue
+            fn, setup, units = prepared
+            fn()  # warm-up: lazy imports, first allocations
+            stats = measure(fn, setup, min_time=min_time)
+            stats["throughput_per_s"] = units / stats["median_s"] if stats["median_s"] else None
+            results.append({"benchmark": name, "size": size, **stats})
+            print(f"{name:<26} {str(size or '-'):>9} median {stats['median_s'] * 1000:10.3f} ms"
+                  f"  p95 {stats['p95_s'] * 1000:10.3f} ms  runs {stats['runs']}", file=sys.stderr)
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "min_time": min_time,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[Dict[str, Any]]:
+    """Benchmarks whose median grew by more than max_regression (0.2 = 20%) over the baseline."""
+    previous = {(r["benchmark"], r["size"]): r["median_s"] for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get((result["benchmark"], result["size"]))
+        if before and result["median_s"] > before * (1 + max_regression):
+            regressions.append({
+                "benchmark": result["benchmark"],
+                "size": result["size"],
+                "baseline_s": before,
+                "current_s": result["median_s"],
+                "change": result["median_s"] / before - 1,
+            })
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma-separated point counts")
+    parser.add_argument("--only", default="", help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend per benchmark and size")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare medians against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed median slowdown versus the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    # One line per request from the test client would drown the timings
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    names = [name for name in args.only.split(",") if name] or None
+    unknown = set(names or ()) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    report = run_benchmarks([int(s) for s in args.sizes.split(",") if s], names, args.min_time)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.max_regression)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for regression in report.get("regressions", []):
+        print(f"REGRESSION {regression['benchmark']} size={regression['size']}: "
+              f"{regression['change']:+.0%}", file=sys.stderr)
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""Shared pytest fixtures: small in-memory orchestrators and an API client."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from heatmap_jobs import celery_app
+from heatmap_orchestrator import HeatmapConfig, HeatmapOrchestrator
+
+
+@pytest.fixture
+def make_orchestrator():
+    """Factory for Redis-less orchestrators on a small grid, shut down after the test."""
+    created = []
+
+    def _make(**config):
+        orchestrator = HeatmapOrchestrator(HeatmapConfig(**{"grid_resolution": 16, "blur_radius": 2, **config}))
+        orchestrator.persister.redis_client = None
+        created.append(orchestrator)
+        return orchestrator
+
+    yield _make
+    for orchestrator in created:
+        orchestrator.shutdown()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """TestClient running the app's lifespan, with Redis disabled and jobs run in-process."""
+    import main
+
+    monkeypatch.setitem(celery_app.conf, "task_always_eager", True)
+    monkeypatch.setenv("HEATMAP_GRID_WORKERS", "1")
+    with TestClient(main.app) as test_client:
+        main.orchestrator.persister.redis_client = None
+        main.customer_limiter.redis_client = None
+        yield test_client
@@ -15,6 +15,7 @@ import os
 import logging
 from typing import Optional
 import httpx
+from pricing import PRICE_TIERS
 
 logger = logging.getLogger(__name__)
 
@@ -24,13 +25,6 @@ STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 
 app = FastAPI(title="Heatmap Onboarding API")
 
-# Price tiers
-PRICE_TIERS = {
-    'starter': {'price': 9, 'currency': 'USD', 'requests_month': 100},
-    'growth': {'price': 49, 'currency': 'USD', 'requests_month': 1000},
-    'enterprise': {'price': 99, 'currency': 'USD', 'requests_month': 10000}
-}
-
 
 class CustomerProfile(BaseModel):
     """Customer onboarding data model."""
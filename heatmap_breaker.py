@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Circuit Breaker - Stop calling a failing dependency and reconnect to it in the background."""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Numeric form of the states for gauges
+STATE_CODES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker around calls to one dependency.
+
+    ``failure_threshold`` consecutive failures open the circuit, after which
+    ``allow`` answers False at once so callers take their fallback instead of
+    waiting on timeouts. When ``reset_timeout`` has passed, the next ``allow``
+    starts a single ``probe`` on a background thread: success closes the
+    circuit, failure reopens it and doubles the wait up to ``max_reset_timeout``.
+    Requests never wait for a probe.
+    """
+
+    def __init__(self, probe: Callable[[], object], failure_threshold: int = 3,
+                 reset_timeout: float = 1.0, max_reset_timeout: float = 30.0,
+                 name: str = "redis", clock: Callable[[], float] = time.monotonic):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.name = name
+        self._clock = clock
+        self.state = CLOSED
+        self._failures = 0
+        self._delay = reset_timeout
+        self._retry_at = 0.0
+        self.trips = 0
+        self.short_circuited = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go to the dependency now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            self.short_circuited += 1
+            if self.state != OPEN or self._clock() < self._retry_at:
+                return False
+            self.state = HALF_OPEN
+        threading.Thread(target=self.run_probe, name=f"{self.name}-probe", daemon=True).start()
+        return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == CLOSED and self._failures >= self.failure_threshold:
+                self._open()
+
+    def trip(self) -> None:
+        """Open the circuit immediately, e.g. when the dependency is down at startup."""
+        with self._lock:
+            if self.state == CLOSED:
+                self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.trips += 1
+        self._delay = self.reset_timeout
+        self._retry_at = self._clock() + self._delay
+        logger.warning(f"Circuit {self.name} opened; retrying in {self._delay:.1f}s")
+
+    def run_probe(self) -> bool:
+        """Check the dependency once and close or reopen the circuit accordingly."""
+        try:
+            healthy = bool(self.probe())
+        except Exception as e:
+            logger.debug(f"Circuit {self.name} probe failed: {e}")
+            healthy = False
+        with self._lock:
+            if healthy:
+                self.state = CLOSED
+                self._failures = 0
+                logger.info(f"Circuit {self.name} closed; dependency reachable again")
+            else:
+                self.state = OPEN
+                self._delay = min(self._delay * 2, self.max_reset_timeout)
+                self._retry_at = self._clock() + self._delay
+        return healthy
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"state": self.state, "trips": self.trips, "short_circuited": self.short_circuited}
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Heatmap Codecs - Versioned binary serialization for cached heatmap results.
+
+Every payload starts with a small header::
+
+    format version (1 byte) | codec id (1 byte) | compression id (1 byte) | raw size (uint32 LE)
+
+NumPy arrays travel as raw little-endian buffers inside msgpack ext frames, so
+decoding a grid is one ``np.frombuffer`` instead of one Python float per cell.
+Payloads without a recognised header are pre-codec JSON entries.
+"""
+
+import json
+import struct
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import msgpack
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # optional
+    lz4 = None
+
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<BBBI")
+
+# Payloads smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+NDARRAY_EXT = 1
+
+
+class Codec:
+    """Turns cacheable values into bytes and back."""
+    codec_id = 0
+    name = "base"
+
+    def encode(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, body: bytes) -> Any:
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    """Plain JSON; arrays become nested lists."""
+    codec_id = 1
+    name = "json"
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, default=_json_default, separators=(",", ":")).encode()
+
+    def decode(self, body: bytes) -> Any:
+        return json.loads(body)
+
+
+class MsgpackCodec(Codec):
+    """msgpack with NumPy arrays packed as raw buffers."""
+    codec_id = 2
+    name = "msgpack"
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+
+    def decode(self, body: bytes) -> Any:
+        return msgpack.unpackb(body, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        dtype = array.dtype.newbyteorder("<") if array.dtype.byteorder == ">" else array.dtype
+        meta = msgpack.packb([dtype.str, list(array.shape)])
+        data = array.astype(dtype, copy=False).tobytes()
+        return msgpack.ExtType(NDARRAY_EXT, struct.pack("<H", len(meta)) + meta + data)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not msgpack serializable")
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    if code != NDARRAY_EXT:
+        return msgpack.ExtType(code, data)
+    (meta_len,) = struct.unpack_from("<H", data)
+    dtype, shape = msgpack.unpackb(data[2:2 + meta_len])
+    return np.frombuffer(data, dtype=np.dtype(dtype), offset=2 + meta_len).reshape(shape)
+
+
+CODECS: Dict[int, Codec] = {}
+CODECS_BY_NAME: Dict[str, Codec] = {}
+
+# compression id -> (name, compress, decompress(body, raw_size))
+COMPRESSORS: Dict[int, Tuple[str, Callable[[bytes], bytes], Callable[[bytes, int], bytes]]] = {
+    0: ("none", lambda body: body, lambda body, size: body),
+    1: ("zlib", lambda body: zlib.compress(body, 1), lambda body, size: zlib.decompress(body)),
+}
+if zstandard is not None:
+    COMPRESSORS[2] = (
+        "zstd",
+        lambda body: zstandard.ZstdCompressor(level=3).compress(body),
+        lambda body, size: zstandard.ZstdDecompressor().decompress(body, max_output_size=size),
+    )
+if lz4 is not None:
+    COMPRESSORS[3] = ("lz4", lz4.frame.compress, lambda body, size: lz4.frame.decompress(body))
+
+COMPRESSION_IDS = {name: cid for cid, (name, _, _) in COMPRESSORS.items()}
+
+
+def register_codec(codec: Codec) -> None:
+    """Make a codec available for encoding by name and for decoding by id."""
+    CODECS[codec.codec_id] = codec
+    CODECS_BY_NAME[codec.name] = codec
+
+
+register_codec(JSONCodec())
+register_codec(MsgpackCodec())
+
+
+def best_compression() -> str:
+    """Fastest available compressor: lz4, then zstd, then zlib."""
+    for name in ("lz4", "zstd", "zlib"):
+        if name in COMPRESSION_IDS:
+            return name
+    return "none"
+
+
+def encode(value: Any, codec: str = "msgpack", compression: Optional[str] = None) -> bytes:
+    """Serialize value into a versioned payload."""
+    body = CODECS_BY_NAME[codec].encode(value)
+    compression_id = 0
+    if compression and compression != "none" and len(body) >= MIN_COMPRESS_BYTES:
+        compression_id = COMPRESSION_IDS[compression]
+    compressed = COMPRESSORS[compression_id][1](body) if compression_id else body
+    return HEADER.pack(FORMAT_VERSION, CODECS_BY_NAME[codec].codec_id, compression_id, len(body)) + compressed
+
+
+def is_current(payload: bytes) -> bool:
+    """Whether payload was written by the current format version."""
+    return len(payload) >= HEADER.size and payload[0] == FORMAT_VERSION
+
+
+def decoded_size(payload: bytes) -> int:
+    """Uncompressed body size recorded in the header (payload length for legacy JSON)."""
+    if is_current(payload):
+        return HEADER.unpack_from(payload)[3]
+    return len(payload)
+
+
+def decode(payload: bytes) -> Any:
+    """Deserialize a payload written by ``encode`` or a legacy JSON string."""
+    if not is_current(payload):
+        return json.loads(payload)
+    _, codec_id, compression_id, size = HEADER.unpack_from(payload)
+    body = payload[HEADER.size:]
+    if compression_id:
+        body = COMPRESSORS[compression_id][2](body, size)
+    return CODECS[codec_id].decode(body)
+
+
+def to_jsonable(value: Any, precision: int = 4) -> Any:
+    """Convert arrays inside a decoded result into JSON-ready lists."""
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == "f":
+            return np.round(value.astype(np.float64), precision).tolist()
+        return value.tolist()
+    if isinstance(value, dict):
+        return {k: to_jsonable(v, precision) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v, precision) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
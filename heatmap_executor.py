@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Generation Executor - Run blocking heatmap work off the asyncio event loop with admission control."""
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when the executor already holds its maximum number of jobs."""
+
+
+class GenerationExecutor:
+    """Dedicated thread pool with a bounded backlog.
+
+    At most ``max_concurrency`` jobs run at once and at most ``max_queue`` more
+    wait; anything beyond that is rejected immediately so callers can answer
+    with 429/503 instead of queueing unbounded latency. A job holds its slot
+    until its thread finishes, even if the awaiting request was cancelled.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 64):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="heatmap-gen")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.draining = False
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run fn in the pool, or raise QueueFullError if the backlog is full or the executor is draining."""
+        with self._lock:
+            if self.draining:
+                self.rejected += 1
+                raise QueueFullError("shutting down")
+            if self._pending >= self.max_concurrency + self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(f"{self._pending} heatmap jobs already in flight")
+            self._pending += 1
+        # Carry the caller's context so per-request state such as stage timings follows the job
+        context = contextvars.copy_context()
+        try:
+            future = self._executor.submit(functools.partial(context.run, fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # Released when the thread is done, not when the caller stops waiting
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future: Optional[Future] = None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """Current load and rejection count."""
+        return {
+            "pending": self._pending,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+    async def drain(self, timeout: float) -> bool:
+        """Refuse new jobs and wait up to timeout seconds for accepted ones; True if all finished."""
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return not self._pending
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting work, letting running jobs finish when wait is set."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""Density Grid Engine - Rasterize weighted points into blurred intensity grids."""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from scipy import ndimage, signal
+
+# Kernel radius (in cells) above which FFT convolution beats separable passes
+FFT_RADIUS_THRESHOLD = 48
+
+# Gaussian sigma is derived so the kernel is truncated at three sigma
+KERNEL_TRUNCATE = 3.0
+
+# (south, west, north, east) in degrees
+Bounds = Tuple[float, float, float, float]
+
+
+@dataclass
+class DensityGrid:
+    """Blurred intensity raster covering a lat/lon bounding box."""
+    intensity: np.ndarray
+    bounds: Bounds
+
+    @property
+    def height(self) -> int:
+        return int(self.intensity.shape[0])
+
+    @property
+    def width(self) -> int:
+        return int(self.intensity.shape[1])
+
+    @property
+    def max_intensity(self) -> float:
+        return float(self.intensity.max()) if self.intensity.size else 0.0
+
+    def normalized(self, peak: Optional[float] = None) -> np.ndarray:
+        """Return intensities scaled into [0, 1], against ``peak`` (clipped) instead of the own maximum if given."""
+        if peak is None:
+            peak = self.max_intensity
+        if peak <= 0:
+            return np.zeros_like(self.intensity)
+        return np.minimum(self.intensity / peak, 1.0)
+
+    def to_dict(self, peak: Optional[float] = None) -> Dict[str, Any]:
+        """Serialize the grid with float32 intensities normalized as by ``normalized``."""
+        south, west, north, east = self.bounds
+        return {
+            "width": self.width,
+            "height": self.height,
+            "bounds": {"south": south, "west": west, "north": north, "east": east},
+            "max_intensity": self.max_intensity,
+            "intensity": self.normalized(peak).astype(np.float32),
+        }
+
+
+def compute_bounds(latitudes: np.ndarray, longitudes: np.ndarray,
+                   resolution: int, padding_cells: int) -> Bounds:
+    """Bounding box of the points, padded so kernels are not clipped at the edges."""
+    padding_cells = max(1, min(padding_cells, resolution // 4))
+    inner_cells = max(resolution - 2 * padding_cells, 1)
+
+    def _axis(values: np.ndarray) -> Tuple[float, float]:
+        low, high = float(values.min()), float(values.max())
+        span = max(high - low, 1e-6)
+        cell = span / inner_cells
+        return low - padding_cells * cell, high + padding_cells * cell
+
+    south, north = _axis(latitudes)
+    west, east = _axis(longitudes)
+    return south, west, north, east
+
+
+def cell_index(latitudes: np.ndarray, longitudes: np.ndarray, bounds: Bounds,
+               width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Flat cell index of every point plus the mask of points inside the bounds.
+
+    Cells are half-open so adjacent grids sharing an edge never count a point
+    twice; row 0 is the northern edge. Indices of outside points are clipped
+    to the border and should be dropped with the mask.
+    """
+    south, west, north, east = bounds
+    inside = (
+        (latitudes > south) & (latitudes <= north)
+        & (longitudes >= west) & (longitudes < east)
+    )
+    rows = ((north - latitudes) / (north - south) * height).astype(np.intp)
+    cols = ((longitudes - west) / (east - west) * width).astype(np.intp)
+    np.clip(rows, 0, height - 1, out=rows)
+    np.clip(cols, 0, width - 1, out=cols)
+    return rows * width + cols, inside
+
+
+def rasterize(latitudes: np.ndarray, longitudes: np.ndarray, weights: np.ndarray,
+              bounds: Bounds, width: int, height: int) -> np.ndarray:
+    """Bin weighted points into a (height, width) grid; row 0 is the northern edge."""
+    flat, inside = cell_index(latitudes, longitudes, bounds, width, height)
+    if not inside.all():
+        flat, weights = flat[inside], weights[inside]
+    return np.bincount(flat, weights=weights, minlength=width * height).reshape(height, width)
+
+
+def gaussian_kernel_1d(radius: int) -> np.ndarray:
+    """Normalized 1-D Gaussian kernel spanning ``2 * radius + 1`` taps."""
+    sigma = max(radius / KERNEL_TRUNCATE, 1e-3)
+    offsets = np.arange(-radius, radius + 1, dtype=np.float64)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    return kernel / kernel.sum()
+
+
+def blur(grid: np.ndarray, radius: int, method: str = "auto") -> np.ndarray:
+    """Apply a Gaussian kernel of the given radius (in cells) to the grid.
+
+    ``method`` is ``"separable"`` (two 1-D passes, O(cells * radius)),
+    ``"fft"`` (O(cells * log cells)) or ``"auto"`` to pick by radius.
+    """
+    if radius <= 0:
+        return grid.astype(np.float64, copy=True)
+    if method == "auto":
+        method = "fft" if radius > FFT_RADIUS_THRESHOLD else "separable"
+
+    kernel = gaussian_kernel_1d(radius)
+    if method == "separable":
+        out = ndimage.convolve1d(grid, kernel, axis=0, mode="constant")
+        return ndimage.convolve1d(out, kernel, axis=1, mode="constant")
+    if method == "fft":
+        out = signal.fftconvolve(grid, np.outer(kernel, kernel), mode="same")
+        # FFT round-off can leave tiny negative values in empty regions
+        return np.clip(out, 0.0, None)
+    raise ValueError(f"Unknown blur method: {method}")
+
+
+def splat(target: np.ndarray, delta: np.ndarray, radius: int) -> None:
+    """Add the blurred contribution of a sparse raw raster to ``target`` in place.
+
+    Equivalent to ``target += blur(delta, radius)``, but stamps one kernel per
+    occupied cell when that is cheaper than convolving the whole grid.
+    """
+    if radius <= 0:
+        target += delta
+        return
+    rows, cols = np.nonzero(delta)
+    taps = 2 * radius + 1
+    if rows.size * taps * taps > delta.size * taps * 2:
+        target += blur(delta, radius)
+        return
+
+    height, width = delta.shape
+    kernel = np.outer(gaussian_kernel_1d(radius), gaussian_kernel_1d(radius))
+    padded = np.zeros((height + 2 * radius, width + 2 * radius))
+    for row, col in zip(rows, cols):
+        padded[row:row + taps, col:col + taps] += delta[row, col] * kernel
+    target += padded[radius:radius + height, radius:radius + width]
+
+
+def render_grid(latitudes: np.ndarray, longitudes: np.ndarray, weights: np.ndarray,
+                resolution: int, blur_radius: int,
+                bounds: Optional[Bounds] = None) -> DensityGrid:
+    """Rasterize points and blur them into a ``resolution x resolution`` grid."""
+    if bounds is None:
+        bounds = compute_bounds(latitudes, longitudes, resolution, blur_radius)
+    raw = rasterize(latitudes, longitudes, weights, bounds, resolution, resolution)
+    return DensityGrid(intensity=blur(raw, blur_radius), bounds=bounds)
+
+
+def expand_bounds(bounds: Bounds, resolution: int, cells: int) -> Bounds:
+    """Grow bounds by ``cells`` grid cells on every side."""
+    south, west, north, east = bounds
+    cell_lat = (north - south) / resolution * cells
+    cell_lon = (east - west) / resolution * cells
+    return south - cell_lat, west - cell_lon, north + cell_lat, east + cell_lon
+
+
+def render_viewport(latitudes: np.ndarray, longitudes: np.ndarray, weights: np.ndarray,
+                    bounds: Bounds, resolution: int, blur_radius: int) -> DensityGrid:
+    """Render a fixed window, letting kernels of points just outside it spill in.
+
+    The raster is extended by ``blur_radius`` cells on every side before
+    blurring and cropped afterwards, so adjacent viewports line up.
+    """
+    margin = max(blur_radius, 0)
+    padded = expand_bounds(bounds, resolution, margin)
+    size = resolution + 2 * margin
+    blurred = blur(rasterize(latitudes, longitudes, weights, padded, size, size), blur_radius)
+    return DensityGrid(intensity=blurred[margin:margin + resolution, margin:margin + resolution], bounds=bounds)
+
+
+class GridAccumulator:
+    """Unblurred raster over fixed bounds that points can be added to incrementally.
+
+    Blurring is linear, so rendering the accumulated raw grid equals rendering
+    all points at once; memory stays at one grid however many points arrive.
+    """
+
+    def __init__(self, bounds: Bounds, resolution: int):
+        self.bounds = bounds
+        self.resolution = resolution
+        self.raw = np.zeros((resolution, resolution), dtype=np.float64)
+        self.count = 0
+        self.outside = 0
+        self.value_sum = 0.0
+        self.value_max = float("-inf")
+
+    def add(self, latitudes: np.ndarray, longitudes: np.ndarray, weights: np.ndarray,
+            values: Optional[np.ndarray] = None) -> None:
+        """Bin a batch of points into the raster and fold them into the summary."""
+        if latitudes.size == 0:
+            return
+        delta = rasterize(latitudes, longitudes, weights, self.bounds, self.resolution, self.resolution)
+        self.raw += delta
+        self._fold(delta)
+        south, west, north, east = self.bounds
+        self.outside += int(np.count_nonzero(
+            (latitudes <= south) | (latitudes > north) | (longitudes < west) | (longitudes >= east)
+        ))
+        values = weights if values is None else values
+        self.count += int(latitudes.size)
+        self.value_sum += float(values.sum())
+        self.value_max = max(self.value_max, float(values.max()))
+
+    def _fold(self, delta: np.ndarray) -> None:
+        """Hook for subclasses that maintain derived rasters."""
+
+    def render(self, blur_radius: int) -> DensityGrid:
+        """Blur the accumulated raster."""
+        return DensityGrid(intensity=blur(self.raw, blur_radius), bounds=self.bounds)
+
+    def summary(self) -> Dict[str, Any]:
+        """Count/avg/max over every point added so far."""
+        return {
+            "total_points": self.count,
+            "avg_value": self.value_sum / self.count if self.count else 0,
+            "max_value": self.value_max if self.count else 0,
+        }
+
+
+class IncrementalGrid(GridAccumulator):
+    """GridAccumulator that also keeps its blurred raster current.
+
+    Each ``add`` stamps only the new points' kernels, so appending a few
+    points costs O(points * radius^2) rather than a full re-blur. ``base``
+    names the upload the grid was seeded from, if any.
+    """
+
+    def __init__(self, bounds: Bounds, resolution: int, blur_radius: int, base: Optional[str] = None):
+        super().__init__(bounds, resolution)
+        self.blur_radius = blur_radius
+        self.base = base
+        self.intensity = np.zeros_like(self.raw)
+
+    def _fold(self, delta: np.ndarray) -> None:
+        splat(self.intensity, delta, self.blur_radius)
+
+    def render(self, blur_radius: Optional[int] = None) -> DensityGrid:
+        """The maintained blurred raster (re-blurred only for a different radius)."""
+        if blur_radius is not None and blur_radius != self.blur_radius:
+            return super().render(blur_radius)
+        return DensityGrid(intensity=self.intensity.copy(), bounds=self.bounds)
+
+    def to_state(self) -> Dict[str, Any]:
+        """Cacheable snapshot of the accumulator."""
+        return {
+            "bounds": list(self.bounds),
+            "blur_radius": self.blur_radius,
+            "raw": self.raw,
+            "intensity": self.intensity,
+            "count": self.count,
+            "outside": self.outside,
+            "value_sum": self.value_sum,
+            "value_max": self.value_max,
+            "base": self.base,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "IncrementalGrid":
+        """Rebuild from ``to_state`` output; arrays are copied so they are writable."""
+        raw = np.array(state["raw"], dtype=np.float64)
+        grid = cls(tuple(state["bounds"]), raw.shape[0], state["blur_radius"], state.get("base"))
+        grid.raw = raw
+        grid.intensity = np.array(state["intensity"], dtype=np.float64)
+        grid.count = state["count"]
+        grid.outside = state["outside"]
+        grid.value_sum = state["value_sum"]
+        grid.value_max = state["value_max"]
+        return grid
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Spatial Index - Grid-hash index over stored point sets for bounding-box queries."""
+
+import math
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from heatmap_grid import Bounds
+
+# Target average occupancy of an index cell
+POINTS_PER_CELL = 64
+
+# Upper bound on cells per axis, keeping the offsets array small for huge sets
+MAX_CELLS_PER_AXIS = 1024
+
+
+class GridIndex:
+    """Points bucketed into a uniform lat/lon grid, stored in CSR form.
+
+    Points are sorted by row-major cell number, so each index row is one
+    contiguous run and ``offsets[c]:offsets[c + 1]`` are the points of cell
+    ``c``. A bounding-box query reads one slice per covered row, costing
+    O(rows + points near the box) however large the set is.
+    """
+
+    def __init__(self, bounds: Bounds, cells: int, offsets: np.ndarray):
+        self.bounds = bounds
+        self.cells = cells
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, latitudes: np.ndarray, longitudes: np.ndarray) -> Tuple["GridIndex", np.ndarray]:
+        """Index a point set; returns the index and the order to sort the points into."""
+        n = int(latitudes.size)
+        cells = max(1, min(MAX_CELLS_PER_AXIS, math.ceil(math.sqrt(n / POINTS_PER_CELL))))
+        if n:
+            bounds = (float(latitudes.min()), float(longitudes.min()),
+                      float(latitudes.max()), float(longitudes.max()))
+        else:
+            bounds = (0.0, 0.0, 0.0, 0.0)
+        index = cls(bounds, cells, np.zeros(cells * cells + 1, dtype=np.int64))
+        cell = index._cell(latitudes, longitudes)
+        order = np.argsort(cell, kind="stable")
+        np.cumsum(np.bincount(cell, minlength=cells * cells), out=index.offsets[1:])
+        return index, order
+
+    def _axis(self, values: np.ndarray, low: float, high: float) -> np.ndarray:
+        span = max(high - low, 1e-12)
+        return np.clip(((values - low) / span * self.cells).astype(np.intp), 0, self.cells - 1)
+
+    def _cell(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        south, west, north, east = self.bounds
+        return self._axis(latitudes, south, north) * self.cells + self._axis(longitudes, west, east)
+
+    def query(self, bounds: Bounds) -> np.ndarray:
+        """Positions (in sorted order) of the points in cells overlapping ``bounds``.
+
+        Candidates still need an exact containment test; cells only narrow the search.
+        """
+        south, west, north, east = bounds
+        i_south, i_west, i_north, i_east = self.bounds
+        if self.offsets[-1] == 0 or south > i_north or north < i_south or west > i_east or east < i_west:
+            return np.zeros(0, dtype=np.int64)
+
+        rows = self._axis(np.array([south, north]), i_south, i_north)
+        cols = self._axis(np.array([west, east]), i_west, i_east)
+        starts = self.offsets[np.arange(rows[0], rows[1] + 1) * self.cells + cols[0]]
+        ends = self.offsets[np.arange(rows[0], rows[1] + 1) * self.cells + cols[1] + 1]
+        if starts.size == 1:
+            return np.arange(starts[0], ends[0])
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+    def to_state(self) -> Dict[str, Any]:
+        """Cacheable form stored next to the sorted points."""
+        return {"bounds": list(self.bounds), "cells": self.cells, "offsets": self.offsets}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "GridIndex":
+        return cls(tuple(state["bounds"]), state["cells"], np.asarray(state["offsets"], dtype=np.int64))
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Heatmap Jobs - Background heatmap generation on a Celery worker queue with progress and callbacks.
+
+The API stores a job's points in the cache and enqueues only its id, so
+broker messages stay small whatever the upload size. A worker started with
+``celery -A heatmap_jobs worker`` loads the points, runs the orchestrator,
+and writes progress and the result back under ``job_{id}``/``job_result_{id}``.
+``HEATMAP_BROKER_URL=memory://`` is for tests only: it runs each job
+eagerly inside the submitting request, which holds the HTTP connection open
+for the whole generation. Every deployment, single box included, needs a
+real broker and at least one worker.
+"""
+
+import ipaddress
+import logging
+import os
+import socket
+import time
+import uuid
+from contextlib import nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict
+from typing import Any, ContextManager, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from celery import Celery
+from kombu.exceptions import OperationalError
+
+from heatmap_orchestrator import HeatmapConfig, HeatmapOrchestrator, LocationColumns, PersistStep
+from heatmap_stages import add_stage_hook
+
+logger = logging.getLogger(__name__)
+
+BROKER_URL = os.getenv("HEATMAP_BROKER_URL") or os.getenv("REDIS_URL") or "redis://localhost:6379/0"
+
+# Job records and results are kept this long after submission
+JOB_TTL = 24 * 3600
+
+CALLBACK_TIMEOUT = 10
+
+# Comma-separated hosts callbacks may target; when unset, any host resolving to public addresses is allowed
+CALLBACK_HOSTS = {host.strip().lower() for host in os.getenv("HEATMAP_CALLBACK_HOSTS", "").split(",") if host.strip()}
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+# Progress reported when a job's generation enters each pipeline stage
+STAGE_PROGRESS = {"parse": 0.05, "digest": 0.1, "score": 0.2, "render": 0.4, "store_points": 0.8}
+
+celery_app = Celery("heatmap", broker=BROKER_URL)
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    task_ignore_result=True,
+    # Redelivered if a worker dies mid-job; one job at a time per worker process
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    # Test-only: jobs run synchronously inside POST /api/v1/jobs
+    task_always_eager=BROKER_URL.startswith("memory://"),
+)
+if celery_app.conf.task_always_eager:
+    logger.warning("HEATMAP_BROKER_URL=memory:// runs jobs inside the request; use it for tests only")
+
+# (queue, record) of the job the current context is running
+_current_job: ContextVar[Optional[Tuple["JobQueue", Dict[str, Any]]]] = ContextVar("heatmap_job", default=None)
+
+
+def _report_stage(name: str) -> ContextManager:
+    """Stage hook that records a running job's progress as generation advances."""
+    job = _current_job.get()
+    if job is None or name not in STAGE_PROGRESS:
+        return nullcontext()
+    queue, record = job
+    if STAGE_PROGRESS[name] > record["progress"]:
+        queue.update(record, stage=name, progress=STAGE_PROGRESS[name])
+    return nullcontext()
+
+
+add_stage_hook(_report_stage)
+
+
+class QueueUnavailableError(RuntimeError):
+    """Raised when a job cannot be handed to the broker."""
+
+
+def check_callback_url(url: str) -> None:
+    """Raise ValueError unless url is http(s) to an allowed host or one with only public addresses.
+    
+    Stops callbacks being aimed at the service's own network: loopback,
+    private ranges, link-local cloud metadata endpoints and the like.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("callback_url must be an http or https URL")
+    host = parts.hostname.lower()
+    if CALLBACK_HOSTS:
+        if host not in CALLBACK_HOSTS:
+            raise ValueError(f"callback_url host {host} is not allowed")
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or None, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"callback_url host {host} does not resolve: {e}")
+    for text in addresses:
+        address = ipaddress.ip_address(text.split("%", 1)[0])
+        if getattr(address, "ipv4_mapped", None):
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"callback_url must not point at a private or local address ({address})")
+
+
+def pack_points(points: LocationColumns) -> Dict[str, Any]:
+    return {
+        "latitude": points.latitude,
+        "longitude": points.longitude,
+        "value": points.value,
+        "category_codes": points.category_codes,
+        "categories": points.categories,
+        "timestamp": points.timestamp,
+    }
+
+
+def unpack_points(packed: Dict[str, Any]) -> LocationColumns:
+    return LocationColumns(packed["latitude"], packed["longitude"], packed["value"],
+                           packed["category_codes"], list(packed["categories"]), packed["timestamp"])
+
+
+class JobQueue:
+    """Submits heatmap jobs and tracks their records in the orchestrator's persister."""
+
+    def __init__(self, orchestrator: HeatmapOrchestrator):
+        self.orchestrator = orchestrator
+        self.persister = orchestrator.persister
+
+    def submit(self, points: LocationColumns, location_id: str, config: HeatmapConfig,
+               callback_url: Optional[str] = None) -> Dict[str, Any]:
+        """Store the job's input and enqueue it; returns the queued record.
+        
+        Raises ValueError for a callback_url that may not be called, and
+        QueueUnavailableError, with the record marked failed, if the broker
+        cannot be reached.
+        """
+        if callback_url:
+            check_callback_url(callback_url)
+        now = time.time()
+        record = {
+            "id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "stage": None,
+            "progress": 0.0,
+            "location_id": location_id,
+            "points": len(points),
+            "callback_url": callback_url,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.persister.cache_result(f"job_input_{record['id']}", {
+            "points": pack_points(points),
+            "location_id": location_id,
+            "config": asdict(config),
+        }, ttl=JOB_TTL, local=False)
+        self._save(record)
+        try:
+            run_heatmap_job.delay(record["id"])
+        except OperationalError as e:
+            logger.error(f"Could not enqueue job {record['id']}: {e}")
+            self.update(record, status=FAILED, error="Job queue unavailable")
+            self.persister.delete(f"job_input_{record['id']}")
+            raise QueueUnavailableError("Job queue unavailable") from e
+        return record
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job record, read past L1 because a worker process updates it."""
+        return self.persister.get_cached(f"job_{job_id}", local=False)
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.persister.get_cached(f"job_result_{job_id}", local=False)
+
+    def update(self, record: Dict[str, Any], **fields: Any) -> None:
+        record.update(fields, updated_at=time.time())
+        self._save(record)
+
+    def _save(self, record: Dict[str, Any]) -> None:
+        self.persister.cache_result(f"job_{record['id']}", record, ttl=JOB_TTL, local=False)
+
+    def run(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Execute a queued job; called by the worker task."""
+        record = self.get(job_id)
+        job_input = self.persister.get_cached(f"job_input_{job_id}", local=False)
+        if record is None or job_input is None:
+            logger.error(f"Job {job_id} has no record or input; it may have expired")
+            return None
+
+        self.update(record, status=RUNNING)
+        token = _current_job.set((self, record))
+        try:
+            result = self.orchestrator.generate_heatmap(
+                unpack_points(job_input["points"]), job_input["location_id"],
+                HeatmapConfig(**job_input["config"])
+            )
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            self.persister.cache_result(f"job_result_{job_id}", result, ttl=JOB_TTL, local=False)
+            self.update(record, status=SUCCEEDED, stage=None, progress=1.0)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            self.update(record, status=FAILED, error=str(e))
+        finally:
+            _current_job.reset(token)
+            self.persister.delete(f"job_input_{job_id}")
+
+        if record["callback_url"]:
+            self._notify(record)
+        return record
+
+    def _notify(self, record: Dict[str, Any]) -> None:
+        """POST the finished record to the job's callback URL; failures are logged, not retried."""
+        try:
+            # Checked again here: the host may resolve differently by the time the job finishes
+            check_callback_url(record["callback_url"])
+            requests.post(record["callback_url"], json=record, timeout=CALLBACK_TIMEOUT,
+                          allow_redirects=False).raise_for_status()
+        except (ValueError, requests.RequestException) as e:
+            logger.warning(f"Callback for job {record['id']} failed: {e}")
+
+
+_queue: Optional[JobQueue] = None
+
+
+def configure(orchestrator: HeatmapOrchestrator) -> JobQueue:
+    """Use orchestrator for jobs run in this process (the API does this; workers build their own)."""
+    global _queue
+    _queue = JobQueue(orchestrator)
+    return _queue
+
+
+def job_queue() -> JobQueue:
+    """This process's queue, built from REDIS_URL on first use in a worker."""
+    if _queue is None:
+        configure(HeatmapOrchestrator(persister=PersistStep(redis_url=os.getenv("REDIS_URL"))))
+    return _queue
+
+
+@celery_app.task(name="heatmap.generate")
+def run_heatmap_job(job_id: str) -> None:
+    job_queue().run(job_id)
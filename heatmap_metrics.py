@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Metrics - Prometheus instrumentation for HTTP traffic and the heatmap pipeline."""
+
+import time
+from typing import Any, Dict
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.routing import Match
+
+from heatmap_breaker import STATE_CODES
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 256 B to 64 MB in factors of four
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+
+# Route label for requests no route matched; keeps label cardinality bounded
+UNMATCHED_ROUTE = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "heatmap_http_request_duration_seconds", "HTTP request latency",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "heatmap_http_requests_in_flight", "HTTP requests currently being served", ["method", "route"],
+    multiprocess_mode="livesum"
+)
+REQUEST_SIZE = Histogram(
+    "heatmap_http_request_size_bytes", "HTTP request body size", ["method", "route"], buckets=SIZE_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    "heatmap_http_response_size_bytes", "HTTP response body size", ["method", "route"], buckets=SIZE_BUCKETS
+)
+STAGE_LATENCY = Histogram(
+    "heatmap_stage_duration_seconds", "Time spent in each heatmap pipeline stage", ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter("heatmap_stage_errors", "Pipeline stages that raised", ["stage"])
+
+
+def route_template(scope: Dict[str, Any]) -> str:
+    """Path template of the route serving a request, e.g. ``/api/v1/tiles/{location_id}/{z}/{x}/{y}``."""
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording latency, in-flight and payload-size metrics per route.
+
+    Plain ASGI rather than ``BaseHTTPMiddleware`` so streamed uploads and
+    responses pass through untouched; sizes are counted from the ASGI messages.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        status = {"code": 500}
+        sizes = {"request": 0, "response": 0}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(method, route, str(status["code"])).observe(time.perf_counter() - start)
+            # Bodies the endpoint never read still count through Content-Length
+            declared = dict(scope.get("headers", ())).get(b"content-length", b"0")
+            request_size = max(sizes["request"], int(declared) if declared.isdigit() else 0)
+            REQUEST_SIZE.labels(method, route).observe(request_size)
+            RESPONSE_SIZE.labels(method, route).observe(sizes["response"])
+
+
+class PipelineCollector:
+    """Exports counters the persister, executor and rate limiters already keep, read at scrape time.
+
+    ``limiters`` maps a label to any object with a ``stats()`` returning ``rejections``.
+    """
+
+    def __init__(self, persister, executor, limiters: Dict[str, Any]):
+        self.persister = persister
+        self.executor = executor
+        self.limiters = limiters
+
+    def collect(self):
+        cache = self.persister.stats()
+        lookups = CounterMetricFamily("heatmap_cache_lookups", "Cache lookups by tier and outcome",
+                                      labels=["tier", "result"])
+        lookups.add_metric(["l1", "hit"], cache["hits"])
+        lookups.add_metric(["l1", "miss"], cache["misses"])
+        lookups.add_metric(["l2", "hit"], cache["l2_hits"])
+        lookups.add_metric(["l2", "miss"], cache["l2_misses"])
+        lookups.add_metric(["l2", "error"], cache["l2_errors"])
+        yield lookups
+
+        removals = CounterMetricFamily("heatmap_cache_removals", "L1 entries dropped by reason",
+                                       labels=["reason"])
+        removals.add_metric(["eviction"], cache["evictions"])
+        removals.add_metric(["expiration"], cache["expirations"])
+        yield removals
+
+        yield GaugeMetricFamily("heatmap_cache_entries", "Entries held in L1", value=cache["entries"])
+        yield GaugeMetricFamily("heatmap_cache_bytes", "Decoded bytes held in L1", value=cache["bytes"])
+
+        breaker = self.persister.breaker.stats()
+        yield GaugeMetricFamily("heatmap_redis_circuit_state", "Redis circuit: 0 closed, 1 open, 2 half-open",
+                                value=STATE_CODES[breaker["state"]])
+        yield CounterMetricFamily("heatmap_redis_circuit_trips", "Times the Redis circuit opened",
+                                  value=breaker["trips"])
+        yield CounterMetricFamily("heatmap_redis_short_circuited", "Redis calls skipped while the circuit was open",
+                                  value=breaker["short_circuited"])
+
+        rejections = CounterMetricFamily("heatmap_rate_limit_rejections", "Requests refused by a rate limiter",
+                                         labels=["limiter"])
+        for name, limiter in self.limiters.items():
+            rejections.add_metric([name], limiter.stats()["rejections"])
+        yield rejections
+
+        executor = self.executor.stats()
+        yield GaugeMetricFamily("heatmap_executor_pending", "Generation jobs running or queued",
+                                value=executor["pending"])
+        yield CounterMetricFamily("heatmap_executor_rejections", "Generation jobs refused because the queue was full",
+                                  value=executor["rejected"])
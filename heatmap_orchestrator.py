@@ -3,17 +3,59 @@
 
 import threading
 import json
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Sequence, Tuple, Union
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, replace
 from datetime import datetime
 import redis
+import redis.asyncio as aioredis
 import logging
-from functools import lru_cache
+from functools import lru_cache, partial
 import asyncio
+import hashlib
+import os
+import time
+import uuid
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from heatmap_grid import (
+    FFT_RADIUS_THRESHOLD, DensityGrid, GridAccumulator, IncrementalGrid, compute_bounds, expand_bounds,
+    render_grid, render_viewport
+)
+import heatmap_codecs as codecs
+from heatmap_breaker import CircuitBreaker
+from heatmap_cache import LRUCache
+from heatmap_index import GridIndex
+from heatmap_render import COLORMAPS, ENCODERS, render_image
+from heatmap_singleflight import SingleFlight
+from heatmap_stages import stage, timed
+from heatmap_tiles import TilePyramid, densest_tile, neighbourhood, tile_bounds, tile_exists, viewport_pixels
+from heatmap_windows import WindowedGrid, check_timestamps
+from pricing import MONTH_SECONDS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Below this many points a grid renders faster inline than the process hop costs
+PROCESS_POOL_MIN_POINTS = 20000
+
+# Incremental per-location accumulators outlive ordinary cache entries
+ACCUMULATOR_TTL = 30 * 24 * 3600
+
+# Largest grid a zoomed viewport query renders, whatever the on-screen size
+MAX_VIEWPORT_RESOLUTION = 1024
+
+# How long one replica may hold the right to compute a missing heatmap
+LEASE_SECONDS = 30
+
+# How long a replica waits on another's lease before computing itself; the
+# wait holds a generation thread, so it stays far below the lease time
+LEASE_WAIT_SECONDS = 5.0
+
+# How long a leader's failure stays visible to the replicas waiting on it
+LEASE_FAILURE_SECONDS = 10
+
 
 @dataclass
 class LocationData:
@@ -25,170 +67,1264 @@ class LocationData:
     timestamp: Optional[str] = None
 
 
+def parse_timestamp(value: Union[None, float, int, str]) -> float:
+    """Epoch seconds from a number or ISO-8601 string; NaN when missing."""
+    if value is None or value == "":
+        return float("nan")
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
 @dataclass
+class LocationColumns:
+    """Struct-of-arrays point set: one contiguous array per field.
+    
+    Categories are stored as int32 codes into ``categories`` (-1 means none),
+    so a 100k-point set is a handful of arrays instead of 100k objects.
+    Timestamps, when present, are epoch seconds with NaN for missing values.
+    """
+    latitude: np.ndarray
+    longitude: np.ndarray
+    value: np.ndarray
+    category_codes: np.ndarray
+    categories: List[str]
+    timestamp: Optional[np.ndarray] = None
+    
+    def __len__(self) -> int:
+        return int(self.latitude.size)
+    
+    def require_finite(self, what: str = "point") -> "LocationColumns":
+        """Raise ValueError unless every latitude, longitude and value is a finite number; returns self."""
+        finite = np.isfinite(self.latitude) & np.isfinite(self.longitude) & np.isfinite(self.value)
+        if not finite.all():
+            raise ValueError(f"Invalid {what}: latitude, longitude and value must be finite numbers "
+                             f"({int(np.count_nonzero(~finite))} {what}s are not)")
+        return self
+    
+    def __getitem__(self, index: Union[slice, np.ndarray]) -> "LocationColumns":
+        """Subset by slice, index array or boolean mask, sharing the category vocabulary."""
+        return LocationColumns(
+            self.latitude[index], self.longitude[index], self.value[index],
+            self.category_codes[index], self.categories,
+            None if self.timestamp is None else self.timestamp[index]
+        )
+    
+    @classmethod
+    def from_columns(cls, latitude: Sequence[float], longitude: Sequence[float], value: Sequence[float],
+                     category: Optional[Sequence[Optional[str]]] = None,
+                     timestamp: Optional[Sequence[Union[None, float, str]]] = None) -> "LocationColumns":
+        """Build from parallel per-field sequences."""
+        latitude = np.ascontiguousarray(latitude, dtype=np.float64)
+        longitude = np.ascontiguousarray(longitude, dtype=np.float64)
+        value = np.ascontiguousarray(value, dtype=np.float64)
+        if category is None:
+            category = ()
+        lengths = {latitude.size, longitude.size, value.size}
+        lengths |= {len(c) for c in (category, timestamp) if c is not None and len(c)}
+        if len(lengths) > 1:
+            raise ValueError(f"Column lengths differ: {sorted(lengths)}")
+        codes, categories = cls._factorize(category, latitude.size)
+        return cls(latitude, longitude, value, codes, categories, cls._timestamps(timestamp, latitude.size))
+    
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]]) -> "LocationColumns":
+        """Build from row dicts with latitude/longitude/value and optional category/timestamp."""
+        n = len(records)
+        codes, categories = cls._factorize([r.get("category") for r in records], n)
+        timestamps = [r.get("timestamp") for r in records]
+        return cls(
+            np.fromiter((r["latitude"] for r in records), dtype=np.float64, count=n),
+            np.fromiter((r["longitude"] for r in records), dtype=np.float64, count=n),
+            np.fromiter((r["value"] for r in records), dtype=np.float64, count=n),
+            codes,
+            categories,
+            cls._timestamps(timestamps if any(t is not None for t in timestamps) else None, n)
+        )
+    
+    @staticmethod
+    def _factorize(category: Sequence[Optional[str]], n: int):
+        vocabulary: Dict[str, int] = {}
+        if not len(category):
+            return np.full(n, -1, dtype=np.int32), []
+        # Empty strings count as uncategorized, like LocationData's truthiness check
+        codes = np.fromiter(
+            (-1 if not c else vocabulary.setdefault(c, len(vocabulary)) for c in category),
+            dtype=np.int32, count=n
+        )
+        return codes, list(vocabulary)
+    
+    @staticmethod
+    def _timestamps(timestamp: Optional[Sequence[Union[None, float, str]]], n: int) -> Optional[np.ndarray]:
+        if timestamp is None or not len(timestamp):
+            return None
+        if isinstance(timestamp, np.ndarray) and timestamp.dtype.kind in "fiu":
+            return np.ascontiguousarray(timestamp, dtype=np.float64)
+        return np.fromiter((parse_timestamp(t) for t in timestamp), dtype=np.float64, count=n)
+
+
+@dataclass(frozen=True)
 class HeatmapConfig:
-    """Configuration for heatmap generation."""
+    """Configuration for heatmap generation.
+    
+    Frozen so one orchestrator can serve concurrent requests with different
+    configs; derive variants with ``dataclasses.replace``.
+    """
     blur_radius: int = 25
+    grid_resolution: int = 128
     max_zoom: int = 18
     color_scheme: str = "hot"
     cache_enabled: bool = True
+    cache_ttl: int = 3600
+    # Seconds past cache_ttl a result is still served while it is recomputed
+    stale_ttl: int = 300
+    # Coordinate cache misses across replicas through a Redis lease
     distributed: bool = True
 
 
+def digest_points(points: LocationColumns) -> str:
+    """Order-independent content hash of a point set."""
+    # Re-code categories by sorted name so the vocabulary order does not matter
+    vocabulary = sorted(points.categories)
+    rank = np.array([vocabulary.index(c) for c in points.categories] + [-1], dtype=np.int32)
+    codes = rank[points.category_codes]
+    
+    keys = (codes, points.value, points.longitude, points.latitude)
+    if points.timestamp is not None:
+        # Least significant, so otherwise tied points still sort the same whatever their input order
+        keys = (points.timestamp,) + keys
+    order = np.lexsort(keys)
+    hasher = hashlib.blake2b(digest_size=16)
+    for column in (points.latitude, points.longitude, points.value):
+        hasher.update(np.ascontiguousarray(column[order], dtype="<f8").tobytes())
+    hasher.update(np.ascontiguousarray(codes[order], dtype="<i4").tobytes())
+    hasher.update("\x1f".join(vocabulary).encode())
+    if points.timestamp is not None:
+        hasher.update(np.ascontiguousarray(points.timestamp[order], dtype="<f8").tobytes())
+    return hasher.hexdigest()
+
+
+@lru_cache(maxsize=256)
+def digest_config(config: HeatmapConfig) -> str:
+    """Content hash of every HeatmapConfig field."""
+    canonical = json.dumps(asdict(config), sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode(), digest_size=8).hexdigest()
+
+
+# (points, scores) -> adjusted scores; must operate on whole arrays
+ScoreFunction = Callable[[LocationColumns, np.ndarray], np.ndarray]
+
+
+def category_boost(factor: float = 1.2) -> ScoreFunction:
+    """Multiply the score of every categorized point by factor."""
+    def _boost(points: LocationColumns, scores: np.ndarray) -> np.ndarray:
+        return np.where(points.category_codes >= 0, scores * factor, scores)
+    return _boost
+
+
+def category_weights(weights: Dict[str, float], default: float = 1.0,
+                     uncategorized: float = 1.0) -> ScoreFunction:
+    """Multiply scores by a per-category weight looked up through the code array."""
+    def _weigh(points: LocationColumns, scores: np.ndarray) -> np.ndarray:
+        # The trailing entry is picked up by code -1
+        table = np.array([weights.get(c, default) for c in points.categories] + [uncategorized])
+        return scores * table[points.category_codes]
+    return _weigh
+
+
+def time_decay(half_life_seconds: float, now: Optional[float] = None) -> ScoreFunction:
+    """Halve scores every half_life_seconds of age; points without a timestamp are unchanged."""
+    def _decay(points: LocationColumns, scores: np.ndarray) -> np.ndarray:
+        if points.timestamp is None:
+            return scores
+        age = (datetime.now().timestamp() if now is None else now) - points.timestamp
+        factor = np.exp2(-np.maximum(age, 0.0) / half_life_seconds)
+        return scores * np.where(np.isnan(factor), 1.0, factor)
+    return _decay
+
+
 class ScoreItemsStep:
-    """LLM batch processing for intelligent data scoring."""
+    """Vectorized scoring of point sets through a chain of array functions."""
     
-    def __init__(self, batch_size: int = 32):
+    def __init__(self, batch_size: int = 65536, score_functions: Optional[List[ScoreFunction]] = None,
+                 max_score: float = 100.0):
+        # Points per vectorized chunk; bounds temporaries on very large inputs
         self.batch_size = batch_size
+        self.score_functions = [category_boost(1.2)] if score_functions is None else list(score_functions)
+        self.max_score = max_score
     
-    def score_batch(self, items: List[LocationData]) -> List[float]:
-        """Score items using batched LLM processing."""
-        scores = []
-        for item in items:
-            # Intelligent scoring based on location data
-            score = self._calculate_score(item)
-            scores.append(score)
+    @timed("score")
+    def score_batch(self, items: Union[List[LocationData], LocationColumns]) -> np.ndarray:
+        """Score items chunk by chunk, applying every score function and the cap in bulk."""
+        points = items if isinstance(items, LocationColumns) else LocationColumns.from_records(
+            [asdict(item) for item in items]
+        )
+        scores = np.empty(len(points), dtype=np.float64)
+        for start in range(0, len(points), self.batch_size):
+            chunk = points[start:start + self.batch_size]
+            chunk_scores = chunk.value.copy()
+            for score_function in self.score_functions:
+                chunk_scores = score_function(chunk, chunk_scores)
+            np.minimum(chunk_scores, self.max_score, out=scores[start:start + len(chunk)])
         return scores
     
     def _calculate_score(self, item: LocationData) -> float:
-        """Calculate relevance score for location item."""
+        """Reference per-item score for the default pipeline (category boost, 100 cap)."""
         base_score = item.value
         if item.category:
             base_score *= 1.2  # Boost categorized items
         return min(base_score, 100.0)
 
 
+# L1 lifetime of counters read from Redis; location versions must reach every
+# replica within about this long after an invalidation
+COUNTER_L1_SECONDS = 1
+
+# Delete a lease only if it still holds our token: KEYS = lease, ARGV = token
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
 class PersistStep:
-    """Redis/PostgreSQL persistence layer."""
+    """Redis/PostgreSQL persistence layer with a bounded in-process L1 tier.
     
-    def __init__(self, redis_host: str = 'localhost', redis_port: int = 6379):
+    Synchronous clients share one blocking connection pool of
+    ``max_connections``; coroutines get an asyncio client per event loop with
+    its own pool of the same size. Bulk ``get_many``/``cache_many`` (and their
+    ``a``-prefixed async forms) cost one round trip however many keys they touch.
+    
+    Redis calls go through a circuit breaker: after repeated failures, or if
+    Redis is down at startup, the L1 tier serves alone while a background
+    probe waits for Redis to come back, so an outage costs no request timeouts.
+    """
+    
+    def __init__(self, redis_host: str = 'localhost', redis_port: int = 6379,
+                 max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, l1_ttl: int = 300,
+                 codec: str = "msgpack", compression: Optional[str] = None, max_connections: int = 64,
+                 socket_timeout: float = 1.0, breaker: Optional[CircuitBreaker] = None,
+                 redis_url: Optional[str] = None):
+        self.codec = codec
+        self.compression = compression or codecs.best_compression()
+        pool_options = dict(max_connections=max_connections, timeout=5,
+                            socket_timeout=socket_timeout, socket_connect_timeout=socket_timeout)
+        if redis_url:
+            self.pool = redis.BlockingConnectionPool.from_url(redis_url, **pool_options)
+        else:
+            self.pool = redis.BlockingConnectionPool(host=redis_host, port=redis_port, **pool_options)
+        self.redis_client = redis.Redis(connection_pool=self.pool)
+        self.breaker = breaker or CircuitBreaker(probe=lambda: self.redis_client.ping())
         try:
-            self.redis_client = redis.Redis(host=redis_host, port=redis_port, decode_responses=True)
             self.redis_client.ping()
         except Exception as e:
-            logger.warning(f"Redis connection failed: {e}. Using in-memory cache.")
-            self.redis_client = None
-        self.memory_cache: Dict[str, Any] = {}
+            logger.warning(f"Redis connection failed: {e}. Using in-memory cache until it is reachable.")
+            self.breaker.trip()
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+        self.memory_cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.counters: Dict[str, int] = {}
+        self.l2_stats = {"l2_hits": 0, "l2_misses": 0, "l2_errors": 0}
+        self._stats_lock = threading.Lock()
+        # With Redis as L2, L1 copies expire early so other replicas' writes show up
+        self.l1_ttl = l1_ttl
+    
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.l2_stats[name] += 1
+    
+    def _redis(self) -> Optional[Any]:
+        """The Redis client, or None when Redis is disabled or its circuit is open."""
+        if self.redis_client is None or not self.breaker.allow():
+            return None
+        return self.redis_client
+    
+    def _redis_failed(self, action: str, error: Exception) -> None:
+        self.breaker.record_failure()
+        logger.error(f"{action} failed: {error}")
+    
+    def _local_ttl(self, ttl: int, shared: bool) -> int:
+        """L1 TTL of a value; capped only when Redis holds it too, else L1 is its only copy."""
+        return min(ttl, self.l1_ttl) if shared else ttl
+    
+    @timed("cache_write")
+    def cache_result(self, key: str, value: Any, ttl: int = 3600, local: bool = True) -> bool:
+        """Cache heatmap result with TTL.
+        
+        ``local=False`` keeps the value out of L1 whenever Redis can take it,
+        for state another process updates, such as job records.
+        """
+        payload = codecs.encode(value, self.codec, self.compression)
+        shared = False
+        client = self._redis()
+        if client is not None:
+            try:
+                client.setex(key, ttl, payload)
+                self.breaker.record_success()
+                shared = True
+            except Exception as e:
+                self._redis_failed("Cache write", e)
+        if local or not shared:
+            self.memory_cache.set(key, value, self._local_ttl(ttl, shared), nbytes=codecs.decoded_size(payload))
+        return True
     
-    def cache_result(self, key: str, value: Any, ttl: int = 3600) -> bool:
-        """Cache heatmap result with TTL."""
-        if self.redis_client:
+    @timed("cache_read")
+    def get_cached(self, key: str, local: bool = True) -> Optional[Any]:
+        """Retrieve cached result; ``local=False`` reads past L1 whenever Redis is reachable."""
+        client = None if local else self._redis()
+        if client is None:
+            value = self.memory_cache.get(key)
+            if value is not None:
+                return value
+            client = self._redis() if local else None
+        if client is not None:
             try:
-                self.redis_client.setex(key, ttl, json.dumps(value))
-                return True
+                result = client.get(key)
+                self.breaker.record_success()
+                if result:
+                    value = self._l2_hit(key, result, local)
+                    if not codecs.is_current(result):
+                        self._migrate(key, value)
+                    return value
+                self._count("l2_misses")
             except Exception as e:
-                logger.error(f"Cache write failed: {e}")
-        self.memory_cache[key] = value
+                self._count("l2_errors")
+                self._redis_failed("Cache read", e)
+        return None
+    
+    def _l2_hit(self, key: str, payload: bytes, local: bool = True) -> Any:
+        """Decode a Redis payload and, unless told otherwise, keep a copy in L1."""
+        value = codecs.decode(payload)
+        if local:
+            self.memory_cache.set(key, value, self.l1_ttl, nbytes=codecs.decoded_size(payload))
+        self._count("l2_hits")
+        return value
+    
+    def _local_many(self, keys: Sequence[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """L1 hits, and the distinct keys L1 does not hold."""
+        found: Dict[str, Any] = {}
+        missing: List[str] = []
+        for key in dict.fromkeys(keys):
+            value = self.memory_cache.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                missing.append(key)
+        return found, missing
+    
+    def _remote_hits(self, keys: List[str], payloads: Sequence[Optional[bytes]],
+                     found: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        """Merge MGET results into found; returns the entries that need migrating."""
+        stale = []
+        for key, payload in zip(keys, payloads):
+            if not payload:
+                self._count("l2_misses")
+                continue
+            found[key] = self._l2_hit(key, payload)
+            if not codecs.is_current(payload):
+                stale.append((key, found[key]))
+        return stale
+    
+    def _encode_many(self, items: Dict[str, Any]) -> Dict[str, bytes]:
+        return {key: codecs.encode(value, self.codec, self.compression) for key, value in items.items()}
+    
+    def _store_local(self, items: Dict[str, Any], payloads: Dict[str, bytes], ttl: int, shared: bool) -> None:
+        """Put items in L1, for the full ttl unless Redis took them too."""
+        for key, value in items.items():
+            self.memory_cache.set(key, value, self._local_ttl(ttl, shared), nbytes=codecs.decoded_size(payloads[key]))
+    
+    @timed("cache_read")
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Any]:
+        """Cached values of several keys; L1 misses are fetched with a single MGET."""
+        found, missing = self._local_many(keys)
+        client = self._redis() if missing else None
+        if client is not None:
+            try:
+                payloads = client.mget(missing)
+                self.breaker.record_success()
+                for key, value in self._remote_hits(missing, payloads, found):
+                    self._migrate(key, value)
+            except Exception as e:
+                self._count("l2_errors")
+                self._redis_failed("Bulk cache read", e)
+        return found
+    
+    @timed("cache_write")
+    def cache_many(self, items: Dict[str, Any], ttl: int = 3600) -> bool:
+        """Cache several results with one TTL in a single pipelined round trip."""
+        payloads = self._encode_many(items)
+        shared = False
+        client = self._redis() if payloads else None
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for key, payload in payloads.items():
+                    pipe.setex(key, ttl, payload)
+                pipe.execute()
+                self.breaker.record_success()
+                shared = True
+            except Exception as e:
+                self._redis_failed("Bulk cache write", e)
+        self._store_local(items, payloads, ttl, shared)
         return True
     
-    def get_cached(self, key: str) -> Optional[Any]:
-        """Retrieve cached result."""
-        if self.redis_client:
+    def async_client(self) -> Optional[Any]:
+        """asyncio Redis client for the running event loop, or None while Redis is unavailable."""
+        if self._redis() is None:
+            return None
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            # Connections belong to the loop that opened them, so each loop gets its own pool
+            pool = aioredis.BlockingConnectionPool(max_connections=self.pool.max_connections,
+                                                   timeout=self.pool.timeout, **self.pool.connection_kwargs)
+            client = self._async_clients[loop] = aioredis.Redis(connection_pool=pool)
+        return client
+    
+    async def aget_many(self, keys: Sequence[str]) -> Dict[str, Any]:
+        """``get_many`` for coroutines: the MGET awaits instead of blocking the event loop."""
+        found, missing = self._local_many(keys)
+        client = self.async_client()
+        if missing and client is not None:
+            try:
+                payloads = await client.mget(missing)
+                self.breaker.record_success()
+                for key, value in self._remote_hits(missing, payloads, found):
+                    await client.set(key, codecs.encode(value, self.codec, self.compression), keepttl=True)
+            except Exception as e:
+                self._count("l2_errors")
+                self._redis_failed("Bulk cache read", e)
+        return found
+    
+    async def acache_many(self, items: Dict[str, Any], ttl: int = 3600) -> bool:
+        """``cache_many`` for coroutines."""
+        payloads = self._encode_many(items)
+        shared = False
+        client = self.async_client()
+        if payloads and client is not None:
+            try:
+                async with client.pipeline(transaction=False) as pipe:
+                    for key, payload in payloads.items():
+                        pipe.setex(key, ttl, payload)
+                    await pipe.execute()
+                self.breaker.record_success()
+                shared = True
+            except Exception as e:
+                self._redis_failed("Bulk cache write", e)
+        self._store_local(items, payloads, ttl, shared)
+        return True
+    
+    def _migrate(self, key: str, value: Any) -> None:
+        """Rewrite an entry from an older format in place, keeping its TTL."""
+        try:
+            self.redis_client.set(key, codecs.encode(value, self.codec, self.compression), keepttl=True)
+        except Exception as e:
+            self._redis_failed(f"Cache migration for {key}", e)
+    
+    def increment(self, key: str) -> int:
+        """Atomically increment an integer counter stored under key."""
+        self.memory_cache.delete(key)
+        client = self._redis()
+        if client is not None:
+            try:
+                value = int(client.incr(key))
+                self.breaker.record_success()
+                return value
+            except Exception as e:
+                self._redis_failed("Counter increment", e)
+        self.counters[key] = self.counters.get(key, 0) + 1
+        return self.counters[key]
+    
+    def get_counter(self, key: str) -> int:
+        """Read a counter maintained by ``increment`` (0 if never incremented)."""
+        client = self._redis()
+        if client is not None:
+            value = self.memory_cache.get(key)
+            if value is not None:
+                return value
+            try:
+                # Counters are plain INCR integers, not codec payloads
+                raw = client.get(key)
+                self.breaker.record_success()
+                value = int(raw) if raw else 0
+                self.memory_cache.set(key, value, COUNTER_L1_SECONDS)
+                return value
+            except Exception as e:
+                self._redis_failed("Counter read", e)
+        return self.counters.get(key, 0)
+    
+    async def aincrement(self, key: str) -> int:
+        """``increment`` for coroutines."""
+        self.memory_cache.delete(key)
+        client = self.async_client()
+        if client is not None:
+            try:
+                value = int(await client.incr(key))
+                self.breaker.record_success()
+                return value
+            except Exception as e:
+                self._redis_failed("Counter increment", e)
+        self.counters[key] = self.counters.get(key, 0) + 1
+        return self.counters[key]
+    
+    async def aget_counters(self, keys: Sequence[str]) -> Dict[str, int]:
+        """Several ``increment`` counters at once, reading L1 misses with one MGET."""
+        client = self.async_client()
+        if client is None:
+            return {key: self.counters.get(key, 0) for key in keys}
+        found, missing = self._local_many(keys)
+        if missing:
             try:
-                result = self.redis_client.get(key)
-                return json.loads(result) if result else None
+                for key, raw in zip(missing, await client.mget(missing)):
+                    found[key] = int(raw) if raw else 0
+                    self.memory_cache.set(key, found[key], COUNTER_L1_SECONDS)
+                self.breaker.record_success()
             except Exception as e:
-                logger.error(f"Cache read failed: {e}")
-        return self.memory_cache.get(key)
+                self._redis_failed("Counter read", e)
+                found.update((key, self.counters.get(key, 0)) for key in missing)
+        return found
+    
+    def try_lease(self, key: str, ttl: float) -> Optional[str]:
+        """Take an exclusive, expiring lease on key that every replica sees.
+        
+        Returns the token to release it with, ``""`` when Redis is unavailable
+        (there is nobody to coordinate with), or None while someone else holds it.
+        """
+        client = self._redis()
+        if client is None:
+            return ""
+        token = uuid.uuid4().hex
+        try:
+            acquired = client.set(key, token, nx=True, px=int(ttl * 1000))
+            self.breaker.record_success()
+            return token if acquired else None
+        except Exception as e:
+            self._redis_failed("Lease acquire", e)
+            return ""
+    
+    def release_lease(self, key: str, token: str) -> None:
+        """Give up a lease taken with ``try_lease``, unless it already expired and moved on."""
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            client.eval(RELEASE_LEASE_SCRIPT, 1, key, token)
+            self.breaker.record_success()
+        except Exception as e:
+            self._redis_failed("Lease release", e)
+    
+    def delete(self, key: str) -> None:
+        """Remove key from both tiers."""
+        self.memory_cache.delete(key)
+        client = self._redis()
+        if client is not None:
+            try:
+                client.delete(key)
+                self.breaker.record_success()
+            except Exception as e:
+                self._redis_failed("Cache delete", e)
+    
+    def close(self) -> None:
+        """Drop pooled Redis connections; later calls reconnect on demand."""
+        self.pool.disconnect()
+    
+    def stats(self) -> Dict[str, int]:
+        """L1 hit/miss/eviction counters and occupancy plus L2 (Redis) lookup outcomes."""
+        stats = self.memory_cache.stats()
+        with self._stats_lock:
+            stats.update(self.l2_stats)
+        return stats
+
+
+# Atomic sliding-window-counter check for Redis mode: KEYS = current, previous window
+RATE_LIMIT_SCRIPT = """
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if previous * tonumber(ARGV[2]) + current >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def tier_quotas(price_tiers: Dict[str, Dict[str, Any]]) -> Dict[str, Tuple[int, int]]:
+    """Map pricing tiers to (max_calls, window_seconds) quotas."""
+    return {tier: (info['requests_month'], MONTH_SECONDS) for tier, info in price_tiers.items()}
 
 
 class RateLimiter:
-    """Rate limiting for external API calls."""
+    """Sliding-window-counter rate limiting with per-key buckets.
+    
+    Each bucket keeps only the counts of the current and previous fixed window
+    and estimates the sliding count as ``previous * overlap + current``, so a
+    check is O(1) and memory is bounded by ``max_keys``. Tiered keys use the
+    quota from ``tier_limits``; everything else uses max_calls/window_seconds.
+    With a Redis client the check runs as an atomic script shared by replicas;
+    while the optional ``breaker`` is open the local buckets are used instead.
+    """
     
-    def __init__(self, max_calls: int = 1000, window_seconds: int = 3600):
+    def __init__(self, max_calls: int = 1000, window_seconds: int = 3600,
+                 tier_limits: Optional[Dict[str, Tuple[int, int]]] = None,
+                 max_keys: int = 100000, redis_client: Optional[Any] = None,
+                 breaker: Optional[CircuitBreaker] = None):
         self.max_calls = max_calls
         self.window_seconds = window_seconds
-        self.calls: List[datetime] = []
+        self.tier_limits = tier_limits or {}
+        self.max_keys = max_keys
+        # bucket key -> [window index, current count, previous count]
+        self.buckets: "OrderedDict[str, List[int]]" = OrderedDict()
         self.lock = threading.Lock()
+        self.rejections = 0
+        self.redis_client = redis_client
+        self._script = redis_client.register_script(RATE_LIMIT_SCRIPT) if redis_client else None
+        self.breaker = breaker
+    
+    def limits_for(self, tier: Optional[str] = None) -> Tuple[int, int]:
+        """(max_calls, window_seconds) applying to a tier."""
+        return self.tier_limits.get(tier, (self.max_calls, self.window_seconds))
     
-    def check_limit(self) -> bool:
-        """Check if call is within rate limit."""
+    def check_limit(self, key: str = "global", tier: Optional[str] = None) -> bool:
+        """Check if call is within rate limit, counting it when allowed."""
+        max_calls, window = self.limits_for(tier)
+        now = time.time()
+        index = int(now // window)
+        overlap = 1.0 - (now - index * window) / window
+        
+        if self.redis_client is not None and (self.breaker is None or self.breaker.allow()):
+            try:
+                allowed = bool(self._script(
+                    keys=[f"ratelimit:{key}:{window}:{index}", f"ratelimit:{key}:{window}:{index - 1}"],
+                    args=[max_calls, overlap, 2 * window]
+                ))
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                if not allowed:
+                    self._reject()
+                return allowed
+            except Exception as e:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                logger.error(f"Redis rate limit check failed: {e}. Using local buckets.")
+        
         with self.lock:
-            now = datetime.now()
-            cutoff = now.timestamp() - self.window_seconds
-            self.calls = [c for c in self.calls if c.timestamp() > cutoff]
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [index, 0, 0]
+                if len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+                if bucket[0] != index:
+                    bucket[2] = bucket[1] if bucket[0] == index - 1 else 0
+                    bucket[0], bucket[1] = index, 0
             
-            if len(self.calls) < self.max_calls:
-                self.calls.append(now)
-                return True
-            return False
+            if bucket[2] * overlap + bucket[1] >= max_calls:
+                self.rejections += 1
+                return False
+            bucket[1] += 1
+            return True
+    
+    def _reject(self) -> None:
+        with self.lock:
+            self.rejections += 1
+    
+    def stats(self) -> Dict[str, int]:
+        """Tracked buckets and rejection count."""
+        with self.lock:
+            return {"buckets": len(self.buckets), "rejections": self.rejections}
 
 
 class HeatmapOrchestrator:
     """Multi-threaded orchestrator for heatmap generation."""
     
-    def __init__(self, config: Optional[HeatmapConfig] = None):
+    def __init__(self, config: Optional[HeatmapConfig] = None,
+                 max_workers: Optional[int] = None, grid_workers: int = 0,
+                 scorer: Optional[ScoreItemsStep] = None, persister: Optional[PersistStep] = None,
+                 lease_wait: float = LEASE_WAIT_SECONDS):
         self.config = config or HeatmapConfig()
-        self.scorer = ScoreItemsStep()
-        self.persister = PersistStep()
-        self.rate_limiter = RateLimiter()
-        self.threads: List[threading.Thread] = []
-        self.results: Dict[str, Any] = {}
+        self.scorer = scorer or ScoreItemsStep()
+        self.persister = persister or PersistStep()
+        # Threads drive batch items (cache I/O, scoring); processes run large grid renders
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.grid_workers = grid_workers
+        self._batch_executor: Optional[Executor] = None
+        self._grid_executor: Optional[Executor] = None
+        # Recent results only; the persister holds the authoritative cache
+        self.results = LRUCache(max_entries=128)
         self.lock = threading.Lock()
+        self._location_locks = [threading.Lock() for _ in range(64)]
+        self._flights = SingleFlight()
+        self.lease_wait = lease_wait
+    
+    def location_version(self, location_id: str) -> int:
+        """Current cache generation of a location (0 until first invalidated)."""
+        return self.persister.get_counter(f"version_{location_id}")
     
-    def generate_heatmap(self, locations: List[Dict], location_id: str = "default") -> Dict[str, Any]:
-        """Generate heatmap from location data with caching."""
-        cache_key = f"heatmap_{location_id}_{self.config.color_scheme}"
+    def invalidate_location(self, location_id: str) -> int:
+        """Bump the location's cache generation so every cached heatmap for it is bypassed."""
+        return self.persister.increment(f"version_{location_id}")
+    
+    async def ainvalidate_location(self, location_id: str) -> int:
+        """``invalidate_location`` for coroutines."""
+        return await self.persister.aincrement(f"version_{location_id}")
+    
+    @staticmethod
+    def _heatmap_key(location_id: str, version: int, points_digest: str, config: HeatmapConfig) -> str:
+        return f"heatmap_{location_id}_v{version}_{points_digest}_{digest_config(config)}"
+    
+    def _heatmap_keys(self, batches: List[LocationColumns], location_ids: List[str],
+                      configs: List[HeatmapConfig], versions: Dict[str, int]) -> List[Optional[str]]:
+        return [
+            self._heatmap_key(location_id, versions[f"version_{location_id}"], digest_points(points), config)
+            if config.cache_enabled else None
+            for points, location_id, config in zip(batches, location_ids, configs)
+        ]
+    
+    async def cached_heatmaps(self, batches: List[LocationColumns], location_ids: List[str],
+                              configs: List[HeatmapConfig],
+                              run: Callable[..., Awaitable[Any]]) -> List[Optional[Dict[str, Any]]]:
+        """Cached results for several point sets, None where generation is still needed.
         
-        # Check cache first
-        cached = self.persister.get_cached(cache_key)
-        if cached:
-            logger.info(f"Cache hit for {cache_key}")
-            return cached
+        Versions and results are each read in one bulk round trip, so a batch
+        of N cache hits never needs N Redis calls. Hashing the point sets is
+        CPU work and goes through ``run`` (normally the generation executor).
+        """
+        versions = await self.persister.aget_counters([f"version_{location_id}" for location_id in location_ids])
+        keys = await run(self._heatmap_keys, batches, location_ids, configs, versions)
+        wanted = [key for key in keys if key is not None]
+        found = await self.persister.aget_many(wanted + [f"fresh_{key}" for key in wanted])
+        # Stale entries go through generate_heatmap, which serves them and schedules the refresh
+        return [
+            found.get(key) if key is not None and (not config.stale_ttl or f"fresh_{key}" in found) else None
+            for key, config in zip(keys, configs)
+        ]
+    
+    def generate_heatmap(self, locations: Union[List[Dict], LocationColumns], location_id: str = "default",
+                         config: Optional[HeatmapConfig] = None) -> Dict[str, Any]:
+        """Generate heatmap from location data with caching.
         
-        # Rate limit check
-        if not self.rate_limiter.check_limit():
-            return {"error": "Rate limit exceeded"}
+        ``locations`` is either row dicts or an already columnar point set.
+        ``config`` applies to this call only and defaults to the orchestrator's.
+        """
+        config = config or self.config
+        with stage("parse"):
+            points = locations if isinstance(locations, LocationColumns) else LocationColumns.from_records(locations)
+        with stage("digest"):
+            points_digest = digest_points(points)
+        cache_key = self._heatmap_key(location_id, self.location_version(location_id), points_digest, config)
+        
+        # Check cache first
+        if config.cache_enabled:
+            cached, fresh = self._lookup_heatmap(cache_key, config)
+            if cached:
+                logger.info(f"Cache hit for {cache_key}")
+                if not fresh:
+                    # Serve the stale copy; one background call per key refreshes it
+                    self._flights.submit(cache_key, lambda: self._generate_once(
+                        points, points_digest, location_id, config, cache_key))
+                return cached
         
-        # Convert to LocationData objects
-        location_objs = [LocationData(**loc) for loc in locations]
+        # Concurrent misses for the same key share one computation
+        return self._flights.do(cache_key, lambda: self._generate_once(
+            points, points_digest, location_id, config, cache_key))
+    
+    def _lookup_heatmap(self, cache_key: str, config: HeatmapConfig) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Cached result and whether it is still within cache_ttl, in one bulk read."""
+        fresh_key = f"fresh_{cache_key}"
+        found = self.persister.get_many([cache_key, fresh_key])
+        return found.get(cache_key), not config.stale_ttl or fresh_key in found
+    
+    def _generate_once(self, points: LocationColumns, points_digest: str, location_id: str,
+                       config: HeatmapConfig, cache_key: str) -> Dict[str, Any]:
+        """Generate under a cross-replica lease when ``config.distributed`` is set.
         
+        A replica that finds the lease taken waits for the holder's result,
+        and computes it itself if the holder reports a failure or nothing
+        appears within ``lease_wait`` seconds.
+        """
+        lease_key = f"lease_{cache_key}"
+        token = self.persister.try_lease(lease_key, LEASE_SECONDS) if config.distributed and config.cache_enabled else ""
+        if token is None:
+            cached = self._await_heatmap(cache_key, config)
+            if cached is not None:
+                return cached
+        try:
+            return self._generate(points, points_digest, location_id, config, cache_key)
+        except Exception as e:
+            if token:
+                # Tell waiting replicas to stop polling for a result that is not coming
+                self.persister.cache_result(f"failed_{cache_key}", str(e), ttl=LEASE_FAILURE_SECONDS, local=False)
+            raise
+        finally:
+            if token:
+                self.persister.release_lease(lease_key, token)
+    
+    def _await_heatmap(self, cache_key: str, config: HeatmapConfig) -> Optional[Dict[str, Any]]:
+        """Poll for a fresh result another replica is computing; None once it fails or ``lease_wait`` passes."""
+        keys = [cache_key, f"fresh_{cache_key}", f"failed_{cache_key}"]
+        deadline = time.monotonic() + self.lease_wait
+        delay = 0.05
+        while time.monotonic() < deadline:
+            time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+            found = self.persister.get_many(keys)
+            if keys[2] in found:
+                logger.warning(f"Lease holder for {cache_key} failed: {found[keys[2]]}")
+                return None
+            if keys[0] in found and (not config.stale_ttl or keys[1] in found):
+                return found[keys[0]]
+            delay = min(delay * 2, 0.5)
+        return None
+    
+    def _generate(self, points: LocationColumns, points_digest: str, location_id: str,
+                  config: HeatmapConfig, cache_key: str) -> Dict[str, Any]:
         # Score items in batch
-        scores = self.scorer.score_batch(location_objs)
+        weights = self.scorer.score_batch(points)
+        
+        # Rasterize scored points into a blurred density grid
+        grid = None
+        if len(points):
+            with stage("render"):
+                grid = self._render(points.latitude, points.longitude, weights, config)
+            with stage("store_points"):
+                self._store_points(location_id, points_digest, points, weights, config)
         
         # Generate heatmap
-        heatmap_data = {
+        heatmap_data = self._heatmap_result(location_id, config, grid, {
+            "total_points": len(points),
+            "avg_value": float(points.value.mean()) if len(points) else 0,
+            "max_value": float(points.value.max()) if len(points) else 0
+        })
+        
+        # Persist result; past cache_ttl it is still served, stale, for stale_ttl more
+        if config.cache_enabled:
+            self.persister.cache_result(cache_key, heatmap_data, ttl=config.cache_ttl + config.stale_ttl)
+            if config.stale_ttl:
+                self.persister.cache_result(f"fresh_{cache_key}", True, ttl=config.cache_ttl)
+        
+        self.results.set(cache_key, heatmap_data, ttl=config.cache_ttl)
+        
+        return heatmap_data
+    
+    def _heatmap_result(self, location_id: str, config: HeatmapConfig,
+                        grid: Optional[DensityGrid], summary: Dict[str, Any]) -> Dict[str, Any]:
+        """Assemble the response payload shared by every generation path."""
+        return {
             "location_id": location_id,
             "timestamp": datetime.now().isoformat(),
-            "points": [
-                {**asdict(loc), "score": score}
-                for loc, score in zip(location_objs, scores)
-            ],
-            "config": asdict(self.config),
-            "summary": {
-                "total_points": len(location_objs),
-                "avg_value": sum(l.value for l in location_objs) / len(location_objs) if location_objs else 0,
-                "max_value": max((l.value for l in location_objs), default=0)
-            }
+            "grid": grid.to_dict() if grid is not None else None,
+            "config": asdict(config),
+            "summary": summary
         }
+    
+    def new_accumulator(self, bounds: Tuple[float, float, float, float],
+                        config: Optional[HeatmapConfig] = None) -> GridAccumulator:
+        """Empty accumulator for a streamed upload over fixed bounds."""
+        config = config or self.config
+        return GridAccumulator(bounds, config.grid_resolution)
+    
+    def finish_stream(self, accumulator: GridAccumulator, location_id: str = "default",
+                      config: Optional[HeatmapConfig] = None) -> Dict[str, Any]:
+        """Render a fully streamed upload into the regular heatmap payload."""
+        config = config or self.config
+        grid = accumulator.render(config.blur_radius) if accumulator.count else None
+        summary = accumulator.summary()
+        summary["outside_bounds"] = accumulator.outside
+        return self._heatmap_result(location_id, config, grid, summary)
+    
+    def _store_points(self, location_id: str, points_digest: str, points: LocationColumns,
+                      weights: np.ndarray, config: HeatmapConfig) -> None:
+        """Keep the scored point set, spatially indexed, so tiles and viewports render on demand.
         
-        # Persist result
-        self.persister.cache_result(cache_key, heatmap_data)
+        The points live as long as the result generated from them, stale period included.
+        Regenerating the same upload (a stale refresh, or a miss after expiry)
+        keeps the appends built on it; only a different upload resets them.
+        """
+        previous = self.persister.get_cached(f"points_{location_id}")
+        index, order = GridIndex.build(points.latitude, points.longitude)
+        self.persister.cache_result(f"points_{location_id}", {
+            # Tile keys embed the content digest so a new upload never serves stale tiles
+            "version": points_digest,
+            "latitude": points.latitude[order],
+            "longitude": points.longitude[order],
+            "value": points.value[order],
+            "weight": weights[order],
+            "index": index.to_state()
+        }, ttl=config.cache_ttl + config.stale_ttl)
+        if previous is not None:
+            replaced = previous["version"] != points_digest
+        else:
+            accumulator = self.persister.get_cached(f"accumulator_{location_id}")
+            replaced = accumulator is not None and accumulator.get("base") != points_digest
+        if replaced:
+            # A new upload replaces the base that incremental appends build on
+            self.persister.delete(f"accumulator_{location_id}")
+    
+    def _location_lock(self, location_id: str) -> threading.Lock:
+        """Striped lock serializing read-modify-write of one location's state."""
+        return self._location_locks[hash(location_id) % len(self._location_locks)]
+    
+    def append_points(self, locations: Union[List[Dict], LocationColumns], location_id: str = "default",
+                      config: Optional[HeatmapConfig] = None,
+                      bounds: Optional[Tuple[float, float, float, float]] = None) -> Dict[str, Any]:
+        """Fold new points into the location's persistent accumulator.
         
-        with self.lock:
-            self.results[cache_key] = heatmap_data
+        Only the new points' kernels are added and the summary is updated in
+        O(new points); the live result is rewritten under its fixed key. The
+        accumulator is created on first use, seeded from points stored by
+        ``generate_heatmap`` if any, over ``bounds`` or the stored points'
+        extent; without stored points the first append must give ``bounds``.
+        """
+        config = config or self.config
+        points = locations if isinstance(locations, LocationColumns) else LocationColumns.from_records(locations)
+        # Refused before anything is stored, so a bad batch leaves no partial update
+        check_timestamps(points.timestamp, time.time())
+        weights = self.scorer.score_batch(points)
         
-        return heatmap_data
+        with self._location_lock(location_id):
+            grid = self._load_accumulator(location_id, config, bounds)
+            grid.add(points.latitude, points.longitude, weights, points.value)
+            self.persister.cache_result(f"accumulator_{location_id}", grid.to_state(), ttl=ACCUMULATOR_TTL)
+            self._add_to_windows(location_id, grid, points, weights)
+            
+            summary = grid.summary()
+            summary["outside_bounds"] = grid.outside
+            result = self._heatmap_result(
+                location_id, replace(config, blur_radius=grid.blur_radius, grid_resolution=grid.resolution),
+                grid.render() if grid.count else None, summary
+            )
+            self.persister.cache_result(f"heatmap_live_{location_id}", result, ttl=ACCUMULATOR_TTL)
+        return result
     
-    def process_parallel(self, location_batches: List[List[Dict]]) -> List[Dict]:
-        """Process multiple location batches in parallel threads."""
-        results = []
-        threads = []
+    def _load_accumulator(self, location_id: str, config: HeatmapConfig,
+                          bounds: Optional[Tuple[float, float, float, float]]) -> IncrementalGrid:
+        state = self.persister.get_cached(f"accumulator_{location_id}")
+        if state:
+            return IncrementalGrid.from_state(state)
+        
+        stored = self.persister.get_cached(f"points_{location_id}")
+        if bounds is None:
+            # A first batch's own extent may be a single point wide and would reject every later one
+            if not stored or not len(stored["latitude"]):
+                raise ValueError(f"A bbox is required for the first append to {location_id}")
+            bounds = compute_bounds(stored["latitude"], stored["longitude"], config.grid_resolution, config.blur_radius)
+        
+        grid = IncrementalGrid(bounds, config.grid_resolution, config.blur_radius,
+                               stored["version"] if stored else None)
+        if stored:
+            grid.add(stored["latitude"], stored["longitude"], stored["weight"], stored["value"])
+        return grid
+    
+    def get_live_heatmap(self, location_id: str) -> Optional[Dict[str, Any]]:
+        """Latest result maintained by ``append_points``."""
+        return self.persister.get_cached(f"heatmap_live_{location_id}")
+    
+    def _load_window_grids(self, location_id: str, windows: WindowedGrid,
+                           wanted: Sequence[Tuple[int, int]]) -> None:
+        """Fetch the wanted (ring, slot) grids of a location's windows in one round trip."""
+        keys = {self._window_grid_key(location_id, windows, ring, slot): (ring, slot) for ring, slot in wanted}
+        found = self.persister.get_many(list(keys)) if keys else {}
+        windows.load({keys[key]: grid for key, grid in found.items()}, wanted)
+    
+    @staticmethod
+    def _window_grid_key(location_id: str, windows: WindowedGrid, ring: int, slot: int) -> str:
+        return f"window_{location_id}_{windows.rings[ring].bucket_seconds}_{slot}"
+    
+    def _add_to_windows(self, location_id: str, grid: IncrementalGrid, points: LocationColumns,
+                        weights: np.ndarray) -> None:
+        """Bucket appended points by timestamp; points without one count as arriving now.
+        
+        Ring bookkeeping lives under ``window_{location_id}`` and each bucket
+        grid under its own key, so an append reads and rewrites only the
+        buckets its points fall into.
+        """
+        state = self.persister.get_cached(f"window_{location_id}")
+        windows = WindowedGrid.from_state(state) if state else None
+        # The rings share the accumulator's geometry; a re-seeded accumulator starts them over
+        if windows is None or windows.bounds != grid.bounds or windows.resolution != grid.resolution:
+            windows = WindowedGrid(grid.bounds, grid.resolution)
+        timestamps = points.timestamp
+        if timestamps is None:
+            timestamps = np.full(len(points), time.time())
+        else:
+            timestamps = np.where(np.isnan(timestamps), time.time(), timestamps)
+        self._load_window_grids(location_id, windows, windows.slots_for(timestamps))
+        windows.add(points.latitude, points.longitude, weights, timestamps, points.value)
+        dirty = {
+            self._window_grid_key(location_id, windows, ring, slot): bucket
+            for (ring, slot), bucket in windows.take_dirty().items()
+        }
+        self.persister.cache_many(dirty, ttl=windows.retention_seconds)
+        self.persister.cache_result(f"window_{location_id}", windows.header(), ttl=windows.retention_seconds)
+    
+    def windowed_heatmap(self, location_id: str, window_seconds: float,
+                         half_life_seconds: Optional[float] = None,
+                         config: Optional[HeatmapConfig] = None,
+                         now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Heatmap of points appended in the last ``window_seconds``, optionally decayed.
+        
+        Answered from precomputed per-minute/per-hour buckets, so the cost
+        depends on the window length, not on how many points arrived.
+        Returns None when nothing has been appended for the location.
+        """
+        config = config or self.config
+        now = time.time() if now is None else now
+        state = self.persister.get_cached(f"window_{location_id}")
+        if not state:
+            return None
+        windows = WindowedGrid.from_state(state)
+        ring = windows.ring_for(window_seconds)
+        index = windows.rings.index(ring)
+        slots = ring.window_slots(window_seconds, now)
+        self._load_window_grids(location_id, windows, [(index, int(slot)) for slot in slots])
+        grid, summary = windows.render(window_seconds, config.blur_radius, now, half_life_seconds)
+        summary["window_seconds"] = window_seconds
+        summary["half_life_seconds"] = half_life_seconds
+        return self._heatmap_result(
+            location_id, replace(config, grid_resolution=windows.resolution),
+            grid if summary["total_points"] else None, summary
+        )
+    
+    def generate_tile(self, location_id: str, z: int, x: int, y: int,
+                      config: Optional[HeatmapConfig] = None) -> Optional[Dict[str, Any]]:
+        """Render one Web-Mercator tile from the stored points of a location.
+        
+        Intensities are scaled against one peak per location and zoom (see
+        ``_tile_peak``) rather than each tile's own maximum, so sparse tiles
+        stay faint and neighbouring tiles join without seams.
+        """
+        config = config or self.config
+        if not tile_exists(z, x, y) or z > config.max_zoom:
+            raise ValueError(f"Tile {z}/{x}/{y} outside zoom range 0-{config.max_zoom}")
+        
+        points = self.persister.get_cached(f"points_{location_id}")
+        if not points:
+            return None
+        
+        version = points["version"]
+        cache_key = f"tile_{location_id}_{version}_{config.blur_radius}_{z}_{x}_{y}"
+        cached = self.persister.get_cached(cache_key)
+        if cached:
+            return cached
+        
+        with stage("render"):
+            grid = self._render_tile(points, location_id, z, x, y, config)
+        tile = {
+            "location_id": location_id,
+            "z": z,
+            "x": x,
+            "y": y,
+            "grid": grid.to_dict(self._tile_peak(points, location_id, z, config))
+        }
+        self.persister.cache_result(cache_key, tile, config.cache_ttl)
+        return tile
+    
+    def _tile_peak(self, points: Dict[str, Any], location_id: str, z: int, config: HeatmapConfig) -> float:
+        """Shared intensity scale of a location's tiles at zoom z: the peak of the tile holding its densest pixel.
+        
+        Computed once per upload and zoom; tiles brighter than it saturate.
+        """
+        cache_key = f"tile_peak_{location_id}_{points['version']}_{config.blur_radius}_{z}"
+        peak = self.persister.get_cached(cache_key)
+        if peak is None:
+            x, y = densest_tile(points["latitude"], points["longitude"], points["weight"], z)
+            peak = self._render_tile(points, location_id, z, x, y, config).max_intensity
+            self.persister.cache_result(cache_key, peak, config.cache_ttl)
+        return peak
+    
+    def _render_tile(self, points: Dict[str, Any], location_id: str, z: int, x: int, y: int,
+                     config: HeatmapConfig) -> DensityGrid:
+        """Blurred tile from the stored points, reading only those near it when they are indexed."""
+        latitudes, longitudes, weights = points["latitude"], points["longitude"], points["weight"]
+        if "index" in points:
+            # Only points under the tile and the neighbours its blur reads can reach it
+            index = GridIndex.from_state(points["index"])
+            candidates = np.unique(np.concatenate([
+                index.query(self._tile_query_bounds(*tile)) for _, _, tile in neighbourhood(z, x, y, config.blur_radius)
+            ]))
+            latitudes, longitudes, weights = latitudes[candidates], longitudes[candidates], weights[candidates]
+        
+        pyramid = TilePyramid(
+            latitudes, longitudes, weights,
+            max_zoom=config.max_zoom,
+            get_many=self.persister.get_many,
+            cache_many=partial(self.persister.cache_many, ttl=config.cache_ttl),
+            key_prefix=f"tile_raw_{location_id}_{points['version']}"
+        )
+        return pyramid.render_tile(z, x, y, config.blur_radius)
+    
+    @staticmethod
+    def _tile_query_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+        """Tile bounds for an index query; edge rows reach the poles, which projection clamps into them."""
+        south, west, north, east = tile_bounds(z, x, y)
+        return (-90.0 if y == 2 ** z - 1 else south), west, (90.0 if y == 0 else north), east
+    
+    def viewport_heatmap(self, location_id: str, bounds: Tuple[float, float, float, float],
+                         zoom: Optional[int] = None,
+                         config: Optional[HeatmapConfig] = None) -> Optional[Dict[str, Any]]:
+        """Heatmap of the stored points inside a bounding box.
+        
+        The spatial index narrows the scan to points in and just around the
+        box, so latency follows the visible area rather than the set size.
+        With ``zoom`` the grid matches the box's on-screen pixel size.
+        """
+        config = config or self.config
+        points = self.persister.get_cached(f"points_{location_id}")
+        if not points:
+            return None
+        
+        if zoom is None:
+            resolution = config.grid_resolution
+        else:
+            resolution = min(max(viewport_pixels(bounds, zoom), 1), MAX_VIEWPORT_RESOLUTION)
+        box = "_".join(f"{edge:.6f}" for edge in bounds)
+        cache_key = f"viewport_{location_id}_{points['version']}_{box}_{resolution}_{digest_config(config)}"
+        if config.cache_enabled:
+            cached = self.persister.get_cached(cache_key)
+            if cached:
+                return cached
+        
+        if "index" in points:
+            index = GridIndex.from_state(points["index"])
+        else:
+            # Entries stored before indexing was added are indexed on the fly
+            points = {key: np.asarray(points[key], dtype=np.float64) for key in ("latitude", "longitude", "value", "weight")}
+            index, order = GridIndex.build(points["latitude"], points["longitude"])
+            points = {key: column[order] for key, column in points.items()}
+        
+        candidates = index.query(expand_bounds(bounds, resolution, config.blur_radius))
+        latitudes = points["latitude"][candidates]
+        longitudes = points["longitude"][candidates]
+        values = points["value"][candidates]
+        with stage("render"):
+            grid = render_viewport(latitudes, longitudes, points["weight"][candidates],
+                                   bounds, resolution, config.blur_radius)
+        
+        south, west, north, east = bounds
+        inside = (latitudes > south) & (latitudes <= north) & (longitudes >= west) & (longitudes < east)
+        count = int(np.count_nonzero(inside))
+        summary = {
+            "total_points": count,
+            "avg_value": float(values[inside].mean()) if count else 0,
+            "max_value": float(values[inside].max()) if count else 0,
+            "scanned_points": int(candidates.size)
+        }
+        result = self._heatmap_result(location_id, replace(config, grid_resolution=resolution), grid, summary)
+        result["zoom"] = zoom
         
-        def process_batch(batch: List[Dict], index: int):
-            result = self.generate_heatmap(batch, f"batch_{index}")
-            with self.lock:
-                results.append(result)
+        if config.cache_enabled:
+            self.persister.cache_result(cache_key, result, config.cache_ttl)
+        return result
+    
+    def grid_image(self, grid: Optional[Dict[str, Any]], color_scheme: str = "hot",
+                   fmt: str = "png", ttl: Optional[int] = None) -> Tuple[bytes, str]:
+        """Colorized image of a result's grid plus a content digest usable as an ETag.
         
-        for i, batch in enumerate(location_batches):
-            thread = threading.Thread(target=process_batch, args=(batch, i))
-            threads.append(thread)
-            thread.start()
+        Images are cached by the digest of the normalized intensities, so any
+        path producing the same grid reuses one encoded image. ``ttl`` is the
+        cache_ttl of the request the grid came from, else the orchestrator's.
+        """
+        if grid is None:
+            raise ValueError("Result has no grid to render")
+        intensity = np.ascontiguousarray(grid["intensity"], dtype=np.float32)
+        digest = hashlib.blake2b(intensity.tobytes(), digest_size=16).hexdigest()
+        cache_key = f"image_{fmt}_{color_scheme}_{digest}"
+        cached = self.persister.get_cached(cache_key)
+        if cached:
+            return cached, digest
         
-        for thread in threads:
-            thread.join()
+        with stage("serialize"):
+            image = render_image(intensity, color_scheme, fmt)
+        self.persister.cache_result(cache_key, image, self.config.cache_ttl if ttl is None else ttl)
+        return image, digest
+    
+    def warmup(self) -> None:
+        """Run each lazily initialised path once so the first real request does not pay for it.
         
+        Covers both blur methods, tile rendering, every colormap and image
+        encoder, and starting the worker pools. Nothing is cached and no
+        location state is touched.
+        """
+        rng = np.random.default_rng(0)
+        latitudes, longitudes = rng.uniform(40.0, 41.0, 256), rng.uniform(-74.0, -73.0, 256)
+        weights = np.ones(latitudes.size)
+        resolution = self.config.grid_resolution
+        grid = render_grid(latitudes, longitudes, weights, resolution, 2)
+        render_grid(latitudes, longitudes, weights, resolution, FFT_RADIUS_THRESHOLD + 1)
+        for scheme in COLORMAPS:
+            for fmt in ENCODERS:
+                render_image(grid.intensity, scheme, fmt)
+        TilePyramid(latitudes, longitudes, weights, max_zoom=self.config.max_zoom,
+                    get_many=lambda keys: {}, cache_many=lambda items: True,
+                    key_prefix="warmup").render_tile(0, 0, 0, self.config.blur_radius)
+        self._executor("batch")
+        if self.grid_workers:
+            # The pool forks its processes on first use; make that happen now
+            executor = self._executor("grid")
+            futures = [executor.submit(render_grid, latitudes, longitudes, weights, resolution, 2)
+                       for _ in range(self.grid_workers)]
+            for future in futures:
+                future.result()
+    
+    def _render(self, latitudes: np.ndarray, longitudes: np.ndarray, weights: np.ndarray,
+                config: HeatmapConfig) -> DensityGrid:
+        """Render the density grid, in the process pool when the input is large."""
+        args = (latitudes, longitudes, weights, config.grid_resolution, config.blur_radius)
+        if self.grid_workers and latitudes.size >= PROCESS_POOL_MIN_POINTS:
+            return self._executor("grid").submit(render_grid, *args).result()
+        return render_grid(*args)
+    
+    def _executor(self, kind: str) -> Executor:
+        """Lazily create the shared, bounded batch or grid executor."""
+        with self.lock:
+            if kind == "grid":
+                if self._grid_executor is None:
+                    self._grid_executor = ProcessPoolExecutor(max_workers=self.grid_workers)
+                return self._grid_executor
+            if self._batch_executor is None:
+                self._batch_executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="heatmap-batch"
+                )
+            return self._batch_executor
+    
+    def process_parallel(self, location_batches: List[List[Dict]],
+                         location_ids: Optional[List[str]] = None,
+                         configs: Optional[List[Optional[HeatmapConfig]]] = None) -> List[Dict]:
+        """Process location batches on the bounded worker pool.
+        
+        Results keep the input order; a failing batch yields an error entry
+        instead of failing the others.
+        """
+        if location_ids is None:
+            location_ids = [f"batch_{i}" for i in range(len(location_batches))]
+        if configs is None:
+            configs = [None] * len(location_batches)
+        
+        executor = self._executor("batch")
+        futures = [
+            executor.submit(self.generate_heatmap, batch, location_id, config)
+            for batch, location_id, config in zip(location_batches, location_ids, configs)
+        ]
+        
+        results = []
+        for index, (future, location_id) in enumerate(zip(futures, location_ids)):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Batch {index} ({location_id}) failed: {e}")
+                results.append({"error": str(e), "index": index, "location_id": location_id})
         return results
+    
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the worker pools, letting queued work finish when wait is set."""
+        with self.lock:
+            executors = [e for e in (self._batch_executor, self._grid_executor) if e is not None]
+            self._batch_executor = self._grid_executor = None
+        for executor in executors:
+            executor.shutdown(wait=wait)
+        self.persister.close()
 
 
 if __name__ == "__main__":
@@ -204,4 +1340,4 @@ if __name__ == "__main__":
     ]
     
     heatmap = orchestrator.generate_heatmap(locations, "nyc_demo")
-    print(json.dumps(heatmap, indent=2))
+    print(json.dumps(codecs.to_jsonable(heatmap), indent=2))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Heatmap Rendering - Colorize intensity grids through lookup tables and encode them as images."""
+
+import io
+import struct
+import zlib
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:  # optional, needed for WebP only
+    Image = None
+
+# Intensity below which the overlay fades to transparent, as a fraction of the peak
+ALPHA_RAMP = 0.25
+
+PNG_COMPRESSION_LEVEL = 6
+
+WEBP_QUALITY = 80
+
+# (position, (r, g, b)) anchors; LUTs interpolate linearly between them
+COLOR_ANCHORS: Dict[str, List[Tuple[float, Tuple[int, int, int]]]] = {
+    "hot": [
+        (0.0, (0, 0, 0)), (0.365, (255, 0, 0)), (0.746, (255, 255, 0)), (1.0, (255, 255, 255)),
+    ],
+    "viridis": [
+        (0.0, (68, 1, 84)), (0.125, (71, 44, 122)), (0.25, (59, 81, 139)), (0.375, (44, 113, 142)),
+        (0.5, (33, 144, 141)), (0.625, (39, 173, 129)), (0.75, (92, 200, 99)), (0.875, (170, 220, 50)),
+        (1.0, (253, 231, 37)),
+    ],
+    "greys": [
+        (0.0, (255, 255, 255)), (1.0, (0, 0, 0)),
+    ],
+}
+
+CONTENT_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+
+def build_lut(anchors: List[Tuple[float, Tuple[int, int, int]]]) -> np.ndarray:
+    """256-entry RGBA table; alpha ramps up over the lowest ``ALPHA_RAMP`` of the range."""
+    positions = np.linspace(0.0, 1.0, 256)
+    stops = np.array([position for position, _ in anchors])
+    colors = np.array([color for _, color in anchors], dtype=np.float64)
+    lut = np.empty((256, 4), dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.rint(np.interp(positions, stops, colors[:, channel]))
+    lut[:, 3] = np.rint(np.clip(positions / ALPHA_RAMP, 0.0, 1.0) * 255)
+    return lut
+
+
+COLORMAPS: Dict[str, np.ndarray] = {name: build_lut(anchors) for name, anchors in COLOR_ANCHORS.items()}
+
+
+def colorize(intensity: np.ndarray, scheme: str = "hot") -> np.ndarray:
+    """Map a normalized [0, 1] grid to an (height, width, 4) uint8 RGBA image in one lookup."""
+    lut = COLORMAPS.get(scheme)
+    if lut is None:
+        raise ValueError(f"Unknown color scheme: {scheme}")
+    levels = np.rint(np.clip(intensity, 0.0, 1.0) * 255).astype(np.uint8)
+    return lut[levels]
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """Encode an RGBA image as PNG with the standard library only."""
+    height, width = rgba.shape[:2]
+    # Every scanline is prefixed with filter type 0 (none)
+    scanlines = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = rgba.reshape(height, width * 4)
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+        _png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), PNG_COMPRESSION_LEVEL)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+
+def encode_webp(rgba: np.ndarray) -> bytes:
+    """Encode an RGBA image as lossy WebP (requires Pillow)."""
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, mode="RGBA").save(buffer, format="WEBP", quality=WEBP_QUALITY)
+    return buffer.getvalue()
+
+
+ENCODERS: Dict[str, Callable[[np.ndarray], bytes]] = {"png": encode_png}
+if Image is not None:
+    ENCODERS["webp"] = encode_webp
+
+
+def render_image(intensity: np.ndarray, scheme: str = "hot", fmt: str = "png") -> bytes:
+    """Colorize a normalized grid and encode it in the requested image format."""
+    encoder = ENCODERS.get(fmt)
+    if encoder is None:
+        raise ValueError(f"Unsupported image format: {fmt} (available: {', '.join(ENCODERS)})")
+    return encoder(colorize(intensity, scheme))
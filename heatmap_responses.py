@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Response Encoding - Negotiate compact JSON, msgpack, raw grid and image bodies for heatmap results."""
+
+import gzip
+import json
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import msgpack
+import numpy as np
+from fastapi.responses import JSONResponse
+
+from heatmap_codecs import MIN_COMPRESS_BYTES, to_jsonable
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the standard library
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+GRID = "application/x-heatmap-grid"
+
+# output= shorthands; the order is the server preference when Accept ties
+OUTPUT_TYPES: Dict[str, str] = {
+    "json": JSON,
+    "msgpack": MSGPACK,
+    "grid": GRID,
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+MEDIA_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK}
+
+# magic | format version | width | height | south, west, north, east, max_intensity
+GRID_HEADER = struct.Struct("<4sIII5d")
+GRID_MAGIC = b"HMAP"
+GRID_VERSION = 1
+
+# Float arrays in JSON bodies are rounded like to_jsonable rounds them
+JSON_PRECISION = 4
+
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def _round_arrays(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return np.round(value, JSON_PRECISION) if value.dtype.kind == "f" else np.ascontiguousarray(value)
+    if isinstance(value, dict):
+        return {k: _round_arrays(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_round_arrays(v) for v in value]
+    return value
+
+
+def dumps_json(value: Any) -> bytes:
+    """Serialize a result to JSON, letting orjson write NumPy arrays directly when installed."""
+    if orjson is not None:
+        return orjson.dumps(_round_arrays(value), option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(to_jsonable(value, JSON_PRECISION), separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered through ``dumps_json``."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+def _msgpack_default(value: Any) -> Any:
+    # Float arrays become little-endian float32 bytes; the grid's width/height give the shape
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == "f":
+            return np.ascontiguousarray(value, dtype="<f4").tobytes()
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not msgpack serializable")
+
+
+def dumps_msgpack(value: Any) -> bytes:
+    """Serialize a result to plain msgpack that any client library can read."""
+    return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+
+
+def encode_grid(grid: Dict[str, Any]) -> bytes:
+    """Fixed header followed by the normalized intensities as row-major float32 LE, north row first."""
+    bounds = grid["bounds"]
+    header = GRID_HEADER.pack(
+        GRID_MAGIC, GRID_VERSION, grid["width"], grid["height"],
+        bounds["south"], bounds["west"], bounds["north"], bounds["east"], grid["max_intensity"]
+    )
+    return header + np.ascontiguousarray(grid["intensity"], dtype="<f4").tobytes()
+
+
+def decode_grid(body: bytes) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Inverse of ``encode_grid``, for clients written in Python."""
+    magic, version, width, height, south, west, north, east, peak = GRID_HEADER.unpack_from(body)
+    if magic != GRID_MAGIC or version != GRID_VERSION:
+        raise ValueError("Not a heatmap grid payload")
+    intensity = np.frombuffer(body, dtype="<f4", offset=GRID_HEADER.size).reshape(height, width)
+    bounds = {"south": south, "west": west, "north": north, "east": east}
+    return intensity, {"width": width, "height": height, "bounds": bounds, "max_intensity": peak}
+
+
+def _parse_header(header: Optional[str]) -> List[Tuple[str, float]]:
+    """``token;q=x`` items of an Accept-style header, in order."""
+    items = []
+    for part in (header or "").split(","):
+        token, *params = [piece.strip() for piece in part.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, val = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(val)
+                except ValueError:
+                    q = 0.0
+        items.append((token.lower(), q))
+    return items
+
+
+def negotiate(accept: Optional[str], offered: Sequence[str]) -> Optional[str]:
+    """Best offered media type for an Accept header; None when nothing offered is acceptable."""
+    if not accept:
+        return offered[0]
+    best, best_q = None, 0.0
+    for rank, media_type in enumerate(offered):
+        main_type = media_type.split("/")[0]
+        q = 0.0
+        specificity = -1
+        for token, token_q in _parse_header(accept):
+            token = MEDIA_ALIASES.get(token, token)
+            if token == media_type:
+                level = 2
+            elif token == f"{main_type}/*":
+                level = 1
+            elif token == "*/*":
+                level = 0
+            else:
+                continue
+            if level > specificity:
+                specificity, q = level, token_q
+        if q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Preferred content coding the client accepts: brotli when installed, else gzip."""
+    accepted = {token: q for token, q in _parse_header(accept_encoding) if q > 0}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Apply a content coding to bodies large enough to benefit."""
+    if encoding is None or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    return gzip.compress(body, GZIP_LEVEL), "gzip"
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Single Flight - Collapse concurrent calls for the same key into one execution."""
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """Per-key call deduplication.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for and share its result, or its exception. Nothing is
+    remembered once the call finishes, so this sits in front of a cache
+    rather than replacing one.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _run(self, key: str, future: Future, fn: Callable[[], Any]) -> None:
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """fn() run once for all concurrent callers with this key."""
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, fn)
+        return future.result()
+
+    def submit(self, key: str, fn: Callable[[], Any]) -> Future:
+        """Start fn() on a background thread unless a call for key is already running."""
+        future, leader = self._join(key)
+        if leader:
+            # A dedicated thread, not a shared pool, so a pool full of waiting callers cannot starve it
+            threading.Thread(target=self._run, args=(key, future, fn), name=f"singleflight-{key[:32]}",
+                             daemon=True).start()
+        return future
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_flight": len(self._calls), "coalesced": self.coalesced}
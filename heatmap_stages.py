@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Pipeline Stages - Timed, hookable heatmap pipeline stages with per-request Server-Timing."""
+
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, ContextManager, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from heatmap_metrics import STAGE_ERRORS, STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# (stage, seconds) pairs recorded for the current request, if one is collecting
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("heatmap_stage_timings", default=None)
+
+# A hook is called with the stage name and returns a context manager wrapped around the stage
+StageHook = Callable[[str], ContextManager]
+_hooks: List[StageHook] = []
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def add_stage_hook(hook: StageHook) -> None:
+    """Wrap every subsequent stage in ``hook(stage_name)``."""
+    _hooks.append(hook)
+
+
+def remove_stage_hook(hook: StageHook) -> None:
+    _hooks.remove(hook)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Run a block as a named pipeline stage.
+
+    The duration goes to ``heatmap_stage_duration_seconds`` and, inside
+    ``collect_timings``, to the request's timing list. Stages nest; an outer
+    stage's time includes its inner stages.
+    """
+    timings = _timings.get()
+    with ExitStack() as hooks:
+        for hook in list(_hooks):
+            hooks.enter_context(hook(name))
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            STAGE_ERRORS.labels(name).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_LATENCY.labels(name).observe(elapsed)
+            if timings is not None:
+                timings.append((name, elapsed))
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorator running every call of a function as ``stage(name)``."""
+    def decorate(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def collect_timings() -> Iterator[List[Tuple[str, float]]]:
+    """Record stages run in this context, and in contexts copied from it, into a fresh list."""
+    timings: List[Tuple[str, float]] = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def server_timing(timings: Sequence[Tuple[str, float]], total: Optional[float] = None) -> str:
+    """Server-Timing header value; repeated stages are summed and keep first-seen order."""
+    durations = {}
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0.0) + seconds
+    if total is not None:
+        durations["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in durations.items())
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that reports the request's stage timings in a ``Server-Timing`` header.
+
+    Endpoints finish their work before the response starts, so every stage
+    is known when the headers go out; ``total`` is the time up to that point.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        with collect_timings() as timings:
+            async def timing_send(message):
+                if message["type"] == "http.response.start":
+                    value = server_timing(timings, time.perf_counter() - start)
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode())]
+                await send(message)
+
+            await self.app(scope, receive, timing_send)
+
+
+class SamplingProfiler:
+    """Stage hook that runs cProfile over a random sample of stage executions.
+
+    Sampled profiles are written to ``output_dir`` as ``.prof`` files when it
+    is set (for snakeviz/pstats), otherwise the ``top`` hottest functions are
+    logged. Only the outermost sampled stage per thread is profiled.
+    """
+
+    def __init__(self, sample_rate: float = 0.01, output_dir: Optional[str] = None,
+                 top: int = 15, stages: Optional[Sequence[str]] = None):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.top = top
+        self.stages = set(stages) if stages else None
+        self._local = threading.local()
+
+    def __call__(self, name: str) -> ContextManager:
+        if (getattr(self._local, "active", False) or (self.stages and name not in self.stages)
+                or random.random() >= self.sample_rate):
+            return nullcontext()
+        return self._profile(name)
+
+    @contextmanager
+    def _profile(self, name: str) -> Iterator[None]:
+        profiler = cProfile.Profile()
+        self._local.active = True
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._local.active = False
+            self._report(name, profiler)
+
+    def _report(self, name: str, profiler: cProfile.Profile) -> None:
+        if self.output_dir:
+            path = os.path.join(self.output_dir, f"{name}-{time.time_ns()}.prof")
+            profiler.dump_stats(path)
+            logger.info(f"Profiled stage {name} to {path}")
+            return
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(self.top)
+        logger.info(f"Profile of stage {name}:\n{out.getvalue()}")
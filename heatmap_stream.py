@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Stream Ingestion - Fold NDJSON, CSV or binary point uploads into a grid as they arrive."""
+
+import csv
+import io
+import json
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from heatmap_grid import GridAccumulator
+from heatmap_orchestrator import LocationColumns, ScoreItemsStep
+
+# Bytes buffered before a block of whole records is handed to the parser
+BLOCK_BYTES = 1 << 20
+
+# Binary uploads are little-endian float64 (latitude, longitude, value) triples
+BINARY_RECORD = np.dtype([("latitude", "<f8"), ("longitude", "<f8"), ("value", "<f8")])
+
+CONTENT_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonlines": "ndjson",
+    "text/csv": "csv",
+    "application/octet-stream": "binary",
+}
+
+CSV_FIELDS = ("latitude", "longitude", "value", "category")
+
+
+def format_for(content_type: Optional[str]) -> Optional[str]:
+    """Stream format implied by a Content-Type header."""
+    if not content_type:
+        return None
+    return CONTENT_TYPES.get(content_type.split(";", 1)[0].strip().lower())
+
+
+class StreamIngestor:
+    """Parses one upload block by block into a GridAccumulator.
+
+    The event loop only buffers bytes and cuts them at record boundaries;
+    parsing, scoring and binning of each block run through ``run`` (normally
+    the generation executor), so memory is one block plus one grid.
+    """
+
+    def __init__(self, fmt: str, accumulator: GridAccumulator, scorer: ScoreItemsStep):
+        if fmt not in ("ndjson", "csv", "binary"):
+            raise ValueError(f"Unsupported stream format: {fmt}")
+        self.fmt = fmt
+        self.accumulator = accumulator
+        self.scorer = scorer
+        self._csv_columns: Optional[Dict[str, int]] = None
+
+    async def feed(self, chunks: AsyncIterator[bytes],
+                   run: Callable[..., Awaitable[None]]) -> GridAccumulator:
+        """Consume the whole stream, ingesting complete blocks as they fill up."""
+        buffer = bytearray()
+        async for chunk in chunks:
+            buffer += chunk
+            if len(buffer) >= BLOCK_BYTES:
+                cut = self._cut(buffer)
+                if cut:
+                    block = bytes(buffer[:cut])
+                    del buffer[:cut]
+                    await run(self.ingest_block, block)
+        if buffer:
+            if self.fmt == "binary" and len(buffer) % BINARY_RECORD.itemsize:
+                raise ValueError(f"Binary stream is not a whole number of {BINARY_RECORD.itemsize}-byte records")
+            await run(self.ingest_block, bytes(buffer))
+        return self.accumulator
+
+    def _cut(self, buffer: bytearray) -> int:
+        """Length of the longest prefix holding only complete records."""
+        if self.fmt == "binary":
+            return len(buffer) - len(buffer) % BINARY_RECORD.itemsize
+        return buffer.rfind(b"\n") + 1
+
+    def ingest_block(self, block: bytes) -> None:
+        """Parse one block of complete records and add it to the grid."""
+        points = self._parse(block)
+        if len(points):
+            weights = self.scorer.score_batch(points)
+            self.accumulator.add(points.latitude, points.longitude, weights, points.value)
+
+    def _parse(self, block: bytes) -> LocationColumns:
+        if self.fmt == "binary":
+            records = np.frombuffer(block, dtype=BINARY_RECORD)
+            points = LocationColumns.from_columns(records["latitude"], records["longitude"], records["value"])
+        elif self.fmt == "ndjson":
+            points = self._parse_ndjson(block)
+        else:
+            points = self._parse_csv(block)
+        points.require_finite(f"{self.fmt} record")
+        return points
+
+    def _parse_ndjson(self, block: bytes) -> LocationColumns:
+        try:
+            records = [json.loads(line) for line in block.splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid NDJSON record: {e}")
+        for record in records:
+            if not isinstance(record, dict):
+                raise ValueError(f"Invalid NDJSON record: expected an object, got {type(record).__name__}")
+        try:
+            return LocationColumns.from_records(records)
+        except KeyError as e:
+            raise ValueError(f"Invalid NDJSON record: missing {e}")
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid NDJSON record: {e}")
+
+    def _parse_csv(self, block: bytes) -> LocationColumns:
+        rows: List[List[str]] = [row for row in csv.reader(io.StringIO(block.decode())) if row]
+        if self._csv_columns is None and rows:
+            header = [field.strip().lower() for field in rows[0]]
+            if "latitude" in header:
+                rows = rows[1:]
+                self._csv_columns = {name: header.index(name) for name in CSV_FIELDS if name in header}
+            else:
+                self._csv_columns = {name: i for i, name in enumerate(CSV_FIELDS)}
+        if not rows:
+            return LocationColumns.from_columns([], [], [])
+
+        columns = self._csv_columns
+        try:
+            table = [[row[columns[name]] for name in CSV_FIELDS[:3]] for row in rows]
+            numbers = np.array(table, dtype=np.float64)
+        except (IndexError, KeyError, ValueError) as e:
+            raise ValueError(f"Invalid CSV record: {e}")
+        category = None
+        if "category" in columns:
+            index = columns["category"]
+            category = [row[index] if index < len(row) else None for row in rows]
+        return LocationColumns.from_columns(numbers[:, 0], numbers[:, 1], numbers[:, 2], category)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Tile Pyramid - Web-Mercator slippy-map tiles built from cached higher-zoom rasters."""
+
+import math
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from heatmap_grid import DensityGrid, blur
+
+TILE_SIZE = 256
+
+# Tiles holding at most this many points are binned directly instead of
+# being assembled from their four children
+LEAF_POINTS = 4096
+
+# Web-Mercator is undefined at the poles; clamp like every slippy-map client
+MAX_LATITUDE = 85.05112878
+
+
+def project(latitudes: np.ndarray, longitudes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Project degrees to normalized Web-Mercator coordinates in [0, 1)."""
+    lat = np.radians(np.clip(latitudes, -MAX_LATITUDE, MAX_LATITUDE))
+    u = (longitudes + 180.0) / 360.0
+    v = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return np.clip(u, 0.0, np.nextafter(1.0, 0.0)), np.clip(v, 0.0, np.nextafter(1.0, 0.0))
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Return (south, west, north, east) of a tile in degrees."""
+    n = 2 ** z
+
+    def _lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return _lat(y + 1), x / n * 360.0 - 180.0, _lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_exists(z: int, x: int, y: int) -> bool:
+    """Check tile coordinates are inside the pyramid at zoom z."""
+    return z >= 0 and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def neighbourhood(z: int, x: int, y: int, blur_radius: int) -> List[Tuple[int, int, Tuple[int, int, int]]]:
+    """(dx, dy, tile) for a tile and each neighbour its blur reads, wrapping across the antimeridian."""
+    n = 2 ** z
+    margin = min(max(blur_radius, 0), TILE_SIZE)
+    return [(dx, dy, (z, (x + dx) % n, y + dy)) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+            if 0 <= y + dy < n and (margin or not (dx or dy))]
+
+
+def densest_tile(latitudes: np.ndarray, longitudes: np.ndarray, weights: np.ndarray, z: int) -> Tuple[int, int]:
+    """(x, y) of the zoom-z tile holding the heaviest single pixel."""
+    u, v = project(np.asarray(latitudes, dtype=np.float64), np.asarray(longitudes, dtype=np.float64))
+    size = 2 ** z * TILE_SIZE
+    pixels = (v * size).astype(np.int64) * size + (u * size).astype(np.int64)
+    unique, inverse = np.unique(pixels, return_inverse=True)
+    densest = int(unique[np.bincount(inverse, weights=weights).argmax()])
+    return densest % size // TILE_SIZE, densest // size // TILE_SIZE
+
+
+def viewport_pixels(bounds: Tuple[float, float, float, float], zoom: int) -> int:
+    """Longer side, in screen pixels, of a bounding box displayed at ``zoom``."""
+    south, west, north, east = bounds
+    u, v = project(np.array([north, south]), np.array([west, east]))
+    return int(math.ceil(max(u[1] - u[0], v[1] - v[0]) * TILE_SIZE * 2 ** zoom))
+
+
+def encode_raw(raw: Optional[np.ndarray]) -> Dict[str, Any]:
+    """Sparse form of an unblurred tile raster."""
+    if raw is None:
+        return {"index": np.zeros(0, dtype=np.int32), "weight": np.zeros(0)}
+    flat = raw.ravel()
+    index = np.flatnonzero(flat)
+    return {"index": index.astype(np.int32), "weight": flat[index]}
+
+
+def decode_raw(payload: Dict[str, Any]) -> Optional[np.ndarray]:
+    """Inverse of ``encode_raw``; empty tiles decode to None."""
+    if len(payload["index"]) == 0:
+        return None
+    flat = np.zeros(TILE_SIZE * TILE_SIZE, dtype=np.float64)
+    flat[np.asarray(payload["index"], dtype=np.intp)] = payload["weight"]
+    return flat.reshape(TILE_SIZE, TILE_SIZE)
+
+
+class TilePyramid:
+    """Raw (unblurred) tile rasters for one point set, cached per tile.
+
+    A tile at zoom z is the 2x2 sum-downsample of its four children at z + 1,
+    so zooming out reuses every raster already built for deeper zooms. Tiles
+    with few points, or at ``max_zoom``, are binned straight from the points.
+    """
+
+    def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray, weights: np.ndarray,
+                 max_zoom: int, get_many: Callable[[Sequence[str]], Dict[str, Any]],
+                 cache_many: Callable[[Dict[str, Any]], bool], key_prefix: str,
+                 leaf_points: int = LEAF_POINTS):
+        self.u, self.v = project(np.asarray(latitudes, dtype=np.float64),
+                                 np.asarray(longitudes, dtype=np.float64))
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.max_zoom = max_zoom
+        self.leaf_points = leaf_points
+        self.get_many = get_many
+        self.cache_many = cache_many
+        self.key_prefix = key_prefix
+
+    def raw_tile(self, z: int, x: int, y: int, subset: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Unblurred raster of one tile, or None when it holds no points."""
+        return self.raw_tiles([(z, x, y)], subset)[0]
+
+    def raw_tiles(self, tiles: Sequence[Tuple[int, int, int]],
+                  subset: Optional[np.ndarray] = None) -> List[Optional[np.ndarray]]:
+        """Rasters of several tiles; cached ones are read, and new ones written, in one bulk call each."""
+        keys = [f"{self.key_prefix}_{z}_{x}_{y}" for z, x, y in tiles]
+        cached = self.get_many(keys)
+        # At zoom 0 the wrapped neighbours are the tile itself, so keys can repeat
+        rasters = {key: decode_raw(payload) for key, payload in cached.items()}
+        built = {}
+        for key, (z, x, y) in zip(keys, tiles):
+            if key not in rasters:
+                rasters[key] = self._build(z, x, y, subset)
+                built[key] = encode_raw(rasters[key])
+        if built:
+            self.cache_many(built)
+        return [rasters[key] for key in keys]
+
+    def _build(self, z: int, x: int, y: int, subset: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if subset is None:
+            subset = np.arange(self.u.size)
+        scale = 2 ** z
+        gx = self.u[subset] * scale
+        gy = self.v[subset] * scale
+        subset = subset[(gx >= x) & (gx < x + 1) & (gy >= y) & (gy < y + 1)]
+
+        if subset.size == 0:
+            return None
+        if z >= self.max_zoom or subset.size <= self.leaf_points:
+            return self._bin(z, x, y, subset)
+        raw = np.zeros((2 * TILE_SIZE, 2 * TILE_SIZE))
+        children = [(dx, dy) for dy in (0, 1) for dx in (0, 1)]
+        rasters = self.raw_tiles([(z + 1, 2 * x + dx, 2 * y + dy) for dx, dy in children], subset)
+        for (dx, dy), child in zip(children, rasters):
+            if child is not None:
+                raw[dy * TILE_SIZE:(dy + 1) * TILE_SIZE, dx * TILE_SIZE:(dx + 1) * TILE_SIZE] = child
+        return raw.reshape(TILE_SIZE, 2, TILE_SIZE, 2).sum(axis=(1, 3))
+
+    def _bin(self, z: int, x: int, y: int, subset: np.ndarray) -> np.ndarray:
+        scale = 2 ** z * TILE_SIZE
+        cols = (self.u[subset] * scale).astype(np.intp) - x * TILE_SIZE
+        rows = (self.v[subset] * scale).astype(np.intp) - y * TILE_SIZE
+        np.clip(cols, 0, TILE_SIZE - 1, out=cols)
+        np.clip(rows, 0, TILE_SIZE - 1, out=rows)
+        flat = np.bincount(rows * TILE_SIZE + cols, weights=self.weights[subset],
+                           minlength=TILE_SIZE * TILE_SIZE)
+        return flat.reshape(TILE_SIZE, TILE_SIZE)
+
+    def render_tile(self, z: int, x: int, y: int, blur_radius: int) -> DensityGrid:
+        """Blurred tile, including kernel spill-over from the eight neighbours."""
+        margin = min(max(blur_radius, 0), TILE_SIZE)
+        size = TILE_SIZE + 2 * margin
+        mosaic = np.zeros((size, size))
+
+        tiles = neighbourhood(z, x, y, blur_radius)
+        rasters = self.raw_tiles([tile for _, _, tile in tiles])
+        for (dx, dy, _), raw in zip(tiles, rasters):
+            if raw is None:
+                continue
+            # Paste the part of the neighbour that falls inside the margin window
+            top = margin + dy * TILE_SIZE
+            left = margin + dx * TILE_SIZE
+            r0, c0 = max(top, 0), max(left, 0)
+            r1, c1 = min(top + TILE_SIZE, size), min(left + TILE_SIZE, size)
+            mosaic[r0:r1, c0:c1] = raw[r0 - top:r1 - top, c0 - left:c1 - left]
+
+        blurred = blur(mosaic, blur_radius)
+        center = blurred[margin:margin + TILE_SIZE, margin:margin + TILE_SIZE]
+        return DensityGrid(intensity=center, bounds=tile_bounds(z, x, y))
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Time Windows - Ring buffers of per-interval grids for rolling and decayed heatmap queries."""
+
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from heatmap_grid import Bounds, DensityGrid, blur, cell_index
+
+MINUTE = 60
+HOUR = 3600
+
+# (bucket_seconds, buckets) per ring: an hour of minutes and two days of hours
+DEFAULT_TIERS: Tuple[Tuple[int, int], ...] = ((MINUTE, 60), (HOUR, 48))
+
+# How far past the server clock a timestamp may be; a single far-future
+# bucket would otherwise push every real point out of the rings
+MAX_CLOCK_SKEW_SECONDS = 300
+
+
+def check_timestamps(timestamps: Optional[np.ndarray], now: float) -> None:
+    """Raise ValueError if any timestamp is later than ``now`` plus the allowed clock skew."""
+    if timestamps is None:
+        return
+    ahead = int(np.count_nonzero(timestamps > now + MAX_CLOCK_SKEW_SECONDS))
+    if ahead:
+        raise ValueError(f"{ahead} timestamps are more than {MAX_CLOCK_SKEW_SECONDS}s in the future "
+                         f"(timestamps are epoch seconds)")
+
+
+class BucketRing:
+    """A fixed number of raw grids, one per ``bucket_seconds`` interval.
+
+    Bucket ``b`` (``floor(timestamp / bucket_seconds)``) lives in slot
+    ``b % size``; a newer bucket recycles the slot, so memory is bounded by
+    ``size`` grids however long the history. Grids are allocated on first use.
+
+    Slot grids can be stored apart from the small ``header``: ``dirty`` names
+    the slots ``add`` changed, and a ring rebuilt from its header only needs
+    the grids a query or an append touches (see ``load``).
+    """
+
+    def __init__(self, bucket_seconds: int, size: int, shape: Tuple[int, int]):
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self.shape = shape
+        self.epochs = np.full(size, -1, dtype=np.int64)
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.value_sums = np.zeros(size, dtype=np.float64)
+        self.value_maxes = np.full(size, float("-inf"))
+        self.grids: Dict[int, np.ndarray] = {}
+        self.newest = -1
+        self.dirty: Set[int] = set()
+
+    @property
+    def span_seconds(self) -> int:
+        return self.bucket_seconds * self.size
+
+    def _buckets(self, timestamps: np.ndarray) -> np.ndarray:
+        return np.floor(timestamps / self.bucket_seconds).astype(np.int64)
+
+    def slots_for(self, timestamps: np.ndarray) -> List[int]:
+        """Occupied slots whose grids ``add`` would accumulate into for these timestamps."""
+        buckets = np.unique(self._buckets(timestamps))
+        slots = buckets % self.size
+        return [int(slot) for slot in slots[self.epochs[slots] == buckets]]
+
+    def window_slots(self, window_seconds: float, now: float) -> np.ndarray:
+        """Slots of the buckets overlapping ``(now - window_seconds, now]``."""
+        end = math.floor(now / self.bucket_seconds)
+        start = math.floor((now - window_seconds) / self.bucket_seconds) + 1
+        return np.flatnonzero((self.epochs >= max(start, end - self.size + 1)) & (self.epochs <= end))
+
+    def load(self, grids: Dict[int, np.ndarray]) -> None:
+        """Supply slot grids stored apart from the header; occupied slots left out are dropped."""
+        for slot, grid in grids.items():
+            self.grids[slot] = np.array(grid, dtype=np.float32)
+
+    def forget_unloaded(self, slots: Sequence[int]) -> None:
+        """Reset the given slots whose grids could not be loaded, e.g. because they expired."""
+        for slot in slots:
+            if slot not in self.grids:
+                self.epochs[slot] = -1
+                self.counts[slot] = 0
+                self.value_sums[slot] = 0.0
+                self.value_maxes[slot] = float("-inf")
+
+    def add(self, timestamps: np.ndarray, flat: np.ndarray, weights: np.ndarray, values: np.ndarray) -> None:
+        """Fold points (already reduced to flat cell indices) into their buckets."""
+        buckets = self._buckets(timestamps)
+        self.newest = max(self.newest, int(buckets.max()))
+        # Points older than the ring's span have nowhere to go
+        keep = buckets > self.newest - self.size
+        if not keep.all():
+            buckets, flat, weights, values = buckets[keep], flat[keep], weights[keep], values[keep]
+        if buckets.size == 0:
+            return
+
+        cells = self.shape[0] * self.shape[1]
+        unique, inverse = np.unique(buckets, return_inverse=True)
+        sums = np.bincount(inverse * cells + flat, weights=weights, minlength=unique.size * cells)
+        counts = np.bincount(inverse, minlength=unique.size)
+        value_sums = np.bincount(inverse, weights=values, minlength=unique.size)
+        value_maxes = np.full(unique.size, float("-inf"))
+        np.maximum.at(value_maxes, inverse, values)
+
+        for i, bucket in enumerate(unique):
+            slot = int(bucket % self.size)
+            grid = sums[i * cells:(i + 1) * cells].reshape(self.shape)
+            if self.epochs[slot] != bucket:
+                self.epochs[slot] = bucket
+                self.grids[slot] = grid.astype(np.float32)
+                self.counts[slot] = 0
+                self.value_sums[slot] = 0.0
+                self.value_maxes[slot] = float("-inf")
+            else:
+                self.grids[slot] += grid
+            self.counts[slot] += counts[i]
+            self.value_sums[slot] += value_sums[i]
+            self.value_maxes[slot] = max(self.value_maxes[slot], value_maxes[i])
+            self.dirty.add(slot)
+
+    def query(self, window_seconds: float, now: float,
+              half_life_seconds: Optional[float] = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """Raw grid and summary over the buckets overlapping ``(now - window_seconds, now]``.
+
+        With ``half_life_seconds`` each bucket is weighted by
+        ``0.5 ** (age / half_life)``, age measured to the bucket midpoint.
+        Cost is O(buckets in window * cells), independent of point count.
+        """
+        slots = self.window_slots(window_seconds, now)
+
+        raw = np.zeros(self.shape, dtype=np.float64)
+        for slot in slots:
+            factor = 1.0
+            if half_life_seconds:
+                age = max(now - (self.epochs[slot] + 0.5) * self.bucket_seconds, 0.0)
+                factor = 0.5 ** (age / half_life_seconds)
+            raw += factor * self.grids[slot]
+
+        count = int(self.counts[slots].sum())
+        return raw, {
+            "total_points": count,
+            "avg_value": float(self.value_sums[slots].sum()) / count if count else 0,
+            "max_value": float(self.value_maxes[slots].max()) if count else 0,
+            "buckets": int(slots.size),
+            "bucket_seconds": self.bucket_seconds,
+        }
+
+    def header(self) -> Dict[str, Any]:
+        """Per-slot bookkeeping without the grids; a few KB whatever the grid size."""
+        return {
+            "bucket_seconds": self.bucket_seconds,
+            "size": self.size,
+            "newest": self.newest,
+            "epochs": self.epochs,
+            "counts": self.counts,
+            "value_sums": self.value_sums,
+            "value_maxes": self.value_maxes,
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        """Cacheable snapshot holding only occupied slots."""
+        slots = sorted(self.grids)
+        state = self.header()
+        state["slots"] = np.array(slots, dtype=np.int64)
+        state["grids"] = np.stack([self.grids[s] for s in slots]) if slots else np.zeros((0,) + self.shape, np.float32)
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], shape: Tuple[int, int]) -> "BucketRing":
+        """Rebuild from ``to_state`` or ``header`` output; arrays are copied so they are writable."""
+        ring = cls(state["bucket_seconds"], state["size"], shape)
+        ring.newest = state["newest"]
+        ring.epochs = np.array(state["epochs"], dtype=np.int64)
+        ring.counts = np.array(state["counts"], dtype=np.int64)
+        ring.value_sums = np.array(state["value_sums"], dtype=np.float64)
+        ring.value_maxes = np.array(state["value_maxes"], dtype=np.float64)
+        if "grids" in state:
+            grids = np.array(state["grids"], dtype=np.float32)
+            ring.grids = {int(slot): grids[i] for i, slot in enumerate(state["slots"])}
+            # Grids that came inline still need writing to their own keys
+            ring.dirty = set(ring.grids)
+        return ring
+
+
+class WindowedGrid:
+    """Time-bucketed rasters over fixed bounds at several granularities.
+
+    Every point is added to each ring; a query is answered by the finest
+    ring whose span covers the window, so "last 15 minutes" sums minute
+    buckets and "last 24 hours" sums hour buckets. Windows are resolved to
+    bucket granularity.
+    """
+
+    def __init__(self, bounds: Bounds, resolution: int,
+                 tiers: Sequence[Tuple[int, int]] = DEFAULT_TIERS):
+        self.bounds = bounds
+        self.resolution = resolution
+        self.rings = [BucketRing(seconds, size, (resolution, resolution)) for seconds, size in sorted(tiers)]
+
+    @property
+    def retention_seconds(self) -> int:
+        return max(ring.span_seconds for ring in self.rings)
+
+    def add(self, latitudes: np.ndarray, longitudes: np.ndarray, weights: np.ndarray,
+            timestamps: np.ndarray, values: Optional[np.ndarray] = None) -> int:
+        """Bucket a batch of timestamped points; returns how many fell inside the bounds."""
+        values = weights if values is None else values
+        flat, inside = cell_index(latitudes, longitudes, self.bounds, self.resolution, self.resolution)
+        inside &= np.isfinite(timestamps)
+        if not inside.all():
+            flat, weights, timestamps, values = flat[inside], weights[inside], timestamps[inside], values[inside]
+        if flat.size:
+            for ring in self.rings:
+                ring.add(timestamps, flat, weights, values)
+        return int(flat.size)
+
+    def ring_for(self, window_seconds: float) -> BucketRing:
+        """Finest ring that still covers the window."""
+        for ring in self.rings:
+            if ring.span_seconds >= window_seconds:
+                return ring
+        raise ValueError(f"Window of {window_seconds}s exceeds retention of {self.retention_seconds}s")
+
+    def render(self, window_seconds: float, blur_radius: int, now: Optional[float] = None,
+               half_life_seconds: Optional[float] = None) -> Tuple[DensityGrid, Dict[str, Any]]:
+        """Blurred grid and summary for the window ending at ``now``."""
+        now = time.time() if now is None else now
+        raw, summary = self.ring_for(window_seconds).query(window_seconds, now, half_life_seconds)
+        return DensityGrid(intensity=blur(raw, blur_radius), bounds=self.bounds), summary
+
+    def to_state(self) -> Dict[str, Any]:
+        """Cacheable snapshot of every ring."""
+        return {
+            "bounds": list(self.bounds),
+            "resolution": self.resolution,
+            "rings": [ring.to_state() for ring in self.rings],
+        }
+
+    def header(self) -> Dict[str, Any]:
+        """``to_state`` without the slot grids, which are stored per slot (see ``take_dirty``)."""
+        return {
+            "bounds": list(self.bounds),
+            "resolution": self.resolution,
+            "rings": [ring.header() for ring in self.rings],
+        }
+
+    def slots_for(self, timestamps: np.ndarray) -> List[Tuple[int, int]]:
+        """(ring, slot) grids an ``add`` of these timestamps accumulates into and so must load first."""
+        finite = timestamps[np.isfinite(timestamps)]
+        if not finite.size:
+            return []
+        return [(i, slot) for i, ring in enumerate(self.rings) for slot in ring.slots_for(finite)]
+
+    def load(self, grids: Dict[Tuple[int, int], np.ndarray], wanted: Sequence[Tuple[int, int]]) -> None:
+        """Supply the wanted (ring, slot) grids; wanted slots missing from grids are reset."""
+        for i, ring in enumerate(self.rings):
+            ring.load({slot: grid for (r, slot), grid in grids.items() if r == i})
+            ring.forget_unloaded([slot for r, slot in wanted if r == i])
+
+    def take_dirty(self) -> Dict[Tuple[int, int], np.ndarray]:
+        """(ring, slot) grids changed since the last call, to be written back."""
+        dirty = {}
+        for i, ring in enumerate(self.rings):
+            dirty.update(((i, slot), ring.grids[slot]) for slot in ring.dirty)
+            ring.dirty.clear()
+        return dirty
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "WindowedGrid":
+        """Rebuild from ``to_state`` or ``header`` output; after a header, ``load`` the grids needed."""
+        grid = cls(tuple(state["bounds"]), state["resolution"], tiers=())
+        shape = (grid.resolution, grid.resolution)
+        grid.rings = [BucketRing.from_state(ring, shape) for ring in state["rings"]]
+        return grid
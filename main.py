@@ -1,27 +1,289 @@
 #!/usr/bin/env python3
 """FastAPI Application for Heatmap SaaS API."""
 
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Union
+import asyncio
+import hashlib
 import logging
-from heatmap_orchestrator import HeatmapOrchestrator, HeatmapConfig
+import os
+import signal
+import tempfile
+import threading
+import time
+import numpy as np
+from heatmap_orchestrator import HeatmapOrchestrator, HeatmapConfig, LocationColumns, PersistStep, RateLimiter, tier_quotas
+from pricing import PRICE_TIERS
+from heatmap_codecs import to_jsonable
+from heatmap_executor import GenerationExecutor, QueueFullError
+import heatmap_jobs
+from heatmap_metrics import PipelineCollector, PrometheusMiddleware
+from heatmap_stages import SamplingProfiler, ServerTimingMiddleware, add_stage_hook, stage, timed
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+from heatmap_stream import StreamIngestor, format_for
+from heatmap_render import COLORMAPS, ENCODERS
+from heatmap_responses import (
+    FastJSONResponse, GRID, JSON, OUTPUT_TYPES, choose_encoding, compress, dumps_json, dumps_msgpack,
+    encode_grid, negotiate
+)
+from dataclasses import replace
 from datetime import datetime
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def _load_key_tiers(spec: str) -> Dict[str, str]:
+    """Parse ``key:tier,key:tier`` into an API key -> pricing tier map."""
+    pairs = (item.split(":", 1) for item in spec.split(",") if ":" in item)
+    return {key.strip(): tier.strip() for key, tier in pairs}
+
+
+# Per-customer quotas from the pricing tiers; Redis makes them hold across replicas
+API_KEY_TIERS = _load_key_tiers(os.getenv("HEATMAP_API_KEY_TIERS", ""))
+
+# Seconds /health fails after SIGTERM while requests are still served, so load balancers move away first
+DRAIN_NOTICE = float(os.getenv("HEATMAP_DRAIN_NOTICE", "10"))
+
+# Seconds generation work still running after the last request closed gets before the pools are torn down
+DRAIN_TIMEOUT = float(os.getenv("HEATMAP_DRAIN_TIMEOUT", "10"))
+
+# Touched on the first SIGTERM; the workers of one server (same parent) all fail /health once it exists
+DRAIN_MARKER = os.path.join(tempfile.gettempdir(), f"heatmap-draining-{os.getppid()}")
+_STARTED_AT = time.time()
+draining = False
+
+# Per-worker services, built by start_services() in each server process rather than at import
+orchestrator: Optional[HeatmapOrchestrator] = None
+generation_executor: Optional[GenerationExecutor] = None
+customer_limiter: Optional[RateLimiter] = None
+job_queue: Optional[heatmap_jobs.JobQueue] = None
+_collector: Optional[PipelineCollector] = None
+
+
+def _per_worker(name: str) -> int:
+    """Setting from the environment, else this machine's cores split across the WEB_CONCURRENCY workers."""
+    if os.getenv(name):
+        return int(os.getenv(name))
+    return max(1, (os.cpu_count() or 1) // max(1, int(os.getenv("WEB_CONCURRENCY", "1"))))
+
+
+def start_services() -> None:
+    """Build this process's orchestrator, executor, limiter and job queue and register its metrics."""
+    global orchestrator, generation_executor, customer_limiter, job_queue, _collector
+    orchestrator = HeatmapOrchestrator(
+        grid_workers=_per_worker("HEATMAP_GRID_WORKERS"),
+        persister=PersistStep(redis_url=os.getenv("REDIS_URL"))
+    )
+    
+    # Large uploads can run as background jobs on Celery workers instead of inside the request
+    job_queue = heatmap_jobs.configure(orchestrator)
+    
+    # Blocking orchestrator work (Redis I/O, scoring, rendering) runs here, never on the event loop
+    generation_executor = GenerationExecutor(
+        max_concurrency=_per_worker("HEATMAP_MAX_CONCURRENCY"),
+        max_queue=int(os.getenv("HEATMAP_MAX_QUEUE", 64))
+    )
+    
+    customer_limiter = RateLimiter(
+        tier_limits=tier_quotas(PRICE_TIERS),
+        redis_client=orchestrator.persister.redis_client,
+        breaker=orchestrator.persister.breaker
+    )
+    
+    _collector = PipelineCollector(
+        orchestrator.persister, generation_executor,
+        {"customer": customer_limiter}
+    )
+    REGISTRY.register(_collector)
+
+
+def stop_services() -> None:
+    """Shut down this process's pools and unregister its metrics."""
+    global _collector
+    generation_executor.shutdown(wait=True)
+    orchestrator.shutdown(wait=True)
+    if _collector is not None:
+        REGISTRY.unregister(_collector)
+        _collector = None
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def _drain_started() -> Optional[float]:
+    """When this server began draining, or None; markers older than this process are leftovers."""
+    try:
+        started = os.stat(DRAIN_MARKER).st_mtime
+    except FileNotFoundError:
+        return None
+    return started if started >= _STARTED_AT else None
+
+
+def is_draining() -> bool:
+    return draining or _drain_started() is not None
+
+
+def begin_drain(stop: Callable[[], None]) -> None:
+    """SIGTERM handler: fail /health for DRAIN_NOTICE seconds, then call stop.
+    
+    uvicorn's supervisor signals its workers one at a time, so workers after
+    the first find the marker already old and stop without a second notice.
+    """
+    global draining
+    if draining:
+        return
+    draining = True
+    started = _drain_started()
+    if started is None:
+        started = time.time()
+        open(DRAIN_MARKER, "a").close()
+        os.utime(DRAIN_MARKER, (started, started))
+    delay = max(0.0, started + DRAIN_NOTICE - time.time())
+    logger.info(f"Worker {os.getpid()} draining; stopping in {delay:.1f}s")
+    asyncio.get_running_loop().call_later(delay, stop)
+
+
+def _install_drain_handler() -> None:
+    """Route SIGTERM through begin_drain; uvicorn keeps SIGINT for its own graceful shutdown."""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, begin_drain, lambda: os.kill(os.getpid(), signal.SIGINT)
+        )
+    except NotImplementedError:
+        pass
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and warm up this worker before it accepts traffic; drain accepted work on shutdown."""
+    start_services()
+    await run_in_threadpool(orchestrator.warmup)
+    _install_drain_handler()
+    logger.info(f"Worker {os.getpid()} ready")
+    yield
+    if not await generation_executor.drain(DRAIN_TIMEOUT):
+        logger.warning(f"Worker {os.getpid()} stopping with {generation_executor.pending} jobs unfinished")
+    await run_in_threadpool(stop_services)
+
+
 app = FastAPI(
     title="Heatmap SaaS API",
     description="Real-time location-based heat map generation",
     version="1.0.0",
     docs_url="/api/docs",
-    openapi_url="/api/openapi.json"
+    openapi_url="/api/openapi.json",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
-# Global orchestrator
-orchestr ator = HeatmapOrchestrator()
+app.add_middleware(PrometheusMiddleware)
+if os.getenv("HEATMAP_SERVER_TIMING", "1") == "1":
+    app.add_middleware(ServerTimingMiddleware)
+
+# Optional cProfile sampling of pipeline stages, e.g. HEATMAP_PROFILE_SAMPLE_RATE=0.01
+if float(os.getenv("HEATMAP_PROFILE_SAMPLE_RATE", "0")) > 0:
+    add_stage_hook(SamplingProfiler(
+        sample_rate=float(os.getenv("HEATMAP_PROFILE_SAMPLE_RATE")),
+        output_dir=os.getenv("HEATMAP_PROFILE_DIR") or None
+    ))
+
+
+async def enforce_rate_limit(request: Request) -> None:
+    """Reject the request with 429 when its customer bucket is exhausted.
+    
+    Only keys listed in API_KEY_TIERS get a bucket of their own; unknown keys
+    share the client IP's bucket, so rotating made-up keys does not reset the quota.
+    """
+    auth = request.headers.get("authorization", "")
+    api_key = auth[7:].strip() if auth.lower().startswith("bearer ") else request.headers.get("x-api-key")
+    tier = API_KEY_TIERS.get(api_key) if api_key else None
+    if tier is not None:
+        key = "key:" + hashlib.blake2b(api_key.encode(), digest_size=12).hexdigest()
+    else:
+        key = f"ip:{request.client.host if request.client else 'unknown'}"
+    
+    if customer_limiter.redis_client is None:
+        allowed = customer_limiter.check_limit(key, tier)
+    else:
+        allowed = await run_in_threadpool(customer_limiter.check_limit, key, tier)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded for tier {tier or 'default'}",
+            headers={"Retry-After": "60"}
+        )
+
+
+def _jsonable_call(fn, *args):
+    """Call fn and convert its result for JSON inside the worker thread."""
+    return to_jsonable(fn(*args))
+
+
+def _media_type_for(output: Optional[str], accept: Optional[str], color_scheme: str) -> str:
+    """Response media type: an explicit ``output`` wins over the Accept header."""
+    if color_scheme not in COLORMAPS:
+        raise HTTPException(status_code=400, detail=f"color_scheme must be one of: {', '.join(COLORMAPS)}")
+    offered = {name: media_type for name, media_type in OUTPUT_TYPES.items()
+               if not media_type.startswith("image/") or name in ENCODERS}
+    if output is not None:
+        if output not in offered:
+            raise HTTPException(status_code=400, detail=f"output must be one of: {', '.join(offered)}")
+        return offered[output]
+    media_type = negotiate(accept, list(offered.values()))
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f"Acceptable types: {', '.join(offered.values())}")
+    return media_type
+
+
+def _encoded_call(fn, media_type: str, encoding: Optional[str], color_scheme: str, *args) -> Optional[Response]:
+    """Call fn and encode its result as media_type inside the worker thread."""
+    result = fn(*args)
+    if result is None:
+        return None
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    
+    if media_type.startswith("image/"):
+        # Results carry the config they were generated with; tiles use the orchestrator's
+        ttl = result.get("config", {}).get("cache_ttl", orchestrator.config.cache_ttl)
+        body, digest = orchestrator.grid_image(result["grid"], color_scheme, media_type.split("/", 1)[1], ttl)
+        # The grid digest makes a strong validator so proxies and browsers can cache images
+        headers["ETag"] = f'"{digest}"'
+        headers["Cache-Control"] = f"public, max-age={ttl}"
+        return Response(content=body, media_type=media_type, headers=headers)
+    
+    with stage("serialize"):
+        if media_type == GRID:
+            if result.get("grid") is None:
+                raise ValueError("Result has no grid to encode")
+            body = encode_grid(result["grid"])
+        else:
+            envelope = {"success": True, "data": result, "timestamp": datetime.now().isoformat()}
+            body = dumps_json(envelope) if media_type == JSON else dumps_msgpack(envelope)
+    
+    with stage("compress"):
+        body, coding = compress(body, encoding)
+    if coding:
+        headers["Content-Encoding"] = coding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+async def _respond(output: Optional[str], accept: Optional[str], accept_encoding: Optional[str],
+                   color_scheme: str, fn, *args) -> Optional[Response]:
+    """Run fn in the generation executor and return its result in the negotiated format."""
+    media_type = _media_type_for(output, accept, color_scheme)
+    return await generation_executor.run(
+        _encoded_call, fn, media_type, choose_encoding(accept_encoding), color_scheme, *args
+    )
+
+
+def _overloaded(e: QueueFullError) -> HTTPException:
+    return HTTPException(status_code=503, detail=f"Server busy: {e}", headers={"Retry-After": "1"})
 
 
 class LocationPoint(BaseModel):
@@ -30,6 +292,7 @@ class LocationPoint(BaseModel):
     longitude: float
     value: float
     category: Optional[str] = None
+    timestamp: Optional[Union[float, str]] = None
 
 
 class HeatmapRequest(BaseModel):
@@ -38,6 +301,54 @@ class HeatmapRequest(BaseModel):
     location_id: str = "default"
     blur_radius: int = 25
     color_scheme: str = "hot"
+    output: Optional[str] = None
+
+
+class HeatmapColumnsRequest(BaseModel):
+    """Columnar request: one array per field instead of one object per point."""
+    latitude: List[float]
+    longitude: List[float]
+    value: List[float]
+    category: Optional[List[Optional[str]]] = None
+    location_id: str = "default"
+    blur_radius: int = 25
+    color_scheme: str = "hot"
+    output: Optional[str] = None
+
+
+class JobRequest(HeatmapRequest):
+    """Heatmap generation to run in the background, optionally POSTing the finished job to callback_url."""
+    callback_url: Optional[str] = None
+
+
+class AppendPointsRequest(BaseModel):
+    """New points for a location's incremental heatmap."""
+    locations: List[LocationPoint]
+    blur_radius: int = 25
+    color_scheme: str = "hot"
+    bbox: Optional[str] = None
+
+
+@timed("convert")
+def _columns_from(points: List[LocationPoint]) -> LocationColumns:
+    """Pack validated points straight into arrays, skipping per-point dicts; non-finite numbers raise ValueError."""
+    n = len(points)
+    return LocationColumns.from_columns(
+        np.fromiter((p.latitude for p in points), dtype=np.float64, count=n),
+        np.fromiter((p.longitude for p in points), dtype=np.float64, count=n),
+        np.fromiter((p.value for p in points), dtype=np.float64, count=n),
+        [p.category for p in points],
+        [p.timestamp for p in points] if any(p.timestamp is not None for p in points) else None
+    ).require_finite()
+
+
+def _config_for(request: Union[HeatmapRequest, HeatmapColumnsRequest, AppendPointsRequest]) -> HeatmapConfig:
+    """Per-request config; the shared orchestrator is never mutated."""
+    return replace(
+        orchestrator.config,
+        blur_radius=request.blur_radius,
+        color_scheme=request.color_scheme
+    )
 
 
 class HeatmapResponse(BaseModel):
@@ -51,7 +362,9 @@ class HeatmapResponse(BaseModel):
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Health check endpoint; 503 while the worker drains so load balancers stop routing to it."""
+    if generation_executor is None or is_draining():
+        return JSONResponse(status_code=503, content={"status": "draining", "timestamp": datetime.now().isoformat()})
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
 
@@ -62,86 +375,327 @@ async def api_status():
         "service": "heatmap-saas-api",
         "version": "1.0.0",
         "status": "running",
+        "redis_circuit": orchestrator.persister.breaker.state,
         "timestamp": datetime.now().isoformat()
     }
 
 
-@app.post("/api/v1/generate-heatmap")
-async def generate_heatmap(request: HeatmapRequest):
-    """Generate heatmap from location data."""
+@app.post("/api/v1/generate-heatmap", dependencies=[Depends(enforce_rate_limit)])
+async def generate_heatmap(request: HeatmapRequest, accept: Optional[str] = Header(None),
+                           accept_encoding: Optional[str] = Header(None)):
+    """Generate heatmap from location data.
+    
+    The body is JSON, msgpack, a raw float32 grid or an image, chosen by
+    ``output`` or the Accept header, and compressed per Accept-Encoding.
+    """
     try:
-        config = HeatmapConfig(
-            blur_radius=request.blur_radius,
-            color_scheme=request.color_scheme
-        )
-        
-        orchestrator.config = config
-        
-        locations_dict = [
-            {
-                "latitude": loc.latitude,
-                "longitude": loc.longitude,
-                "value": loc.value,
-                "category": loc.category
-            }
-            for loc in request.locations
-        ]
-        
-        result = orchestrator.generate_heatmap(locations_dict, request.location_id)
+        config = _config_for(request)
         
-        return {
-            "success": True,
-            "data": result,
-            "timestamp": datetime.now().isoformat()
-        }
+        return await _respond(
+            request.output, accept, accept_encoding, request.color_scheme, orchestrator.generate_heatmap,
+            _columns_from(request.locations), request.location_id, config
+        )
     
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating heatmap: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/v1/batch-process")
+@app.post("/api/v1/generate-heatmap/columnar", dependencies=[Depends(enforce_rate_limit)])
+async def generate_heatmap_columnar(request: HeatmapColumnsRequest, accept: Optional[str] = Header(None),
+                                   accept_encoding: Optional[str] = Header(None)):
+    """Generate heatmap from struct-of-arrays location data."""
+    try:
+        points = LocationColumns.from_columns(
+            request.latitude, request.longitude, request.value, request.category
+        ).require_finite()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        return await _respond(
+            request.output, accept, accept_encoding, request.color_scheme, orchestrator.generate_heatmap,
+            points, request.location_id, _config_for(request)
+        )
+    
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error generating heatmap: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _parse_bbox(bbox: str):
+    """Parse ``south,west,north,east`` into a bounds tuple."""
+    try:
+        south, west, north, east = (float(part) for part in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be south,west,north,east")
+    if not (south < north and west < east):
+        raise HTTPException(status_code=400, detail="bbox must satisfy south < north and west < east")
+    return south, west, north, east
+
+
+@app.post("/api/v1/generate-heatmap/stream", dependencies=[Depends(enforce_rate_limit)])
+async def generate_heatmap_stream(request: Request, bbox: str, location_id: str = "default",
+                                  blur_radius: int = 25, color_scheme: str = "hot",
+                                  format: Optional[str] = None):
+    """Generate heatmap from a streamed NDJSON, CSV or binary upload.
+    
+    Points are folded into a grid over ``bbox`` as they arrive, so memory does
+    not grow with the upload size. The format comes from ``format`` or the
+    Content-Type header.
+    """
+    config = replace(orchestrator.config, blur_radius=blur_radius, color_scheme=color_scheme)
+    fmt = format or format_for(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send NDJSON, CSV or binary, or pass format=")
+    
+    try:
+        ingestor = StreamIngestor(fmt, orchestrator.new_accumulator(_parse_bbox(bbox), config), orchestrator.scorer)
+        accumulator = await ingestor.feed(request.stream(), generation_executor.run)
+        result = await generation_executor.run(
+            _jsonable_call, orchestrator.finish_stream, accumulator, location_id, config
+        )
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "data": result,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def _columns_or_errors(batches: List[HeatmapRequest]) -> List[Union[LocationColumns, Dict[str, Any]]]:
+    """Each batch's points as columns, or the error entry process_parallel would report for it."""
+    converted = []
+    for index, batch in enumerate(batches):
+        try:
+            converted.append(_columns_from(batch.locations))
+        except ValueError as e:
+            converted.append({"error": str(e), "index": index, "location_id": batch.location_id})
+    return converted
+
+
+@app.post("/api/v1/batch-process", dependencies=[Depends(enforce_rate_limit)])
 async def batch_process(batches: List[HeatmapRequest]):
-    """Process multiple heatmap batches in parallel."""
+    """Process multiple heatmap batches in parallel.
+    
+    A batch whose points fail validation gets an error entry at its index,
+    like one that fails to generate; the rest of the batch still runs.
+    """
     try:
-        results = []
-        for batch in batches:
-            locations_dict = [
-                {
-                    "latitude": loc.latitude,
-                    "longitude": loc.longitude,
-                    "value": loc.value,
-                    "category": loc.category
-                }
-                for loc in batch.locations
-            ]
-            result = orchestrator.generate_heatmap(locations_dict, batch.location_id)
-            results.append(result)
+        converted = await generation_executor.run(_columns_or_errors, batches)
+        results = [item if isinstance(item, dict) else None for item in converted]
+        valid = [i for i, item in enumerate(converted) if not isinstance(item, dict)]
+        locations = [converted[i] for i in valid]
+        location_ids = [batches[i].location_id for i in valid]
+        configs = [_config_for(batches[i]) for i in valid]
+        # Cache hits come back in one round trip; only misses are generated
+        found = await orchestrator.cached_heatmaps(locations, location_ids, configs, generation_executor.run)
+        if any(result is not None for result in found):
+            found = await generation_executor.run(to_jsonable, found)
+        misses = [j for j, result in enumerate(found) if result is None]
+        if misses:
+            generated = await generation_executor.run(
+                _jsonable_call, orchestrator.process_parallel, [locations[j] for j in misses],
+                [location_ids[j] for j in misses], [configs[j] for j in misses]
+            )
+            for j, result in zip(misses, generated):
+                if "error" in result:
+                    result["index"] = valid[j]
+                found[j] = result
+        for j, i in enumerate(valid):
+            results[i] = found[j]
         
         return {
             "success": True,
             "batch_count": len(batches),
+            "failed_count": sum(1 for result in results if "error" in result),
             "results": results,
             "timestamp": datetime.now().isoformat()
         }
     
+    except QueueFullError as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Error in batch processing: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/v1/metrics")
-async def metrics():
-    """Get API metrics and statistics."""
+@app.post("/api/v1/jobs", status_code=202, dependencies=[Depends(enforce_rate_limit)])
+async def submit_job(request: JobRequest, response: Response):
+    """Queue a heatmap for background generation and return its job id straight away."""
+    try:
+        job = await generation_executor.run(
+            job_queue.submit, _columns_from(request.locations), request.location_id,
+            _config_for(request), request.callback_url
+        )
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except heatmap_jobs.QueueUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    response.headers["Location"] = f"/api/v1/jobs/{job['id']}"
     return {
-        "service": "heatmap-saas-api",
-        "uptime": "tracking",
-        "total_requests": "tracked",
-        "cache_hits": "monitored",
+        "success": True,
+        "data": job,
         "timestamp": datetime.now().isoformat()
     }
 
 
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress of a background job, with its heatmap once it has succeeded."""
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No job {job_id}")
+    if job["status"] == heatmap_jobs.SUCCEEDED:
+        job = dict(job, result=to_jsonable(await run_in_threadpool(job_queue.result, job_id)))
+    return {
+        "success": True,
+        "data": job,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.post("/api/v1/locations/{location_id}/invalidate")
+async def invalidate_location(location_id: str):
+    """Bump a location's cache generation so cached heatmaps are recomputed."""
+    version = await orchestrator.ainvalidate_location(location_id)
+    return {
+        "success": True,
+        "location_id": location_id,
+        "version": version,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.post("/api/v1/locations/{location_id}/points", dependencies=[Depends(enforce_rate_limit)])
+async def append_points(location_id: str, request: AppendPointsRequest):
+    """Add points to a location's live heatmap without recomputing it."""
+    bounds = _parse_bbox(request.bbox) if request.bbox else None
+    try:
+        result = await generation_executor.run(
+            _jsonable_call, orchestrator.append_points, _columns_from(request.locations),
+            location_id, _config_for(request), bounds
+        )
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "data": result,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/api/v1/locations/{location_id}/heatmap", dependencies=[Depends(enforce_rate_limit)])
+async def get_live_heatmap(location_id: str, window_seconds: Optional[int] = None,
+                           half_life_seconds: Optional[float] = None, blur_radius: Optional[int] = None,
+                           color_scheme: str = "hot", output: Optional[str] = None,
+                           accept: Optional[str] = Header(None), accept_encoding: Optional[str] = Header(None)):
+    """Latest incrementally maintained heatmap for a location.
+    
+    With ``window_seconds`` only points appended in that trailing window are
+    included, optionally weighted by exponential decay with ``half_life_seconds``.
+    """
+    if window_seconds is not None and window_seconds <= 0:
+        raise HTTPException(status_code=400, detail="window_seconds must be positive")
+    if half_life_seconds is not None and window_seconds is None:
+        raise HTTPException(status_code=400, detail="half_life_seconds requires window_seconds")
+    
+    try:
+        if window_seconds is None:
+            response = await _respond(output, accept, accept_encoding, color_scheme,
+                                      orchestrator.get_live_heatmap, location_id)
+        else:
+            config = orchestrator.config if blur_radius is None else replace(orchestrator.config, blur_radius=blur_radius)
+            response = await _respond(
+                output, accept, accept_encoding, color_scheme, orchestrator.windowed_heatmap,
+                location_id, window_seconds, half_life_seconds, config
+            )
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if response is None:
+        raise HTTPException(status_code=404, detail=f"No live heatmap for {location_id}")
+    return response
+
+
+@app.get("/api/v1/heatmap/{location_id}", dependencies=[Depends(enforce_rate_limit)])
+async def get_viewport_heatmap(location_id: str, bbox: str, zoom: Optional[int] = None, blur_radius: int = 25,
+                               color_scheme: str = "hot", output: Optional[str] = None,
+                               accept: Optional[str] = Header(None), accept_encoding: Optional[str] = Header(None)):
+    """Heatmap of the stored points inside a bounding box, sized for the zoom level."""
+    bounds = _parse_bbox(bbox)
+    if zoom is not None and not 0 <= zoom <= orchestrator.config.max_zoom:
+        raise HTTPException(status_code=400, detail=f"zoom must be between 0 and {orchestrator.config.max_zoom}")
+    config = replace(orchestrator.config, blur_radius=blur_radius)
+    try:
+        response = await _respond(output, accept, accept_encoding, color_scheme,
+                                  orchestrator.viewport_heatmap, location_id, bounds, zoom, config)
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if response is None:
+        raise HTTPException(status_code=404, detail=f"No points stored for {location_id}")
+    return response
+
+
+@app.get("/api/v1/tiles/{location_id}/{z}/{x}/{y}", dependencies=[Depends(enforce_rate_limit)])
+async def get_tile(location_id: str, z: int, x: int, y: int, blur_radius: int = 25,
+                   color_scheme: str = "hot", output: Optional[str] = None,
+                   accept: Optional[str] = Header(None), accept_encoding: Optional[str] = Header(None)):
+    """Render one slippy-map tile from the points last uploaded for a location."""
+    config = replace(orchestrator.config, blur_radius=blur_radius)
+    try:
+        tile = await _respond(output, accept, accept_encoding, color_scheme,
+                              orchestrator.generate_tile, location_id, z, x, y, config)
+    except QueueFullError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if tile is None:
+        raise HTTPException(status_code=404, detail=f"No points stored for {location_id}")
+    return tile
+
+
+@app.get("/api/v1/metrics")
+async def metrics():
+    """Prometheus exposition of request, cache, rate-limit and pipeline metrics."""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Request metrics summed across all workers; pipeline gauges are this worker's own
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_collector)
+    # Passed as a header so Starlette does not append a second charset
+    return Response(content=generate_latest(registry), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
 @app.get("/")
 async def root():
     """Root endpoint."""
@@ -0,0 +1,15 @@
+"""Pricing tiers for Heatmap SaaS.
+
+Shared by customer onboarding (what a tier costs) and the API rate limiter
+(how many requests a tier may make), so both read the same numbers.
+"""
+
+# Price tiers
+PRICE_TIERS = {
+    'starter': {'price': 9, 'currency': 'USD', 'requests_month': 100},
+    'growth': {'price': 49, 'currency': 'USD', 'requests_month': 1000},
+    'enterprise': {'price': 99, 'currency': 'USD', 'requests_month': 10000}
+}
+
+# Quota windows are billing months
+MONTH_SECONDS = 30 * 24 * 3600
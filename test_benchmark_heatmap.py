@@ -0,0 +1,42 @@
+"""Test suite for the benchmark harness."""
+
+import json
+
+from benchmark_heatmap import compare, make_points, measure, run_benchmarks
+
+
+def test_points_are_reproducible():
+    """The same size and seed give identical point sets."""
+    a, b = make_points(100), make_points(100)
+    assert (a.latitude == b.latitude).all() and (a.category_codes == b.category_codes).all()
+
+
+def test_measure_reports_order_statistics():
+    """min <= median <= p95 over at least min_runs samples, with setup excluded."""
+    stats = measure(lambda: sum(range(1000)), setup=lambda: sum(range(100000)), min_time=0.0, min_runs=5)
+    assert stats["runs"] == 5
+    assert stats["min_s"] <= stats["median_s"] <= stats["p95_s"]
+
+
+def test_report_is_json_serializable():
+    """A small run covers each requested benchmark and size and round-trips through JSON."""
+    report = run_benchmarks([10, 100], ["generate_heatmap_cold", "score_batch", "persist_round_trip"],
+                            min_time=0.0)
+    assert [(r["benchmark"], r["size"]) for r in report["results"]] == [
+        ("generate_heatmap_cold", 10), ("generate_heatmap_cold", 100),
+        ("score_batch", 10), ("score_batch", 100),
+        ("persist_round_trip", 10), ("persist_round_trip", 100),
+    ]
+    assert json.loads(json.dumps(report))["meta"]["python"]
+
+
+def test_compare_flags_only_slower_medians():
+    """Regressions past the threshold are reported; speedups and unknown entries are not."""
+    baseline = {"results": [{"benchmark": "a", "size": 10, "median_s": 1.0},
+                            {"benchmark": "b", "size": 10, "median_s": 1.0}]}
+    current = {"results": [{"benchmark": "a", "size": 10, "median_s": 1.5},
+                           {"benchmark": "b", "size": 10, "median_s": 0.5},
+                           {"benchmark": "c", "size": 10, "median_s": 9.0}]}
+    regressions = compare(current, baseline, max_regression=0.2)
+    assert [(r["benchmark"], round(r["change"], 2)) for r in regressions] == [("a", 0.5)]
+
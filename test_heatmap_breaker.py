@@ -0,0 +1,89 @@
+"""Test suite for the Redis circuit breaker."""
+
+import threading
+import time
+
+import pytest
+
+from heatmap_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from heatmap_orchestrator import PersistStep
+
+
+def test_opens_after_consecutive_failures():
+    """Only an unbroken run of failures trips the circuit."""
+    breaker = CircuitBreaker(probe=lambda: True, failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.stats() == {"state": OPEN, "trips": 1, "short_circuited": 1}
+
+
+def test_probe_runs_in_background_after_reset_timeout():
+    """A due allow() starts one probe and still answers False; a healthy probe closes the circuit."""
+    clock = [0.0]
+    probed = threading.Event()
+    release = threading.Event()
+
+    def probe():
+        probed.set()
+        return release.wait(5)
+
+    breaker = CircuitBreaker(probe=probe, reset_timeout=1.0, clock=lambda: clock[0])
+    breaker.trip()
+    assert not breaker.allow() and not probed.is_set()
+    clock[0] = 1.5
+    assert not breaker.allow()
+    assert probed.wait(5) and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    release.set()
+    for _ in range(500):
+        if breaker.state == CLOSED:
+            break
+        time.sleep(0.01)
+    assert breaker.allow()
+
+
+def test_failed_probe_backs_off():
+    """Each failed probe doubles the wait, up to the cap."""
+    clock = [0.0]
+    breaker = CircuitBreaker(probe=lambda: False, reset_timeout=1.0, max_reset_timeout=3.0,
+                             clock=lambda: clock[0])
+    breaker.trip()
+    assert not breaker.run_probe()
+    assert breaker.state == OPEN and breaker._retry_at == 2.0
+    breaker.run_probe()
+    assert breaker._retry_at == 3.0
+
+
+class _FailingRedis:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        raise ConnectionError("redis down")
+
+    setex = get
+
+
+def test_persist_step_short_circuits_and_reconnects():
+    """Once Redis has failed enough, L1 serves alone until a probe finds Redis again."""
+    fakeredis = pytest.importorskip("fakeredis")
+    persister = PersistStep()
+    persister.breaker = CircuitBreaker(probe=lambda: persister.redis_client.ping(), failure_threshold=2,
+                                       reset_timeout=60.0)
+    persister.redis_client = _FailingRedis()
+    for i in range(5):
+        assert persister.get_cached(f"key_{i}") is None
+    assert persister.redis_client.calls == 2
+    assert persister.cache_result("kept", 1) and persister.get_cached("kept") == 1
+
+    persister.redis_client = fakeredis.FakeRedis()
+    assert persister.breaker.run_probe()
+    persister.cache_result("shared", {"v": 2})
+    assert persister.redis_client.get("shared") is not None
@@ -0,0 +1,131 @@
+"""Test suite for the in-process cache tier."""
+
+import asyncio
+import time
+
+import pytest
+
+from heatmap_cache import LRUCache
+from heatmap_orchestrator import PersistStep
+
+
+def test_lru_evicts_least_recently_used():
+    """The oldest untouched entry is evicted when the entry bound is hit."""
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    assert cache.get("a") == 1
+    cache.set("c", 3, ttl=60)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_respects_byte_bound():
+    """Total accounted bytes never exceed max_bytes."""
+    cache = LRUCache(max_entries=100, max_bytes=100)
+    for i in range(10):
+        cache.set(str(i), i, ttl=60, nbytes=30)
+    stats = cache.stats()
+    assert stats["bytes"] <= 100
+    assert stats["entries"] == 3
+    assert not cache.set("huge", 0, ttl=60, nbytes=101)
+
+
+def test_lru_expires_entries():
+    """Entries past their TTL are treated as misses."""
+    cache = LRUCache()
+    cache.set("short", "value", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1 and stats["misses"] == 1 and stats["entries"] == 0
+
+
+def test_persist_step_memory_tier_is_bounded():
+    """Without Redis the persister stays within its L1 bounds."""
+    persister = PersistStep(max_entries=4)
+    persister.redis_client = None
+    for i in range(10):
+        persister.cache_result(f"key_{i}", {"i": i})
+    assert persister.get_cached("key_9") == {"i": 9}
+    assert persister.get_cached("key_0") is None
+    assert persister.stats()["entries"] == 4
+    assert persister.increment("counter") == 1
+    assert persister.get_counter("counter") == 1
+
+
+def test_open_breaker_keeps_full_ttl_in_l1(monkeypatch):
+    """While Redis is unreachable L1 is the only copy, so l1_ttl must not cut it short."""
+    persister = PersistStep(l1_ttl=300)
+    persister.breaker.trip()
+    persister.cache_result("points", {"n": 1}, ttl=30 * 24 * 3600)
+    persister.cache_many({"ring": [1, 2]}, ttl=30 * 24 * 3600)
+    later = time.monotonic() + 3600
+    monkeypatch.setattr("heatmap_cache.time.monotonic", lambda: later)
+    assert persister.get_cached("points") == {"n": 1}
+    assert persister.get_many(["ring"]) == {"ring": [1, 2]}
+
+
+def test_l1_copy_is_capped_when_redis_holds_the_value(monkeypatch):
+    """Values Redis also stores expire from L1 after l1_ttl so other replicas' writes show up."""
+    fakeredis = pytest.importorskip("fakeredis")
+    persister = PersistStep(l1_ttl=300)
+    persister.redis_client = fakeredis.FakeRedis()
+    persister.breaker.run_probe()
+    persister.cache_result("points", {"n": 1}, ttl=30 * 24 * 3600)
+    later = time.monotonic() + 3600
+    monkeypatch.setattr("heatmap_cache.time.monotonic", lambda: later)
+    assert "points" not in persister.memory_cache
+    assert persister.get_cached("points") == {"n": 1}
+
+
+def test_bulk_operations_round_trip_through_redis():
+    """cache_many/get_many pipeline through Redis and refill L1 from one MGET."""
+    fakeredis = pytest.importorskip("fakeredis")
+    persister = PersistStep()
+    persister.redis_client = fakeredis.FakeRedis()
+    persister.breaker.run_probe()
+    persister.cache_many({"a": {"v": 1}, "b": [1, 2]}, ttl=60)
+    persister.memory_cache.clear()
+    assert persister.get_many(["a", "b", "missing", "a"]) == {"a": {"v": 1}, "b": [1, 2]}
+    stats = persister.stats()
+    assert stats["l2_hits"] == 2 and stats["l2_misses"] == 1
+    assert persister.redis_client.ttl("a") > 0
+
+
+def test_async_bulk_operations():
+    """The asyncio client reads what it wrote and counters come back in bulk."""
+    fakeredis = pytest.importorskip("fakeredis")
+    persister = PersistStep()
+    persister.redis_client = fakeredis.FakeRedis()
+    persister.breaker.run_probe()
+
+    async def scenario():
+        persister._async_clients[asyncio.get_running_loop()] = fakeredis.aioredis.FakeRedis()
+        await persister.acache_many({"x": 1, "y": 2})
+        persister.memory_cache.clear()
+        assert await persister.aincrement("version_a") == 1
+        assert await persister.aget_counters(["version_a", "version_b"]) == {"version_a": 1, "version_b": 0}
+        return await persister.aget_many(["x", "y", "z"])
+
+    assert asyncio.run(scenario()) == {"x": 1, "y": 2}
+
+
+def test_counter_bumps_reach_other_replicas_within_a_second(monkeypatch):
+    """A version another replica increments is seen here once the short counter L1 copy expires."""
+    from benchmark_heatmap import InMemoryRedis
+
+    shared = InMemoryRedis()
+    replicas = [PersistStep(), PersistStep()]
+    for persister in replicas:
+        persister.redis_client = shared
+        persister.breaker.run_probe()
+    assert replicas[0].get_counter("version_loc") == 0
+    replicas[1].increment("version_loc")
+    assert replicas[0].get_counter("version_loc") == 0
+
+    later = time.monotonic() + 2
+    monkeypatch.setattr("heatmap_cache.time.monotonic", lambda: later)
+    assert replicas[0].get_counter("version_loc") == 1
+    assert asyncio.run(replicas[0].aget_counters(["version_loc"])) == {"version_loc": 1}
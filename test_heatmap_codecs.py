@@ -0,0 +1,43 @@
+"""Test suite for cache payload codecs."""
+
+import json
+
+import numpy as np
+
+import heatmap_codecs as codecs
+
+
+def test_msgpack_round_trips_arrays_without_lists():
+    """Arrays decode back as arrays with the same dtype and shape."""
+    value = {"grid": {"intensity": np.arange(12, dtype=np.float32).reshape(3, 4)}, "n": 3}
+    decoded = codecs.decode(codecs.encode(value))
+    intensity = decoded["grid"]["intensity"]
+    assert isinstance(intensity, np.ndarray)
+    assert intensity.dtype == np.float32 and intensity.shape == (3, 4)
+    assert np.array_equal(intensity, value["grid"]["intensity"])
+    assert decoded["n"] == 3
+
+
+def test_compression_applies_above_threshold():
+    """Large payloads are compressed and record their raw size in the header."""
+    value = {"zeros": np.zeros(10000)}
+    compressed = codecs.encode(value, compression="zlib")
+    plain = codecs.encode(value, compression=None)
+    assert len(compressed) < len(plain)
+    assert codecs.decoded_size(compressed) == codecs.decoded_size(plain)
+    assert np.array_equal(codecs.decode(compressed)["zeros"], value["zeros"])
+
+
+def test_json_codec_and_legacy_payloads_decode():
+    """Both the JSON codec and header-less legacy JSON entries are readable."""
+    value = {"a": [1, 2], "b": "x"}
+    assert codecs.decode(codecs.encode(value, codec="json")) == value
+    legacy = json.dumps(value).encode()
+    assert not codecs.is_current(legacy)
+    assert codecs.decode(legacy) == value
+
+
+def test_to_jsonable_rounds_float_arrays():
+    """Float arrays become rounded nested lists for JSON responses."""
+    value = {"grid": np.array([[0.123456, 1.0]], dtype=np.float32), "count": np.int64(2)}
+    assert codecs.to_jsonable(value) == {"grid": [[0.1235, 1.0]], "count": 2}
@@ -0,0 +1,104 @@
+"""Test suite for the generation executor."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from heatmap_executor import GenerationExecutor, QueueFullError
+
+
+def test_run_returns_result_off_loop_thread():
+    """Work runs on a pool thread and its result is awaited."""
+    executor = GenerationExecutor(max_concurrency=1, max_queue=0)
+    loop_thread = threading.get_ident()
+    worker_thread = asyncio.run(executor.run(threading.get_ident))
+    executor.shutdown()
+    assert worker_thread != loop_thread
+
+
+def test_rejects_beyond_queue_depth():
+    """Jobs past concurrency + queue depth fail fast instead of waiting."""
+    executor = GenerationExecutor(max_concurrency=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(QueueFullError):
+            await executor.run(lambda: None)
+        release.set()
+        await asyncio.gather(*running)
+
+    asyncio.run(scenario())
+    executor.shutdown()
+    assert executor.stats()["rejected"] == 1
+    assert executor.pending == 0
+
+
+def test_drain_waits_for_accepted_jobs_and_rejects_new_ones():
+    """Draining lets running work finish while new submissions fail fast."""
+    executor = GenerationExecutor(max_concurrency=1, max_queue=4)
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(time.sleep, 0.1))
+        await asyncio.sleep(0.01)
+        drained = asyncio.ensure_future(executor.drain(timeout=5))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await executor.run(lambda: None)
+        assert await drained
+        assert running.done()
+
+    asyncio.run(scenario())
+    executor.shutdown()
+    assert executor.pending == 0
+
+
+def test_drain_gives_up_after_timeout():
+    """A job outlasting the timeout is reported instead of blocking shutdown."""
+    executor = GenerationExecutor(max_concurrency=1, max_queue=0)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.01)
+        assert not await executor.drain(timeout=0.05)
+        release.set()
+        await running
+
+    asyncio.run(scenario())
+    executor.shutdown()
+
+
+def test_cancelled_caller_keeps_its_slot_until_the_thread_finishes():
+    """A disconnected client does not free capacity while its job is still running."""
+    executor = GenerationExecutor(max_concurrency=1, max_queue=0)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.01)
+        running.cancel()
+        await asyncio.sleep(0.01)
+        assert executor.pending == 1
+        with pytest.raises(QueueFullError):
+            await executor.run(lambda: None)
+        release.set()
+        assert await executor.drain(timeout=5)
+
+    asyncio.run(scenario())
+    executor.shutdown()
+
+
+def test_overload_is_a_503(client, monkeypatch):
+    """Requests past the executor's backlog are refused with 503 and Retry-After."""
+    import main
+
+    monkeypatch.setattr(main.generation_executor, "max_concurrency", 0)
+    monkeypatch.setattr(main.generation_executor, "max_queue", 0)
+    response = client.post("/api/v1/generate-heatmap", json={"locations": [
+        {"latitude": 40.7128, "longitude": -74.0060, "value": 100}
+    ]})
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
@@ -0,0 +1,88 @@
+"""Test suite for the density grid engine."""
+
+import numpy as np
+
+from heatmap_grid import IncrementalGrid, blur, compute_bounds, rasterize, render_grid, splat
+from heatmap_orchestrator import HeatmapConfig, HeatmapOrchestrator
+
+
+def test_rasterize_preserves_total_weight():
+    """Every point inside the bounds lands in exactly one cell."""
+    lat = np.array([10.0, 10.5, 11.0])
+    lon = np.array([20.0, 20.5, 21.0])
+    weights = np.array([1.0, 2.0, 3.0])
+    bounds = compute_bounds(lat, lon, resolution=32, padding_cells=4)
+    grid = rasterize(lat, lon, weights, bounds, width=32, height=32)
+    assert grid.shape == (32, 32)
+    assert grid.sum() == 6.0
+
+
+def test_rasterize_north_is_row_zero():
+    """Northern points map to lower row indices."""
+    bounds = (0.0, 0.0, 10.0, 10.0)
+    grid = rasterize(np.array([9.0, 1.0]), np.array([5.0, 5.0]), np.array([1.0, 2.0]), bounds, 10, 10)
+    assert grid[0:2].sum() == 1.0
+    assert grid[8:].sum() == 2.0
+
+
+def test_separable_and_fft_blur_agree():
+    """Both convolution strategies produce the same kernel response."""
+    raw = np.zeros((64, 64))
+    raw[20, 30] = 5.0
+    raw[40, 10] = 2.0
+    separable = blur(raw, 6, method="separable")
+    fft = blur(raw, 6, method="fft")
+    assert np.allclose(separable, fft, atol=1e-9)
+    assert np.isclose(separable.sum(), raw.sum())
+
+
+def test_render_grid_size_depends_on_resolution_only():
+    """Output shape is fixed by resolution, not by point count."""
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(40.0, 41.0, 5000)
+    lon = rng.uniform(-74.0, -73.0, 5000)
+    grid = render_grid(lat, lon, np.ones(5000), resolution=48, blur_radius=3)
+    assert grid.intensity.shape == (48, 48)
+    assert grid.to_dict()["width"] == 48
+
+
+def test_splat_matches_full_blur():
+    """Stamping kernels per occupied cell equals blurring the whole delta."""
+    delta = np.zeros((40, 40))
+    delta[0, 3] = 2.0
+    delta[20, 21] = 1.5
+    delta[39, 39] = 0.5
+    target = np.zeros_like(delta)
+    splat(target, delta, 5)
+    assert np.allclose(target, blur(delta, 5, method="separable"))
+
+
+def test_incremental_grid_matches_batch_render():
+    """Appending in batches gives the same raster as rendering everything at once."""
+    rng = np.random.default_rng(2)
+    lat = rng.uniform(40.0, 41.0, 300)
+    lon = rng.uniform(-74.0, -73.0, 300)
+    w = rng.uniform(0.5, 2.0, 300)
+    bounds = compute_bounds(lat, lon, 32, 3)
+    grid = IncrementalGrid(bounds, 32, 3)
+    for chunk in (slice(0, 5), slice(5, 6), slice(6, 300)):
+        grid.add(lat[chunk], lon[chunk], w[chunk])
+    restored = IncrementalGrid.from_state(grid.to_state())
+    expected = render_grid(lat, lon, w, resolution=32, blur_radius=3, bounds=bounds)
+    assert np.allclose(restored.render().intensity, expected.intensity)
+    assert restored.summary()["total_points"] == 300
+
+
+def test_orchestrator_returns_grid():
+    """generate_heatmap returns a blurred grid instead of echoing points."""
+    orchestrator = HeatmapOrchestrator(HeatmapConfig(blur_radius=4, grid_resolution=32, cache_enabled=False))
+    orchestrator.persister.redis_client = None
+    result = orchestrator.generate_heatmap([
+        {"latitude": 40.7128, "longitude": -74.0060, "value": 100, "category": "urban"},
+        {"latitude": 40.7580, "longitude": -73.9855, "value": 85},
+    ], "grid_test")
+    assert "points" not in result
+    assert result["grid"]["width"] == 32
+    assert len(result["grid"]["intensity"]) == 32
+    assert result["grid"]["max_intensity"] > 0
+    assert result["summary"]["total_points"] == 2
@@ -0,0 +1,68 @@
+"""Test suite for the spatial index and viewport queries."""
+
+import numpy as np
+
+from heatmap_grid import render_grid
+from heatmap_index import GridIndex
+
+
+def test_query_returns_every_point_in_box():
+    """Index candidates are a superset of the exact hits and much smaller than the set."""
+    rng = np.random.default_rng(3)
+    lat = rng.uniform(40.0, 41.0, 20000)
+    lon = rng.uniform(-74.0, -73.0, 20000)
+    index, order = GridIndex.build(lat, lon)
+    lat, lon = lat[order], lon[order]
+
+    box = (40.2, -73.8, 40.3, -73.6)
+    candidates = index.query(box)
+    hits = np.flatnonzero((lat > box[0]) & (lat <= box[2]) & (lon >= box[1]) & (lon < box[3]))
+    assert set(hits) <= set(candidates)
+    assert candidates.size < lat.size // 10
+    assert index.query((50.0, 0.0, 51.0, 1.0)).size == 0
+
+
+def test_viewport_matches_full_render_inside_box(make_orchestrator):
+    """A viewport grid equals the same window cut from a render over all points."""
+    rng = np.random.default_rng(4)
+    points = [
+        {"latitude": float(la), "longitude": float(lo), "value": 1.0}
+        for la, lo in zip(rng.uniform(40.0, 41.0, 2000), rng.uniform(-74.0, -73.0, 2000))
+    ]
+    orchestrator = make_orchestrator()
+    assert orchestrator.viewport_heatmap("viewport", (40.0, -74.0, 41.0, -73.0)) is None
+    orchestrator.generate_heatmap(points, "viewport")
+
+    box = (40.25, -73.75, 40.5, -73.5)
+    result = orchestrator.viewport_heatmap("viewport", box)
+    stored = orchestrator.persister.get_cached("points_viewport")
+    assert result["summary"]["scanned_points"] < len(points)
+
+    # Same cell size as the viewport, with the box at cells 12..28 on both axes
+    outer = (40.25 - 0.25 * 12 / 16, -73.75 - 0.25 * 12 / 16, 40.5 + 0.25 * 12 / 16, -73.5 + 0.25 * 12 / 16)
+    full = render_grid(stored["latitude"], stored["longitude"], stored["weight"], 40, 2, bounds=outer)
+    window = full.intensity[12:28, 12:28]
+    assert np.allclose(np.array(result["grid"]["intensity"]), window / window.max(), atol=1e-5)
+
+    zoomed = orchestrator.viewport_heatmap("viewport", box, zoom=8)
+    assert zoomed["grid"]["width"] == zoomed["config"]["grid_resolution"] > 16
+
+
+def test_viewport_endpoint(client):
+    """Viewports render stored points inside the bbox; bad boxes, zooms and unknown locations are rejected."""
+    client.post("/api/v1/generate-heatmap", json={"location_id": "viewport_api", "locations": [
+        {"latitude": 40.7128, "longitude": -74.0060, "value": 100},
+        {"latitude": 40.7580, "longitude": -73.9855, "value": 85},
+    ]}).raise_for_status()
+    url = "/api/v1/heatmap/viewport_api"
+
+    result = client.get(url, params={"bbox": "40.70,-74.01,40.72,-74.00", "blur_radius": 2}).json()["data"]
+    assert result["summary"]["total_points"] == 1
+    zoomed = client.get(url, params={"bbox": "40.70,-74.01,40.72,-74.00", "zoom": 12}).json()["data"]
+    assert zoomed["zoom"] == 12 and zoomed["grid"]["width"] < 256
+
+    assert client.get(url, params={"bbox": "40.72,-74.01,40.70,-74.00"}).status_code == 400
+    assert client.get(url, params={"bbox": "north"}).status_code == 400
+    assert client.get(url, params={"bbox": "40.70,-74.01,40.72,-74.00", "zoom": 99}).status_code == 400
+    assert client.get("/api/v1/heatmap/missing", params={"bbox": "40.70,-74.01,40.72,-74.00"}).status_code == 404
+
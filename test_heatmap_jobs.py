@@ -0,0 +1,140 @@
+"""Test suite for background heatmap jobs."""
+
+import socket
+
+import pytest
+from kombu.exceptions import OperationalError
+
+import heatmap_codecs as codecs
+import heatmap_jobs
+from heatmap_jobs import (
+    FAILED, SUCCEEDED, JobQueue, QueueUnavailableError, celery_app, check_callback_url, pack_points, unpack_points
+)
+from heatmap_orchestrator import HeatmapConfig, HeatmapOrchestrator, LocationColumns
+
+POINTS = LocationColumns.from_columns([40.7128, 40.7580], [-74.0060, -73.9855], [100.0, 85.0], ["urban", None])
+
+
+def _queue(monkeypatch):
+    # Run tasks in-process, as with the test-only HEATMAP_BROKER_URL=memory://
+    monkeypatch.setitem(celery_app.conf, "task_always_eager", True)
+    orchestrator = HeatmapOrchestrator(HeatmapConfig(grid_resolution=16, blur_radius=2))
+    orchestrator.persister.redis_client = None
+    queue = JobQueue(orchestrator)
+    monkeypatch.setattr(heatmap_jobs, "_queue", queue)
+    return queue
+
+
+def test_points_survive_the_cache_codec():
+    """Job input round-trips through the cache encoding unchanged."""
+    restored = unpack_points(codecs.decode(codecs.encode(pack_points(POINTS))))
+    assert (restored.latitude == POINTS.latitude).all()
+    assert restored.categories == POINTS.categories and (restored.category_codes == POINTS.category_codes).all()
+
+
+def test_job_runs_to_completion_with_progress(monkeypatch):
+    """A submitted job reports stage progress and stores its heatmap."""
+    queue = _queue(monkeypatch)
+    progress = []
+    update = queue.update
+
+    def recording_update(record, **fields):
+        progress.append(fields.get("progress"))
+        update(record, **fields)
+
+    monkeypatch.setattr(queue, "update", recording_update)
+    job = queue.submit(POINTS, "jobs", queue.orchestrator.config)
+    record = queue.get(job["id"])
+    assert record["status"] == SUCCEEDED and record["progress"] == 1.0
+    assert [p for p in progress if p] == sorted(p for p in progress if p)
+    assert {0.2, 0.4} <= set(progress)
+    assert queue.result(job["id"])["summary"]["total_points"] == 2
+    assert queue.persister.get_cached(f"job_input_{job['id']}") is None
+
+
+def test_failed_job_records_error_and_calls_back(monkeypatch):
+    """Errors mark the job failed and the callback receives the final record."""
+    queue = _queue(monkeypatch)
+    posted = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+    def boom(*args):
+        raise ValueError("bad points")
+
+    monkeypatch.setattr(queue.orchestrator, "generate_heatmap", boom)
+    _resolve_to(monkeypatch, "93.184.216.34")
+    monkeypatch.setattr(heatmap_jobs.requests, "post",
+                        lambda url, json, timeout, allow_redirects: posted.append((url, json)) or Response())
+    job = queue.submit(POINTS, "jobs", queue.orchestrator.config, callback_url="http://client.example/hook")
+    record = queue.get(job["id"])
+    assert record["status"] == FAILED and record["error"] == "bad points"
+    assert posted == [("http://client.example/hook", record)]
+
+
+def _resolve_to(monkeypatch, address):
+    monkeypatch.setattr(heatmap_jobs.socket, "getaddrinfo",
+                        lambda host, port, proto: [(socket.AF_INET, socket.SOCK_STREAM, proto, "", (address, 80))])
+
+
+@pytest.mark.parametrize("url, address", [
+    ("ftp://client.example/hook", "93.184.216.34"),
+    ("http://localhost/hook", "127.0.0.1"),
+    ("http://metadata.example/latest", "169.254.169.254"),
+    ("http://intranet.example/hook", "10.0.0.5"),
+    ("http://mapped.example/hook", "::ffff:127.0.0.1"),
+])
+def test_callbacks_to_local_networks_are_rejected(monkeypatch, url, address):
+    """Callback URLs must be http(s) to hosts with only public addresses."""
+    _resolve_to(monkeypatch, address)
+    with pytest.raises(ValueError):
+        check_callback_url(url)
+
+
+def test_callback_allow_list(monkeypatch):
+    """With HEATMAP_CALLBACK_HOSTS set only the listed hosts are accepted, whatever they resolve to."""
+    monkeypatch.setattr(heatmap_jobs, "CALLBACK_HOSTS", {"hooks.internal"})
+    _resolve_to(monkeypatch, "10.0.0.5")
+    check_callback_url("https://hooks.internal/done")
+    with pytest.raises(ValueError):
+        check_callback_url("https://client.example/hook")
+
+
+def test_unreachable_broker_fails_the_job(monkeypatch):
+    """A submit the broker refuses raises QueueUnavailableError and leaves no queued orphan behind."""
+    queue = _queue(monkeypatch)
+
+    def refuse(job_id):
+        raise OperationalError("connection refused")
+
+    updated = []
+    update = queue.update
+    monkeypatch.setattr(heatmap_jobs.run_heatmap_job, "delay", refuse)
+    monkeypatch.setattr(queue, "update", lambda record, **fields: updated.append(record) or update(record, **fields))
+    with pytest.raises(QueueUnavailableError):
+        queue.submit(POINTS, "jobs", queue.orchestrator.config)
+    job_id = updated[0]["id"]
+    assert queue.get(job_id)["status"] == FAILED
+    assert queue.persister.get_cached(f"job_input_{job_id}") is None
+
+
+def test_job_endpoints(client, monkeypatch):
+    """Jobs are accepted with 202, polled to their result, and refused cleanly when they cannot run."""
+    body = {"location_id": "jobs_api", "locations": [{"latitude": 40.7128, "longitude": -74.0060, "value": 100}]}
+    response = client.post("/api/v1/jobs", json=body)
+    assert response.status_code == 202
+    job = client.get(response.headers["location"]).json()["data"]
+    assert job["status"] == SUCCEEDED and job["result"]["summary"]["total_points"] == 1
+    assert client.get("/api/v1/jobs/unknown").status_code == 404
+
+    _resolve_to(monkeypatch, "169.254.169.254")
+    assert client.post("/api/v1/jobs", json=dict(body, callback_url="http://metadata.example/")).status_code == 400
+
+    def refuse(job_id):
+        raise OperationalError("connection refused")
+
+    monkeypatch.setattr(heatmap_jobs.run_heatmap_job, "delay", refuse)
+    response = client.post("/api/v1/jobs", json=body)
+    assert response.status_code == 503 and response.headers["retry-after"]
@@ -0,0 +1,71 @@
+"""Test suite for Prometheus instrumentation."""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY, CollectorRegistry
+
+from heatmap_cache import LRUCache
+from heatmap_executor import GenerationExecutor
+from heatmap_metrics import PipelineCollector, PrometheusMiddleware
+from heatmap_orchestrator import PersistStep, RateLimiter
+from heatmap_stages import stage
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_stage_records_duration_and_errors():
+    """Each stage observation lands in the histogram; failures are also counted."""
+    before = _sample("heatmap_stage_duration_seconds_count", stage="test_stage")
+    with stage("test_stage"):
+        pass
+    with pytest.raises(RuntimeError):
+        with stage("test_stage"):
+            raise RuntimeError("boom")
+    assert _sample("heatmap_stage_duration_seconds_count", stage="test_stage") == before + 2
+    assert _sample("heatmap_stage_errors_total", stage="test_stage") >= 1
+
+
+def test_middleware_labels_by_route_template():
+    """Requests are grouped by path template, with body sizes measured on the wire."""
+    app = FastAPI()
+    app.add_middleware(PrometheusMiddleware)
+
+    @app.post("/metrics-test/{item_id}")
+    async def echo(item_id: str):
+        return {"item": item_id}
+
+    route = "/metrics-test/{item_id}"
+    before = _sample("heatmap_http_request_duration_seconds_count", method="POST", route=route, status="200")
+    client = TestClient(app)
+    client.post("/metrics-test/a", content=b"x" * 100)
+    client.post("/metrics-test/b")
+    assert _sample("heatmap_http_request_duration_seconds_count",
+                   method="POST", route=route, status="200") == before + 2
+    assert _sample("heatmap_http_request_size_bytes_sum", method="POST", route=route) >= 100
+    assert _sample("heatmap_http_requests_in_flight", method="POST", route=route) == 0
+
+
+def test_pipeline_collector_exports_component_stats():
+    """Cache, rate-limiter and executor counters are read at scrape time."""
+    persister = PersistStep(max_entries=1)
+    persister.redis_client = None
+    persister.memory_cache = LRUCache(max_entries=1)
+    persister.cache_result("a", 1)
+    persister.cache_result("b", 2)
+    persister.get_cached("b")
+    persister.get_cached("a")
+    limiter = RateLimiter(max_calls=1)
+    limiter.check_limit("k")
+    limiter.check_limit("k")
+
+    registry = CollectorRegistry()
+    registry.register(PipelineCollector(persister, GenerationExecutor(max_concurrency=1), {"customer": limiter}))
+    assert registry.get_sample_value("heatmap_cache_lookups_total", {"tier": "l1", "result": "hit"}) == 1
+    assert registry.get_sample_value("heatmap_cache_lookups_total", {"tier": "l1", "result": "miss"}) == 1
+    assert registry.get_sample_value("heatmap_cache_removals_total", {"reason": "eviction"}) == 1
+    assert registry.get_sample_value("heatmap_rate_limit_rejections_total", {"limiter": "customer"}) == 1
+    assert registry.get_sample_value("heatmap_executor_pending") == 0
+    assert registry.get_sample_value("heatmap_redis_circuit_state") in (0, 1)
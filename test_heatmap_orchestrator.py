@@ -0,0 +1,251 @@
+"""Test suite for the heatmap orchestrator."""
+
+import threading
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from heatmap_orchestrator import (
+    HeatmapConfig, LocationColumns, LocationData, ScoreItemsStep,
+    category_weights, digest_config, digest_points, time_decay
+)
+
+POINTS = [
+    {"latitude": 40.7128, "longitude": -74.0060, "value": 100, "category": "urban"},
+    {"latitude": 40.7580, "longitude": -73.9855, "value": 85, "category": "urban"},
+    {"latitude": 40.7489, "longitude": -73.9680, "value": 90, "category": "commercial"},
+]
+
+
+def test_digest_points_ignores_order():
+    """The point digest is a function of the set, not the request order."""
+    forward = digest_points(LocationColumns.from_columns([1.0, 2.0, 2.0], [3.0, 4.0, 4.0], [5.0, 6.0, 6.0],
+                                                         ["a", None, "b"]))
+    reverse = digest_points(LocationColumns.from_columns([2.0, 2.0, 1.0], [4.0, 4.0, 3.0], [6.0, 6.0, 5.0],
+                                                         ["b", None, "a"]))
+    assert forward == reverse
+    assert forward != digest_points(LocationColumns.from_columns([1.0, 2.0, 2.0], [3.0, 4.0, 4.0],
+                                                                 [5.0, 6.0, 6.0], ["c", None, "b"]))
+
+    early_first = LocationColumns.from_columns([1.0, 1.0], [3.0, 3.0], [5.0, 5.0], timestamp=[10.0, 20.0])
+    late_first = LocationColumns.from_columns([1.0, 1.0], [3.0, 3.0], [5.0, 5.0], timestamp=[20.0, 10.0])
+    assert digest_points(early_first) == digest_points(late_first)
+
+
+def test_digest_config_covers_every_field():
+    """Configs that differ only in blur_radius hash differently."""
+    config = HeatmapConfig()
+    assert digest_config(config) == digest_config(HeatmapConfig())
+    assert digest_config(config) != digest_config(replace(config, blur_radius=26))
+
+
+def test_different_points_same_location_do_not_collide(make_orchestrator):
+    """A new point set for the same location_id is recomputed, not served stale."""
+    orchestrator = make_orchestrator()
+    first = orchestrator.generate_heatmap(POINTS, "collide")
+    second = orchestrator.generate_heatmap(POINTS[:2], "collide")
+    assert second["summary"]["total_points"] == 2
+    assert orchestrator.generate_heatmap(list(reversed(POINTS)), "collide") is first
+
+
+def test_invalidate_location_bypasses_cache(make_orchestrator):
+    """Bumping the location version forces a fresh computation."""
+    orchestrator = make_orchestrator()
+    first = orchestrator.generate_heatmap(POINTS, "versioned")
+    assert orchestrator.invalidate_location("versioned") == 1
+    second = orchestrator.generate_heatmap(POINTS, "versioned")
+    assert second is not first
+    assert orchestrator.generate_heatmap(POINTS, "versioned") is second
+
+
+def test_process_parallel_keeps_order_and_isolates_errors(make_orchestrator):
+    """Results follow input order and a bad batch does not sink the others."""
+    orchestrator = make_orchestrator()
+    batches = [POINTS, [{"latitude": 1.0}], POINTS[:1]]
+    results = orchestrator.process_parallel(batches, ["ok_a", "bad", "ok_b"])
+    orchestrator.shutdown()
+    assert results[0]["location_id"] == "ok_a"
+    assert results[1]["index"] == 1 and "error" in results[1]
+    assert results[2]["summary"]["total_points"] == 1
+
+
+def test_large_grids_render_in_process_pool(monkeypatch, make_orchestrator):
+    """Grid rendering is offloaded to the process pool above the size threshold."""
+    monkeypatch.setattr("heatmap_orchestrator.PROCESS_POOL_MIN_POINTS", 1)
+    orchestrator = make_orchestrator(cache_enabled=False)
+    orchestrator.grid_workers = 1
+    pooled = orchestrator.generate_heatmap(POINTS, "pooled")
+    assert orchestrator._grid_executor is not None
+    orchestrator.shutdown()
+    inline = make_orchestrator(cache_enabled=False).generate_heatmap(POINTS, "pooled")
+    assert np.array_equal(pooled["grid"]["intensity"], inline["grid"]["intensity"])
+
+
+def test_warmup_starts_pools_without_caching(make_orchestrator):
+    """Warmup spins up the worker pools but leaves no cache entries or location state behind."""
+    orchestrator = make_orchestrator()
+    orchestrator.grid_workers = 1
+    orchestrator.warmup()
+    assert orchestrator._grid_executor is not None and orchestrator._batch_executor is not None
+    assert orchestrator.persister.stats()["entries"] == 0
+    orchestrator.shutdown()
+
+
+def test_per_call_config_does_not_leak(make_orchestrator):
+    """Concurrent calls with different configs each get their own output."""
+    orchestrator = make_orchestrator()
+    wide = replace(orchestrator.config, blur_radius=6)
+    results = orchestrator.process_parallel([POINTS, POINTS], ["cfg", "cfg"], [orchestrator.config, wide])
+    orchestrator.shutdown()
+    assert results[0]["config"]["blur_radius"] == 2
+    assert results[1]["config"]["blur_radius"] == 6
+    assert orchestrator.config.blur_radius == 2
+    assert hash(wide) != hash(orchestrator.config)
+
+
+def test_columnar_input_matches_record_input(make_orchestrator):
+    """Row dicts and columns describing the same points give the same heatmap."""
+    columns = LocationColumns.from_columns(
+        [p["latitude"] for p in POINTS], [p["longitude"] for p in POINTS],
+        [p["value"] for p in POINTS], [p["category"] for p in POINTS]
+    )
+    assert columns.categories == ["urban", "commercial"]
+    assert columns.category_codes.tolist() == [0, 0, 1]
+    from_records = make_orchestrator(cache_enabled=False).generate_heatmap(POINTS, "columnar")
+    from_columns = make_orchestrator(cache_enabled=False).generate_heatmap(columns, "columnar")
+    assert np.array_equal(from_records["grid"]["intensity"], from_columns["grid"]["intensity"])
+    assert from_records["summary"] == from_columns["summary"]
+
+
+def test_score_batch_matches_reference():
+    """Vectorized scoring agrees with the per-item implementation, across chunks."""
+    scorer = ScoreItemsStep(batch_size=2)
+    records = POINTS + [
+        {"latitude": 0, "longitude": 0, "value": 50},
+        {"latitude": 0, "longitude": 0, "value": 1, "category": ""},
+    ]
+    items = [LocationData(**p) for p in records]
+    reference = [scorer._calculate_score(item) for item in items]
+    assert np.allclose(scorer.score_batch(items), reference)
+    assert np.allclose(scorer.score_batch(LocationColumns.from_records(records)), reference)
+
+
+def test_pluggable_score_functions():
+    """Category weights and time decay operate on whole arrays."""
+    points = LocationColumns.from_records([
+        {"latitude": 0, "longitude": 0, "value": 10, "category": "a", "timestamp": 1000.0},
+        {"latitude": 0, "longitude": 0, "value": 10, "category": "b", "timestamp": "1970-01-01T00:00:00Z"},
+        {"latitude": 0, "longitude": 0, "value": 10},
+    ])
+    scorer = ScoreItemsStep(score_functions=[
+        category_weights({"a": 3.0}, default=0.5, uncategorized=2.0),
+        time_decay(half_life_seconds=1000.0, now=1000.0),
+    ])
+    assert np.allclose(scorer.score_batch(points), [30.0, 2.5, 20.0])
+
+
+def test_append_points_extends_generated_heatmap(make_orchestrator):
+    """Appends seed from the last full upload and keep the summary current."""
+    orchestrator = make_orchestrator()
+    orchestrator.generate_heatmap(POINTS, "live")
+    result = orchestrator.append_points([{"latitude": 40.73, "longitude": -73.99, "value": 120}], "live")
+    assert result["summary"]["total_points"] == 4
+    assert result["summary"]["max_value"] == 120
+    assert result["summary"]["avg_value"] == (100 + 85 + 90 + 120) / 4
+    assert orchestrator.get_live_heatmap("live") is result
+    
+    orchestrator.generate_heatmap(POINTS[:1], "live")
+    result = orchestrator.append_points(POINTS[1:2], "live")
+    assert result["summary"]["total_points"] == 2
+
+
+def test_first_append_needs_bounds(make_orchestrator):
+    """Without a stored upload the first append must say which area the accumulator covers."""
+    orchestrator = make_orchestrator()
+    with pytest.raises(ValueError, match="bbox"):
+        orchestrator.append_points(POINTS[:1], "unbounded")
+
+    orchestrator.append_points(POINTS[:1], "bounded", bounds=(40.0, -74.5, 41.0, -73.5))
+    result = orchestrator.append_points(POINTS[1:], "bounded")
+    assert result["summary"]["total_points"] == 3
+    assert result["summary"]["outside_bounds"] == 0
+
+
+def test_regenerating_the_same_upload_keeps_appends(make_orchestrator):
+    """Refreshes and expiry misses of an unchanged upload leave appended points in place."""
+    orchestrator = make_orchestrator(cache_enabled=False)
+    orchestrator.generate_heatmap(POINTS, "kept")
+    orchestrator.append_points([{"latitude": 40.73, "longitude": -73.99, "value": 120}], "kept")
+
+    orchestrator.generate_heatmap(POINTS, "kept")
+    orchestrator.persister.delete("points_kept")
+    orchestrator.generate_heatmap(POINTS, "kept")
+    result = orchestrator.append_points([{"latitude": 40.74, "longitude": -73.99, "value": 60}], "kept")
+    assert result["summary"]["total_points"] == 5
+
+
+def test_non_finite_numbers_are_rejected(client):
+    """NaN and infinite coordinates or values are a 400 on row and columnar uploads alike."""
+    headers = {"Content-Type": "application/json"}
+    rows = '{"location_id": "nan", "locations": [{"latitude": NaN, "longitude": -74.0, "value": 1}]}'
+    columns = '{"location_id": "nan", "latitude": [40.7], "longitude": [-74.0], "value": [Infinity]}'
+    assert client.post("/api/v1/generate-heatmap", content=rows, headers=headers).status_code == 400
+    assert client.post("/api/v1/generate-heatmap/columnar", content=columns, headers=headers).status_code == 400
+    assert client.get("/api/v1/heatmap/nan", params={"bbox": "40,-75,41,-73"}).status_code == 404
+
+
+def test_batch_endpoint_hashes_off_the_event_loop(client, monkeypatch):
+    """Batch items are hashed and serialized on worker threads, for cache hits as well as misses."""
+    import heatmap_orchestrator
+
+    threads = []
+    digest = heatmap_orchestrator.digest_points
+    monkeypatch.setattr(heatmap_orchestrator, "digest_points",
+                        lambda points: threads.append(threading.current_thread().name) or digest(points))
+    batches = [{"location_id": "batch_api", "locations": POINTS}, {"location_id": "batch_api", "locations": []}]
+    first = client.post("/api/v1/batch-process", json=batches).json()
+    second = client.post("/api/v1/batch-process", json=batches).json()
+    assert first["batch_count"] == 2 and first["failed_count"] == 0
+    assert second["results"][0] == first["results"][0]
+    assert threads and all(name.startswith("heatmap-") for name in threads)
+
+
+def test_columnar_endpoint(client):
+    """The columnar route matches the row route and rejects ragged columns."""
+    columns = {key: [p[key] for p in POINTS] for key in ("latitude", "longitude", "value", "category")}
+    rows = client.post("/api/v1/generate-heatmap", json={"location_id": "rows", "locations": POINTS}).json()
+    arrays = client.post("/api/v1/generate-heatmap/columnar", json={"location_id": "arrays", **columns}).json()
+    assert arrays["data"]["grid"] == rows["data"]["grid"]
+    assert arrays["data"]["summary"] == rows["data"]["summary"]
+
+    ragged = {**columns, "value": columns["value"][:2]}
+    assert client.post("/api/v1/generate-heatmap/columnar", json=ragged).status_code == 400
+
+
+def test_invalidate_endpoint_forces_regeneration(client):
+    """Invalidating a location bumps its version so the next upload is recomputed."""
+    request = {"location_id": "invalidated", "locations": [{"latitude": 40.7128, "longitude": -74.0060, "value": 1}]}
+    first = client.post("/api/v1/generate-heatmap", json=request).json()["data"]
+    assert client.post("/api/v1/generate-heatmap", json=request).json()["data"] == first
+
+    invalidated = client.post("/api/v1/locations/invalidated/invalidate").json()
+    assert invalidated["success"] is True and invalidated["version"] == 1
+    assert client.post("/api/v1/generate-heatmap", json=request).json()["data"]["timestamp"] != first["timestamp"]
+
+
+def test_batch_endpoint_reports_invalid_items_individually(client):
+    """A batch item with malformed points fails on its own; the others still generate."""
+    bad = {"location_id": "bad_batch", "locations": [
+        {"latitude": 40.7, "longitude": -74.0, "value": 1, "timestamp": "soon"},
+    ]}
+    batches = [bad, {"location_id": "good_batch", "locations": POINTS}, bad]
+    response = client.post("/api/v1/batch-process", json=batches)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["failed_count"] == 2
+    assert [result.get("index") for result in body["results"]] == [0, None, 2]
+    assert body["results"][0]["location_id"] == "bad_batch" and "error" in body["results"][0]
+    assert body["results"][1]["summary"]["total_points"] == 3
+
+    assert client.post("/api/v1/batch-process", json=batches[:1]).json()["failed_count"] == 1
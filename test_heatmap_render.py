@@ -0,0 +1,87 @@
+"""Test suite for colorized image rendering."""
+
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from heatmap_orchestrator import HeatmapConfig
+from heatmap_render import COLORMAPS, ENCODERS, colorize, encode_png, render_image
+
+
+def _decode_png(data):
+    """Minimal reader for the unfiltered RGBA PNGs encode_png writes."""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, idat = 8, b""
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos:pos + 4])
+        kind, body = data[pos + 4:pos + 8], data[pos + 8:pos + 8 + length]
+        if kind == b"IHDR":
+            width, height = struct.unpack(">II", body[:8])
+        elif kind == b"IDAT":
+            idat += body
+        pos += 12 + length
+    rows = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, width * 4 + 1)
+    return rows[:, 1:].reshape(height, width, 4)
+
+
+def test_luts_span_each_colormap():
+    """Every LUT has 256 RGBA entries, transparent at zero and opaque at the peak."""
+    for lut in COLORMAPS.values():
+        assert lut.shape == (256, 4)
+        assert lut[0, 3] == 0 and lut[-1, 3] == 255
+    assert tuple(COLORMAPS["hot"][-1, :3]) == (255, 255, 255)
+    assert tuple(COLORMAPS["viridis"][0, :3]) == (68, 1, 84)
+
+
+def test_png_round_trip():
+    """The PNG encoder stores exactly the colorized pixels."""
+    intensity = np.linspace(0.0, 1.0, 12 * 7, dtype=np.float32).reshape(12, 7)
+    rgba = colorize(intensity, "viridis")
+    assert rgba.shape == (12, 7, 4)
+    assert np.array_equal(_decode_png(encode_png(rgba)), rgba)
+    with pytest.raises(ValueError):
+        render_image(intensity, "rainbow")
+
+
+@pytest.mark.skipif("webp" not in ENCODERS, reason="Pillow not installed")
+def test_webp_encodes():
+    """WebP output carries the RIFF/WEBP signature."""
+    data = render_image(np.ones((8, 8)), "hot", "webp")
+    assert data[:4] == b"RIFF" and data[8:12] == b"WEBP"
+
+
+def test_orchestrator_grid_image_is_cached(make_orchestrator):
+    """Identical grids reuse one encoded image."""
+    orchestrator = make_orchestrator()
+    result = orchestrator.generate_heatmap([
+        {"latitude": 40.7128, "longitude": -74.0060, "value": 100},
+        {"latitude": 40.7580, "longitude": -73.9855, "value": 85},
+    ], "image")
+    image, digest = orchestrator.grid_image(result["grid"], "hot")
+    assert _decode_png(image).shape == (16, 16, 4)
+    assert orchestrator.grid_image(result["grid"], "hot") == (image, digest)
+    assert orchestrator.grid_image(result["grid"], "viridis")[0] != image
+    with pytest.raises(ValueError):
+        orchestrator.grid_image(None)
+
+
+def test_cache_ttls_follow_the_request_config(make_orchestrator, monkeypatch):
+    """Stored points and images expire with the config of the request that produced them."""
+    orchestrator = make_orchestrator()
+    ttls = {}
+    cache_result = orchestrator.persister.cache_result
+
+    def _recording(key, value, ttl=3600, local=True):
+        ttls[key.split("_", 1)[0]] = ttl
+        return cache_result(key, value, ttl, local)
+
+    monkeypatch.setattr(orchestrator.persister, "cache_result", _recording)
+    config = HeatmapConfig(grid_resolution=16, blur_radius=2, cache_ttl=60, stale_ttl=30)
+    result = orchestrator.generate_heatmap([
+        {"latitude": 40.7128, "longitude": -74.0060, "value": 100},
+    ], "ttl", config)
+    orchestrator.grid_image(result["grid"], "hot", "png", result["config"]["cache_ttl"])
+    assert ttls["points"] == 90
+    assert ttls["image"] == 60
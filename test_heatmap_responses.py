@@ -0,0 +1,91 @@
+"""Test suite for negotiated response encoding."""
+
+import gzip
+import json
+
+import msgpack
+import numpy as np
+
+from heatmap_responses import (
+    GRID, JSON, MSGPACK, choose_encoding, compress, decode_grid, dumps_json, dumps_msgpack, encode_grid, negotiate
+)
+
+OFFERED = [JSON, MSGPACK, GRID, "image/png"]
+
+GRID_DICT = {
+    "width": 3,
+    "height": 2,
+    "bounds": {"south": 40.0, "west": -74.0, "north": 41.0, "east": -73.0},
+    "max_intensity": 2.5,
+    "intensity": np.arange(6, dtype=np.float32).reshape(2, 3) / 5,
+}
+
+
+def test_negotiate_honours_quality_and_specificity():
+    """The highest q wins, exact types beat wildcards and unknown types are refused."""
+    assert negotiate(None, OFFERED) == JSON
+    assert negotiate("*/*", OFFERED) == JSON
+    assert negotiate("application/x-msgpack", OFFERED) == MSGPACK
+    assert negotiate("application/json;q=0.5, application/x-heatmap-grid", OFFERED) == GRID
+    assert negotiate("image/*, application/json;q=0.1", OFFERED) == "image/png"
+    assert negotiate("*/*;q=0.1, application/json;q=0", OFFERED) == MSGPACK
+    assert negotiate("text/html", OFFERED) is None
+
+
+def test_grid_blob_round_trip():
+    """The grid blob is a fixed header plus raw float32 cells."""
+    body = encode_grid(GRID_DICT)
+    intensity, meta = decode_grid(body)
+    assert len(body) == 56 + 6 * 4
+    assert np.array_equal(intensity, GRID_DICT["intensity"])
+    assert meta["bounds"] == GRID_DICT["bounds"] and meta["max_intensity"] == 2.5
+
+
+def test_json_and_msgpack_bodies():
+    """JSON rounds float arrays; msgpack carries them as float32 bytes."""
+    decoded = json.loads(dumps_json({"grid": GRID_DICT}))
+    assert decoded["grid"]["intensity"][1] == [0.6, 0.8, 1.0]
+    unpacked = msgpack.unpackb(dumps_msgpack({"grid": GRID_DICT}))
+    assert np.array_equal(np.frombuffer(unpacked["grid"]["intensity"], dtype="<f4"), GRID_DICT["intensity"].ravel())
+
+
+def test_compression_follows_accept_encoding():
+    """Large bodies are gzipped when accepted; small ones are left alone."""
+    assert choose_encoding(None) is None
+    assert choose_encoding("gzip;q=0") is None
+    encoding = choose_encoding("gzip, deflate")
+    assert encoding == "gzip"
+    body = b"x" * 5000
+    compressed, coding = compress(body, encoding)
+    assert coding == "gzip" and gzip.decompress(compressed) == body
+    assert compress(b"tiny", encoding) == (b"tiny", None)
+
+
+def test_generate_endpoint_negotiates_the_body(client):
+    """Accept and output pick the body format; unservable requests get 406 or 400."""
+    request = {"location_id": "negotiated", "blur_radius": 2, "locations": [
+        {"latitude": 40.7128, "longitude": -74.0060, "value": 100},
+        {"latitude": 40.7580, "longitude": -73.9855, "value": 85},
+    ]}
+    url = "/api/v1/generate-heatmap"
+
+    packed = client.post(url, json=request, headers={"Accept": "application/x-msgpack"})
+    assert packed.headers["content-type"] == MSGPACK
+    assert msgpack.unpackb(packed.content)["data"]["location_id"] == "negotiated"
+
+    grid = client.post(url, json=request, headers={"Accept": GRID})
+    intensity, _ = decode_grid(grid.content)
+    assert intensity.shape == (128, 128)
+
+    image = client.post(url, json={**request, "output": "png"}, headers={"Accept": GRID})
+    assert image.headers["content-type"] == "image/png"
+    assert image.headers["cache-control"] == "public, max-age=3600"
+    assert image.headers["etag"]
+
+    plain = client.post(url, json=request, headers={"Accept-Encoding": "gzip"})
+    assert plain.headers["vary"] == "Accept, Accept-Encoding"
+    assert plain.json()["data"]["summary"]["total_points"] == 2
+
+    assert client.post(url, json=request, headers={"Accept": "text/csv"}).status_code == 406
+    assert client.post(url, json={**request, "output": "bmp"}).status_code == 400
+    assert client.post(url, json={**request, "color_scheme": "neon"}).status_code == 400
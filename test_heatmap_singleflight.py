@@ -0,0 +1,149 @@
+"""Test suite for request coalescing and stale-while-revalidate."""
+
+import threading
+import time
+
+import pytest
+
+from benchmark_heatmap import InMemoryRedis
+from heatmap_orchestrator import LocationColumns, digest_points
+from heatmap_singleflight import SingleFlight
+
+POINTS = [
+    {"latitude": 40.7128, "longitude": -74.0060, "value": 100},
+    {"latitude": 40.7580, "longitude": -73.9855, "value": 85},
+]
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_concurrent_calls_share_one_execution():
+    """Callers that arrive while the leader runs get its result without running fn."""
+    flights = SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        _wait_until(lambda: flights.stats()["coalesced"] == 7)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("k", compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["result"] * 8 and len(calls) == 1
+    assert flights.stats() == {"in_flight": 0, "coalesced": 7}
+
+
+def test_errors_reach_every_waiter_and_are_not_remembered():
+    """A failing call raises for all its callers; the next call runs afresh."""
+    flights = SingleFlight()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flights.do("k", fail)
+    assert flights.do("k", lambda: 2) == 2
+
+
+def test_identical_heatmap_misses_generate_once(make_orchestrator):
+    """Concurrent identical requests render one heatmap and return the same object."""
+    orchestrator = make_orchestrator()
+    renders = []
+    original = orchestrator._render
+
+    def slow_render(*args):
+        renders.append(1)
+        _wait_until(lambda: orchestrator._flights.stats()["coalesced"] == 3)
+        return original(*args)
+
+    orchestrator._render = slow_render
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(orchestrator.generate_heatmap(POINTS, "herd")))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(renders) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_stale_result_is_served_while_refreshing(make_orchestrator):
+    """Past cache_ttl the old result is returned at once and replaced in the background."""
+    orchestrator = make_orchestrator(stale_ttl=60)
+    first = orchestrator.generate_heatmap(POINTS, "swr")
+    points_digest = digest_points(LocationColumns.from_records(POINTS))
+    fresh_key = "fresh_" + orchestrator._heatmap_key("swr", 0, points_digest, orchestrator.config)
+    orchestrator.persister.delete(fresh_key)
+
+    assert orchestrator.generate_heatmap(POINTS, "swr") is first
+    _wait_until(lambda: orchestrator.persister.get_cached(fresh_key) is not None)
+    assert orchestrator.generate_heatmap(POINTS, "swr") is not first
+
+
+def test_lease_is_exclusive_across_replicas(make_orchestrator):
+    """Only one holder gets the lease; release lets the next one in, and no Redis means no coordination."""
+    fakeredis = pytest.importorskip("fakeredis")
+    orchestrator = make_orchestrator()
+    persister = orchestrator.persister
+    assert persister.try_lease("lease_k", 5) == ""
+
+    persister.redis_client = fakeredis.FakeRedis()
+    persister.breaker.run_probe()
+    token = persister.try_lease("lease_k", 5)
+    assert token and persister.try_lease("lease_k", 5) is None
+    persister.release_lease("lease_k", "someone-else")
+    assert persister.try_lease("lease_k", 5) is None
+    persister.release_lease("lease_k", token)
+    assert persister.try_lease("lease_k", 5)
+
+
+def _replicas(make_orchestrator, **options):
+    """Two orchestrators sharing one in-memory Redis, like two API replicas."""
+    shared = InMemoryRedis()
+    replicas = [make_orchestrator(**options) for _ in range(2)]
+    for orchestrator in replicas:
+        orchestrator.persister.redis_client = shared
+        orchestrator.persister.breaker.run_probe()
+    key = replicas[0]._heatmap_key("leased", 0, digest_points(LocationColumns.from_records(POINTS)), replicas[0].config)
+    return replicas, key
+
+
+def test_lease_wait_is_bounded(make_orchestrator):
+    """A replica whose leader never publishes computes the result itself after lease_wait."""
+    (leader, waiter), key = _replicas(make_orchestrator)
+    waiter.lease_wait = 0.3
+    assert leader.persister.try_lease(f"lease_{key}", 30)
+
+    started = time.monotonic()
+    assert waiter.generate_heatmap(POINTS, "leased")["summary"]["total_points"] == 2
+    assert 0.3 <= time.monotonic() - started < 2
+
+
+def test_leader_failure_releases_waiters(make_orchestrator, monkeypatch):
+    """A failing leader publishes a marker, so waiters stop polling and compute themselves."""
+    (leader, waiter), key = _replicas(make_orchestrator)
+    token = leader.persister.try_lease(f"lease_{key}", 30)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(waiter.generate_heatmap(POINTS, "leased")))
+    started = time.monotonic()
+    thread.start()
+
+    time.sleep(0.2)
+    leader.persister.release_lease(f"lease_{key}", token)
+    monkeypatch.setattr(leader.scorer, "score_batch", lambda points: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        leader.generate_heatmap(POINTS, "leased")
+    thread.join(5)
+
+    assert results and results[0]["summary"]["total_points"] == 2
+    assert time.monotonic() - started < waiter.lease_wait
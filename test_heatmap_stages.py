@@ -0,0 +1,64 @@
+"""Test suite for pipeline stage timing and profiling hooks."""
+
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from heatmap_executor import GenerationExecutor
+from heatmap_stages import (
+    SamplingProfiler, ServerTimingMiddleware, add_stage_hook, collect_timings, remove_stage_hook,
+    server_timing, stage, timed
+)
+
+
+@timed("decorated")
+def _work(value):
+    with stage("inner"):
+        return value * 2
+
+
+def test_timings_follow_jobs_into_the_executor():
+    """Stages run on executor threads are recorded against the request that queued them."""
+    executor = GenerationExecutor(max_concurrency=2)
+
+    async def _request():
+        with collect_timings() as timings:
+            assert await executor.run(_work, 21) == 42
+            return timings
+
+    timings = asyncio.run(_request())
+    assert [name for name, _ in timings] == ["inner", "decorated"]
+    assert all(seconds >= 0 for _, seconds in timings)
+    executor.shutdown()
+
+
+def test_server_timing_sums_repeated_stages():
+    """Repeated stages collapse into one entry, in milliseconds."""
+    assert server_timing([("score", 0.001), ("render", 0.002), ("score", 0.003)], total=0.01) == (
+        "score;dur=4.000, render;dur=2.000, total;dur=10.000"
+    )
+
+
+def test_middleware_adds_server_timing_header():
+    """Every HTTP response lists the stages its request ran."""
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware)
+
+    @app.get("/timed")
+    def endpoint():
+        return {"value": _work(1)}
+
+    header = TestClient(app).get("/timed").headers["server-timing"]
+    assert header.startswith("inner;dur=") and "decorated;dur=" in header and "total;dur=" in header
+
+
+def test_sampling_profiler_dumps_profiles(tmp_path):
+    """With a sample rate of one, each selected stage leaves a .prof file."""
+    profiler = SamplingProfiler(sample_rate=1.0, output_dir=str(tmp_path), stages=["decorated"])
+    add_stage_hook(profiler)
+    try:
+        _work(3)
+    finally:
+        remove_stage_hook(profiler)
+    assert [p.name.split("-")[0] for p in tmp_path.iterdir()] == ["decorated"]
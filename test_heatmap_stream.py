@@ -0,0 +1,86 @@
+"""Test suite for streamed point ingestion."""
+
+import asyncio
+import json
+
+import numpy as np
+
+from heatmap_grid import GridAccumulator, rasterize
+from heatmap_orchestrator import ScoreItemsStep
+from heatmap_stream import BINARY_RECORD, StreamIngestor
+
+BOUNDS = (40.0, -75.0, 41.0, -73.0)
+POINTS = [(40.71, -74.00, 100.0), (40.75, -73.98, 85.0), (40.74, -73.96, 90.0), (42.0, -74.0, 5.0)]
+
+
+async def _chunks(data: bytes, size: int = 7):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def _run(fn, *args):
+    return fn(*args)
+
+
+def _ingest(fmt: str, data: bytes) -> GridAccumulator:
+    ingestor = StreamIngestor(fmt, GridAccumulator(BOUNDS, 16), ScoreItemsStep())
+    return asyncio.run(ingestor.feed(_chunks(data), _run))
+
+
+def _expected_raw():
+    lat, lon, val = (np.array(column) for column in zip(*POINTS))
+    return rasterize(lat, lon, np.minimum(val, 100.0), BOUNDS, 16, 16)
+
+
+def test_ndjson_stream_matches_direct_rasterization(monkeypatch):
+    """Records split across arbitrary chunk boundaries are all ingested."""
+    monkeypatch.setattr("heatmap_stream.BLOCK_BYTES", 16)
+    data = "\n".join(json.dumps({"latitude": a, "longitude": b, "value": v}) for a, b, v in POINTS).encode()
+    accumulator = _ingest("ndjson", data)
+    assert np.allclose(accumulator.raw, _expected_raw())
+    assert accumulator.summary()["total_points"] == 4
+    assert accumulator.outside == 1
+
+
+def test_csv_stream_with_header(monkeypatch):
+    """CSV uploads map columns by header name."""
+    monkeypatch.setattr("heatmap_stream.BLOCK_BYTES", 16)
+    lines = ["value,latitude,longitude"] + [f"{v},{a},{b}" for a, b, v in POINTS]
+    accumulator = _ingest("csv", "\n".join(lines).encode())
+    assert np.allclose(accumulator.raw, _expected_raw())
+    assert accumulator.summary()["max_value"] == 100.0
+
+
+def test_binary_stream(monkeypatch):
+    """Binary uploads are whole float64 triples cut at record boundaries."""
+    monkeypatch.setattr("heatmap_stream.BLOCK_BYTES", 30)
+    data = np.array(POINTS, dtype=BINARY_RECORD).tobytes()
+    accumulator = _ingest("binary", data)
+    assert np.allclose(accumulator.raw, _expected_raw())
+    assert accumulator.summary()["avg_value"] == sum(v for _, _, v in POINTS) / 4
+
+
+def _stream(client, body, content_type="application/x-ndjson", **params):
+    return client.post("/api/v1/generate-heatmap/stream", content=body, headers={"Content-Type": content_type},
+                       params={"bbox": ",".join(map(str, BOUNDS)), **params})
+
+
+def test_stream_endpoint_accepts_ndjson_and_csv(client):
+    """Both text formats are folded into a grid over the requested bbox."""
+    ndjson = "\n".join(json.dumps({"latitude": a, "longitude": b, "value": v}) for a, b, v in POINTS)
+    summary = _stream(client, ndjson).json()["data"]["summary"]
+    assert summary["total_points"] == 4 and summary["outside_bounds"] == 1
+    csv = "latitude,longitude,value\n" + "\n".join(f"{a},{b},{v}" for a, b, v in POINTS)
+    assert _stream(client, csv, "text/csv").json()["data"]["summary"]["outside_bounds"] == 1
+
+
+def test_stream_endpoint_rejects_malformed_input(client):
+    """Malformed uploads are client errors, never 500s."""
+    assert _stream(client, "[1, 2]\n").status_code == 400
+    assert _stream(client, '{"latitude": null, "longitude": -74.0, "value": 1}\n').status_code == 400
+    assert _stream(client, '{"latitude": 40.7, "value": 1}\n').status_code == 400
+    assert _stream(client, "{not json\n").status_code == 400
+    assert _stream(client, "40.7,-74.0,inf\n", "text/csv").status_code == 400
+    assert _stream(client, b"\x00" * 7, "application/octet-stream").status_code == 400
+    assert _stream(client, "", "text/plain").status_code == 415
+    assert _stream(client, "", bbox="1,2,3").status_code == 400
@@ -0,0 +1,148 @@
+"""Test suite for the slippy-map tile pyramid."""
+
+import numpy as np
+import pytest
+
+import heatmap_orchestrator
+from heatmap_tiles import TilePyramid, project, tile_bounds
+
+
+def _pyramid(lat, lon, weights, leaf_points, store=None):
+    store = {} if store is None else store
+
+    def get_many(keys):
+        return {key: store[key] for key in keys if key in store}
+
+    def cache_many(items):
+        store.update(items)
+        return True
+
+    return TilePyramid(lat, lon, weights, max_zoom=18, get_many=get_many,
+                       cache_many=cache_many, key_prefix="t", leaf_points=leaf_points), store
+
+
+def test_tile_bounds_round_trip():
+    """A point projects into the tile whose bounds contain it."""
+    u, v = project(np.array([40.7128]), np.array([-74.0060]))
+    z = 12
+    x, y = int(u[0] * 2 ** z), int(v[0] * 2 ** z)
+    south, west, north, east = tile_bounds(z, x, y)
+    assert south < 40.7128 <= north
+    assert west <= -74.0060 < east
+
+
+def test_downsampled_tiles_match_direct_binning():
+    """Building a tile from its children equals binning the points directly."""
+    rng = np.random.default_rng(1)
+    lat = rng.normal(40.75, 0.01, 2000)
+    lon = rng.normal(-73.98, 0.01, 2000)
+    weights = rng.uniform(1, 10, 2000)
+    u, v = project(lat[:1], lon[:1])
+    z = 10
+    x, y = int(u[0] * 2 ** z), int(v[0] * 2 ** z)
+
+    direct, _ = _pyramid(lat, lon, weights, leaf_points=10 ** 9)
+    built, store = _pyramid(lat, lon, weights, leaf_points=100)
+    assert np.allclose(direct.raw_tile(z, x, y), built.raw_tile(z, x, y))
+    assert any(key.startswith(f"t_{z + 1}_") for key in store)
+
+
+def test_render_tile_uses_neighbour_margin():
+    """Kernel spill-over from a point just across the tile edge is visible."""
+    z, x, y = 14, 4823, 6160
+    south, west, north, east = tile_bounds(z, x, y)
+    lat = np.array([(south + north) / 2])
+    lon = np.array([east + (east - west) / 128])
+    pyramid, _ = _pyramid(lat, lon, np.ones(1), leaf_points=100)
+    tile = pyramid.render_tile(z, x, y, blur_radius=10)
+    assert tile.intensity[:, -1].sum() > 0
+    assert tile.intensity[:, 0].sum() == 0
+
+
+def test_render_tile_reads_neighbours_in_one_call():
+    """The nine rasters around a tile are fetched with a single bulk read once cached."""
+    rng = np.random.default_rng(2)
+    lat, lon, weights = rng.normal(40.75, 0.5, 500), rng.normal(-73.98, 0.5, 500), np.ones(500)
+    pyramid, store = _pyramid(lat, lon, weights, leaf_points=100)
+    pyramid.render_tile(3, 2, 3, blur_radius=10)
+    calls = []
+    cached = TilePyramid(lat, lon, weights, max_zoom=18, key_prefix="t",
+                         get_many=lambda keys: calls.append(keys) or {k: store[k] for k in keys if k in store},
+                         cache_many=lambda items: False)
+    cached.render_tile(3, 2, 3, blur_radius=10)
+    assert len(calls) == 1 and len(calls[0]) == 9
+
+
+def test_orchestrator_tile_after_generate(make_orchestrator):
+    """Tiles render from the points stored by generate_heatmap."""
+    orchestrator = make_orchestrator(blur_radius=5)
+    orchestrator.generate_heatmap([
+        {"latitude": 40.7128, "longitude": -74.0060, "value": 100},
+        {"latitude": 40.7580, "longitude": -73.9855, "value": 85},
+    ], "tile_test")
+    tile = orchestrator.generate_tile("tile_test", 0, 0, 0)
+    assert tile["grid"]["width"] == 256
+    assert tile["grid"]["max_intensity"] > 0
+    assert orchestrator.generate_tile("tile_test", 0, 0, 0) is tile
+    assert orchestrator.generate_tile("missing", 0, 0, 0) is None
+
+
+def test_deep_tile_projects_only_nearby_points(make_orchestrator, monkeypatch):
+    """The spatial index limits a tile to the points around it, without changing the render."""
+    rng = np.random.default_rng(3)
+    lat = np.concatenate([rng.normal(40.73, 0.01, 500), rng.uniform(-60.0, 60.0, 500)])
+    lon = np.concatenate([rng.normal(-73.98, 0.01, 500), rng.uniform(-170.0, 170.0, 500)])
+    orchestrator = make_orchestrator(blur_radius=5)
+    orchestrator.generate_heatmap([
+        {"latitude": a, "longitude": o, "value": 1.0} for a, o in zip(lat, lon)
+    ], "deep")
+
+    sizes = []
+    pyramid_class = heatmap_orchestrator.TilePyramid
+
+    def _recording(latitudes, *args, **kwargs):
+        sizes.append(len(latitudes))
+        return pyramid_class(latitudes, *args, **kwargs)
+
+    monkeypatch.setattr(heatmap_orchestrator, "TilePyramid", _recording)
+    u, v = project(np.array([40.73]), np.array([-73.98]))
+    z = 10
+    x, y = int(u[0] * 2 ** z), int(v[0] * 2 ** z)
+    tile = orchestrator.generate_tile("deep", z, x, y)
+    assert sizes[0] < 600 and tile["grid"]["max_intensity"] > 0
+
+    stored = orchestrator.persister.get_cached("points_deep")
+    full, _ = _pyramid(stored["latitude"], stored["longitude"], stored["weight"], leaf_points=64)
+    expected = full.render_tile(z, x, y, 5)
+    assert np.allclose(tile["grid"]["intensity"], expected.normalized(), atol=1e-6)
+
+
+def test_tiles_share_one_scale_per_zoom(make_orchestrator):
+    """A tile with one light point renders fainter than the dense tile next to it."""
+    rng = np.random.default_rng(5)
+    dense = [{"latitude": float(a), "longitude": float(o), "value": 10.0}
+             for a, o in zip(rng.normal(40.73, 0.001, 300), rng.normal(-73.98, 0.001, 300))]
+    orchestrator = make_orchestrator(blur_radius=5)
+    orchestrator.generate_heatmap(dense + [{"latitude": -33.87, "longitude": 151.21, "value": 1.0}], "scaled")
+
+    z = 8
+    tiles = []
+    for lat, lon in ((40.73, -73.98), (-33.87, 151.21)):
+        u, v = project(np.array([lat]), np.array([lon]))
+        tiles.append(orchestrator.generate_tile("scaled", z, int(u[0] * 2 ** z), int(v[0] * 2 ** z))["grid"])
+    assert np.max(tiles[0]["intensity"]) == pytest.approx(1.0)
+    assert 0 < np.max(tiles[1]["intensity"]) < 0.1
+
+
+def test_tile_endpoint(client):
+    """Tiles are served as JSON or PNG after an upload; bad coordinates and unknown locations are rejected."""
+    client.post("/api/v1/generate-heatmap", json={"location_id": "tile_api", "locations": [
+        {"latitude": 40.7128, "longitude": -74.0060, "value": 100},
+        {"latitude": 40.7580, "longitude": -73.9855, "value": 85},
+    ]}).raise_for_status()
+    tile = client.get("/api/v1/tiles/tile_api/0/0/0").json()["data"]
+    assert (tile["z"], tile["x"], tile["y"]) == (0, 0, 0) and tile["grid"]["width"] == 256
+    image = client.get("/api/v1/tiles/tile_api/0/0/0", params={"output": "png"})
+    assert image.headers["content-type"] == "image/png" and image.headers["etag"]
+    assert client.get("/api/v1/tiles/tile_api/0/5/0").status_code == 400
+    assert client.get("/api/v1/tiles/missing/0/0/0").status_code == 404
@@ -0,0 +1,144 @@
+"""Test suite for time-windowed heatmaps."""
+
+import numpy as np
+import pytest
+
+from heatmap_grid import rasterize
+from heatmap_windows import HOUR, MINUTE, WindowedGrid
+
+BOUNDS = (40.0, -74.0, 41.0, -73.0)
+NOW = 1_700_000_000.0
+
+
+def _points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(40.0, 41.0, n), rng.uniform(-74.0, -73.0, n), rng.uniform(0.5, 2.0, n)
+
+
+def test_window_sums_only_recent_buckets():
+    """A 15 minute window matches rasterizing just the points from those minutes."""
+    lat, lon, w = _points(600)
+    ages = np.repeat(np.arange(60) * MINUTE + 5.0, 10)
+    windows = WindowedGrid(BOUNDS, 16)
+    windows.add(lat, lon, w, NOW - ages)
+
+    grid, summary = windows.render(15 * MINUTE, blur_radius=0, now=NOW)
+    recent = ages < 15 * MINUTE
+    assert summary["total_points"] == 150
+    assert summary["bucket_seconds"] == MINUTE
+    assert np.allclose(grid.intensity, rasterize(lat[recent], lon[recent], w[recent], BOUNDS, 16, 16), atol=1e-4)
+
+
+def test_long_windows_use_hour_buckets_with_decay():
+    """A 24 hour window sums hour buckets, each weighted by its age."""
+    windows = WindowedGrid(BOUNDS, 8)
+    lat, lon = np.array([40.5, 40.5]), np.array([-73.5, -73.5])
+    windows.add(lat, lon, np.ones(2), np.array([NOW - 10 * HOUR, NOW - 30 * HOUR]))
+
+    plain, summary = windows.render(24 * HOUR, blur_radius=0, now=NOW)
+    assert summary["bucket_seconds"] == HOUR and summary["total_points"] == 1
+    assert plain.intensity.sum() == pytest.approx(1.0)
+
+    decayed, _ = windows.render(24 * HOUR, blur_radius=0, now=NOW, half_life_seconds=10 * HOUR)
+    assert 0.4 < decayed.intensity.sum() < 0.6
+
+    with pytest.raises(ValueError):
+        windows.render(30 * 24 * HOUR, blur_radius=0, now=NOW)
+
+
+def test_ring_recycles_expired_slots():
+    """Buckets older than the ring span are overwritten, keeping memory bounded."""
+    windows = WindowedGrid(BOUNDS, 8, tiers=((MINUTE, 4),))
+    lat, lon = np.array([40.5]), np.array([-73.5])
+    for minute in range(10):
+        windows.add(lat, lon, np.ones(1), np.array([NOW + minute * MINUTE]))
+    restored = WindowedGrid.from_state(windows.to_state())
+    assert len(restored.rings[0].grids) == 4
+    _, summary = restored.render(4 * MINUTE, blur_radius=0, now=NOW + 9 * MINUTE)
+    assert summary["total_points"] == 4
+
+
+def test_orchestrator_windowed_heatmap(make_orchestrator):
+    """Appended points feed the windows; untimed points count as arriving now."""
+    orchestrator = make_orchestrator()
+    assert orchestrator.windowed_heatmap("timed", MINUTE) is None
+
+    orchestrator.append_points([
+        {"latitude": 40.71, "longitude": -74.00, "value": 10, "timestamp": NOW - 2 * HOUR},
+        {"latitude": 40.75, "longitude": -73.98, "value": 20},
+    ], "timed", bounds=BOUNDS)
+    recent = orchestrator.windowed_heatmap("timed", 15 * MINUTE)
+    assert recent["summary"]["total_points"] == 1
+    assert recent["summary"]["max_value"] == 20
+    assert recent["grid"]["width"] == 16
+
+
+def test_append_rewrites_only_the_touched_buckets(make_orchestrator):
+    """Each append writes the ring header plus one grid per ring, not the whole history."""
+    orchestrator = make_orchestrator()
+    for minute in range(5):
+        orchestrator.append_points([
+            {"latitude": 40.71, "longitude": -73.90, "value": 1, "timestamp": NOW - minute * MINUTE},
+        ], "timed", bounds=BOUNDS)
+
+    writes = []
+    cache_many = orchestrator.persister.cache_many
+    orchestrator.persister.cache_many = lambda items, ttl=3600: writes.append(sorted(items)) or cache_many(items, ttl)
+    orchestrator.append_points([
+        {"latitude": 40.75, "longitude": -73.98, "value": 2, "timestamp": NOW},
+    ], "timed", bounds=BOUNDS)
+
+    window_writes = [key for keys in writes for key in keys if key.startswith("window_timed_")]
+    assert len(window_writes) == 2
+    recent = orchestrator.windowed_heatmap("timed", 10 * MINUTE, now=NOW)
+    assert recent["summary"]["total_points"] == 6
+
+
+def test_expired_bucket_grids_are_dropped(make_orchestrator):
+    """A bucket whose grid key has gone is left out rather than failing the query."""
+    orchestrator = make_orchestrator()
+    orchestrator.append_points([
+        {"latitude": 40.71, "longitude": -74.00, "value": 1, "timestamp": NOW - 3 * MINUTE},
+        {"latitude": 40.75, "longitude": -73.98, "value": 2, "timestamp": NOW},
+    ], "timed", bounds=BOUNDS)
+    slot = int((NOW - 3 * MINUTE) // MINUTE) % 60
+    orchestrator.persister.memory_cache.delete(f"window_timed_{MINUTE}_{slot}")
+
+    recent = orchestrator.windowed_heatmap("timed", 10 * MINUTE, now=NOW)
+    assert recent["summary"]["total_points"] == 1
+
+
+def test_append_and_window_endpoints(client):
+    """Points appended over the API show up in the live and windowed renders."""
+    response = client.post("/api/v1/locations/live/points", json={"locations": [
+        {"latitude": 40.71, "longitude": -74.00, "value": 10, "timestamp": 1_000.0},
+        {"latitude": 40.75, "longitude": -73.98, "value": 20},
+    ], "blur_radius": 2, "bbox": "40,-74.1,41,-73"})
+    assert response.status_code == 200
+    assert response.json()["success"] is True
+
+    assert client.get("/api/v1/locations/live/heatmap").status_code == 200
+    windowed = client.get("/api/v1/locations/live/heatmap", params={"window_seconds": 900, "half_life_seconds": 300})
+    assert windowed.status_code == 200
+    assert windowed.json()["data"]["summary"]["total_points"] == 1
+
+    assert client.get("/api/v1/locations/live/heatmap", params={"window_seconds": 0}).status_code == 400
+    assert client.get("/api/v1/locations/live/heatmap", params={"half_life_seconds": 60}).status_code == 400
+    assert client.get("/api/v1/locations/missing/heatmap").status_code == 404
+
+
+def test_future_timestamps_are_refused(make_orchestrator, client):
+    """Millisecond epochs would pin the rings in the future, so appends carrying them fail."""
+    orchestrator = make_orchestrator()
+    orchestrator.append_points([{"latitude": 40.5, "longitude": -73.5, "value": 1}], "future", bounds=BOUNDS)
+    with pytest.raises(ValueError, match="future"):
+        orchestrator.append_points([
+            {"latitude": 40.5, "longitude": -73.5, "value": 1, "timestamp": NOW * 1000},
+        ], "future")
+    orchestrator.append_points([{"latitude": 40.6, "longitude": -73.6, "value": 1}], "future")
+    assert orchestrator.windowed_heatmap("future", 15 * MINUTE)["summary"]["total_points"] == 2
+
+    response = client.post("/api/v1/locations/future_api/points", json={"bbox": "40,-74,41,-73", "locations": [
+        {"latitude": 40.5, "longitude": -73.5, "value": 1, "timestamp": NOW * 1000},
+    ]})
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+"""Test suite for the API server's per-worker lifecycle."""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_lifespan_builds_services_per_worker_and_drains_on_shutdown():
+    """Services exist only between startup and shutdown, and health reports draining."""
+    with TestClient(main.app) as client:
+        main.orchestrator.persister.redis_client = None
+        main.customer_limiter.redis_client = None
+        assert main.orchestrator.grid_workers >= 1
+        assert "heatmap_executor_pending" in client.get("/api/v1/metrics").text
+        assert client.get("/health").status_code == 200
+        main.draining = True
+        response = client.get("/health")
+        assert response.status_code == 503 and response.json()["status"] == "draining"
+        main.draining = False
+    assert main._collector is None
+    assert main.orchestrator._batch_executor is None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _health(url: str):
+    try:
+        return requests.get(url, timeout=1).status_code
+    except requests.ConnectionError:
+        return None
+
+
+def test_sigterm_fails_health_before_workers_stop(tmp_path):
+    """After SIGTERM every worker answers /health with 503 for the notice period, then the server exits cleanly."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    env = dict(os.environ, HEATMAP_DRAIN_NOTICE="2", WEB_CONCURRENCY="2", HEATMAP_GRID_WORKERS="1",
+               TMPDIR=str(tmp_path))
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while _health(url) != 200:
+            assert server.poll() is None and time.monotonic() < deadline
+            time.sleep(0.2)
+        server.send_signal(signal.SIGTERM)
+        statuses = []
+        while time.monotonic() < deadline and server.poll() is None:
+            statuses.append(_health(url))
+            time.sleep(0.1)
+        assert 503 in statuses
+        # Once one worker drains, none of them reports healthy again
+        assert 200 not in statuses[statuses.index(503):]
+        assert server.wait(timeout=30) == 0
+    finally:
+        server.kill()
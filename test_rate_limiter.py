@@ -0,0 +1,73 @@
+"""Test suite for the sliding-window rate limiter."""
+
+from heatmap_orchestrator import RateLimiter, tier_quotas
+from pricing import MONTH_SECONDS, PRICE_TIERS
+
+
+def test_buckets_are_per_key():
+    """One customer exhausting its quota does not affect another."""
+    limiter = RateLimiter(max_calls=3, window_seconds=3600)
+    assert all(limiter.check_limit("a") for _ in range(3))
+    assert not limiter.check_limit("a")
+    assert limiter.check_limit("b")
+    assert limiter.stats() == {"buckets": 2, "rejections": 1}
+
+
+def test_tier_quotas_follow_price_tiers():
+    """Tier limits come from requests_month over a billing-month window."""
+    limiter = RateLimiter(tier_limits=tier_quotas(PRICE_TIERS))
+    assert limiter.limits_for("starter") == (100, MONTH_SECONDS)
+    assert limiter.limits_for("enterprise") == (10000, MONTH_SECONDS)
+    assert limiter.limits_for(None) == (1000, 3600)
+    assert sum(limiter.check_limit("cust", "starter") for _ in range(150)) == 100
+
+
+def test_previous_window_counts_are_weighted(monkeypatch):
+    """Calls from the previous window still count in proportion to overlap."""
+    clock = [1000.0 * 10 + 999.0]
+    monkeypatch.setattr("heatmap_orchestrator.time.time", lambda: clock[0])
+    limiter = RateLimiter(max_calls=10, window_seconds=1000)
+    assert sum(limiter.check_limit("k") for _ in range(10)) == 10
+    clock[0] += 501.0  # halfway into the next window: 5 of the 10 still count
+    assert sum(limiter.check_limit("k") for _ in range(10)) == 5
+    clock[0] += 2000.0  # two windows later everything has aged out
+    assert sum(limiter.check_limit("k") for _ in range(20)) == 10
+
+
+def test_bucket_memory_is_bounded():
+    """Least recently seen keys are dropped past max_keys."""
+    limiter = RateLimiter(max_keys=10)
+    for i in range(100):
+        limiter.check_limit(f"key_{i}")
+    assert len(limiter.buckets) == 10
+
+
+def test_exhausted_bucket_is_a_429_on_generation_and_render_routes(client, monkeypatch):
+    """POST generations and GET renders draw on the same per-customer bucket."""
+    import main
+
+    monkeypatch.setattr(main.customer_limiter, "max_calls", 4)
+    body = {"location_id": "limited", "locations": [{"latitude": 40.7128, "longitude": -74.0060, "value": 100}]}
+    assert client.post("/api/v1/generate-heatmap", json=body).status_code == 200
+    assert client.get("/api/v1/tiles/limited/0/0/0").status_code == 200
+    assert client.get("/api/v1/heatmap/limited", params={"bbox": "40,-75,41,-73"}).status_code == 200
+    assert client.get("/api/v1/locations/limited/heatmap").status_code == 404
+    for path in ("/api/v1/tiles/limited/0/0/0", "/api/v1/locations/limited/heatmap"):
+        response = client.get(path)
+        assert response.status_code == 429 and response.headers["retry-after"]
+    assert client.post("/api/v1/generate-heatmap", json=body).status_code == 429
+
+
+def test_unknown_api_keys_share_the_client_bucket(client, monkeypatch):
+    """Made-up keys fall back to the IP bucket; only configured keys get their own."""
+    import main
+
+    monkeypatch.setattr(main.customer_limiter, "max_calls", 2)
+    monkeypatch.setitem(main.API_KEY_TIERS, "known-key", "pro")
+    statuses = [
+        client.get("/api/v1/locations/x/heatmap", headers={"X-API-Key": f"random-{i}"}).status_code
+        for i in range(6)
+    ]
+    assert statuses.count(429) == 4
+    known = client.get("/api/v1/locations/x/heatmap", headers={"Authorization": "Bearer known-key"})
+    assert known.status_code == 404